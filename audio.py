@@ -5,6 +5,8 @@ from pathlib import Path
 from typing import List, Tuple, Optional
 import shutil
 
+from fragmentador_carpetas import carpetas_de_fragmentos, listar_archivos_carpeta
+
 #Libre de peso solo una funcion para poder verificar si ffmpeg esta instalado
 
 logger = logging.getLogger(__name__)
@@ -77,9 +79,10 @@ def obtener_comando_ffmpeg():
     
     return 'ffmpeg'  # Fallback
 
-def es_archivo_video_simple(ruta_archivo: str) -> bool:
+def es_archivo_video_simple(ruta_archivo: str, tamanio: Optional[int] = None) -> bool:
     """
     Detecta videos por extensión y tamaño (método de respaldo).
+    Si ya se conoce el tamaño en bytes (`tamanio`) no se vuelve a consultar.
     """
     try:
         # Extensiones de video comunes
@@ -90,7 +93,7 @@ def es_archivo_video_simple(ruta_archivo: str) -> bool:
         }
         
         extension = Path(ruta_archivo).suffix.lower()
-        tamaño_mb = os.path.getsize(ruta_archivo) / (1024 * 1024)
+        tamaño_mb = (tamanio if tamanio is not None else os.path.getsize(ruta_archivo)) / (1024 * 1024)
         
         # Si tiene extensión de video
         if extension in extensiones_video:
@@ -107,9 +110,11 @@ def es_archivo_video_simple(ruta_archivo: str) -> bool:
     except Exception:
         return False
 
-def obtener_todos_archivos_multimedia(directorio: str) -> List[str]:
+def obtener_todos_archivos_multimedia(directorio: str, catalogo=None) -> List[str]:
     """
     Encuentra archivos multimedia con múltiples métodos.
+    Con `catalogo` (CatalogoArchivos) los archivos y sus tamaños se toman del catálogo compartido.
+    Si la carpeta está fragmentada también se buscan en sus fragmentos.
     """
     videos_encontrados = []
     
@@ -121,8 +126,14 @@ def obtener_todos_archivos_multimedia(directorio: str) -> List[str]:
             print(f"ERROR: Directorio no existe: {directorio}")
             return []
         
-        # Obtener archivos
-        archivos = os.listdir(directorio)
+        # Obtener archivos (con el catálogo, solo archivos y ya con su tamaño)
+        tamanios_catalogo = None
+        if catalogo is not None:
+            raiz = os.path.abspath(directorio)
+            tamanios_catalogo = {os.path.relpath(entrada.ruta, raiz): entrada.tamanio
+                                 for carpeta in [directorio, *carpetas_de_fragmentos(directorio)]
+                                 for entrada in catalogo.listar(carpeta, recursivo=False)}
+        archivos = list(tamanios_catalogo) if tamanios_catalogo is not None else listar_archivos_carpeta(directorio)
         print(f"Total de archivos: {len(archivos)}")
         
         # Verificar FFmpeg
@@ -132,8 +143,9 @@ def obtener_todos_archivos_multimedia(directorio: str) -> List[str]:
         for archivo in archivos:
             ruta_completa = os.path.join(directorio, archivo)
             
-            if os.path.isfile(ruta_completa):
-                tamaño_mb = os.path.getsize(ruta_completa) / (1024 * 1024)
+            if tamanios_catalogo is not None or os.path.isfile(ruta_completa):
+                tamaño = tamanios_catalogo[archivo] if tamanios_catalogo is not None else os.path.getsize(ruta_completa)
+                tamaño_mb = tamaño / (1024 * 1024)
                 extension = Path(archivo).suffix.lower()
                 
                 print(f"\nANALIZANDO: {archivo}")
@@ -143,7 +155,7 @@ def obtener_todos_archivos_multimedia(directorio: str) -> List[str]:
                 es_video = False
                 
                 # Método 1: Detección simple por extensión/tamaño
-                if es_archivo_video_simple(ruta_completa):
+                if es_archivo_video_simple(ruta_completa, tamaño):
                     print("   DETECTADO como video (metodo simple)")
                     es_video = True
                 
@@ -169,7 +181,7 @@ def obtener_todos_archivos_multimedia(directorio: str) -> List[str]:
                     except Exception as e:
                         print(f"   Error con FFmpeg: {e}")
                         # Fallback al método simple
-                        if es_archivo_video_simple(ruta_completa):
+                        if es_archivo_video_simple(ruta_completa, tamaño):
                             print("   DETECTADO como video (metodo simple - fallback)")
                             es_video = True
                 
@@ -268,9 +280,11 @@ def extraer_audio_individual(ruta_video: str, ruta_audio: str, formato_audio: st
 
 def extraer_audio_videos(directorio_origen: str, directorio_destino: str, 
                         formato_audio: str = 'mp3', calidad: str = '192k',
-                        callback_progreso: Optional[callable] = None) -> int:
+                        callback_progreso: Optional[callable] = None, catalogo=None) -> int:
     """
     Extrae audio con manejo robusto de errores.
+    Con `catalogo` (CatalogoArchivos) los videos se buscan en el catálogo compartido y los audios
+    extraídos se añaden a él.
     """
     print(f"\nINICIANDO EXTRACCION")
     print(f"Origen: {directorio_origen}")
@@ -278,7 +292,7 @@ def extraer_audio_videos(directorio_origen: str, directorio_destino: str,
     print(f"Formato: {formato_audio}")
     
     # Buscar videos (sin requerir FFmpeg estrictamente)
-    archivos_video = obtener_todos_archivos_multimedia(directorio_origen)
+    archivos_video = obtener_todos_archivos_multimedia(directorio_origen, catalogo)
     
     if not archivos_video:
         print("NO SE ENCONTRARON VIDEOS")
@@ -313,6 +327,8 @@ def extraer_audio_videos(directorio_origen: str, directorio_destino: str,
             # Extraer audio
             if extraer_audio_individual(ruta_video, ruta_audio, formato_audio, calidad):
                 extraidos_exitosamente += 1
+                if catalogo is not None:
+                    catalogo.registrar(ruta_audio)
                 print(f"COMPLETADO: {nombre_audio}")
             else:
                 print(f"FALLO: {os.path.basename(ruta_video)}")
@@ -324,6 +340,9 @@ def extraer_audio_videos(directorio_origen: str, directorio_destino: str,
         except Exception as e:
             print(f"ERROR: {e}")
     
+    if catalogo is not None:
+        catalogo.confirmar()
+    
     print(f"\nEXTRACCION COMPLETADA")
     print(f"Exitosos: {extraidos_exitosamente}")
     print(f"Fallidos: {total_archivos - extraidos_exitosamente}")
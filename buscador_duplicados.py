@@ -1,92 +1,738 @@
 import os
+import sys
+import stat
+import errno
+import uuid
+import shutil
+import zipfile
 import hashlib
 import asyncio
 import logging
+import mmap
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 from config import LOG_FILE_PATH
+from contenido_multimedia import (
+    es_archivo_multimedia,
+    obtener_rangos_contenido,
+    calcular_tamanio_contenido,
+)
 
 logger = logging.getLogger(__name__)
 
-async def calcular_hash_archivo(ruta_archivo, tam_bloque=65536):
+# Número máximo de archivos que se leen a la vez en hilos de trabajo
+CONCURRENCIA_POR_DEFECTO = min(32, (os.cpu_count() or 1) + 4)
+
+# A partir de este tamaño los archivos se leen con mmap en lugar de read()
+UMBRAL_MMAP = 64 * 1024 * 1024
+
+# Separador entre la ruta de un .zip y la ruta interna de uno de sus miembros ("archivo.zip!/carpeta/foto.jpg")
+SEPARADOR_ZIP = "!/"
+
+# Modos de hash disponibles para el escaneo de duplicados (clave -> descripción)
+# "rapido" hace una primera pasada con CRC32 y confirma con SHA-256 solo las colisiones.
+ALGORITMOS_HASH = {
+    "sha256": "SHA-256",
+    "blake2b": "BLAKE2b",
+    "rapido": "Rápido (CRC32 + confirmación SHA-256)",
+}
+
+def _tamanio_bloque_adaptativo(tamanio_archivo: int) -> int:
+    """
+    Elige el tamaño de lectura según el tamaño del archivo: bloques pequeños para archivos
+    pequeños y bloques de hasta 4 MB para archivos grandes, reduciendo llamadas a read().
+    """
+    if tamanio_archivo <= 1024 * 1024:
+        return 65536
+    if tamanio_archivo <= 256 * 1024 * 1024:
+        return 1024 * 1024
+    return 4 * 1024 * 1024
+
+class _HasherCRC32:
+    """Adaptador con la interfaz de hashlib para zlib.crc32, usado como primera pasada rápida no criptográfica."""
+    def __init__(self):
+        self._valor = 0
+
+    def update(self, datos):
+        self._valor = zlib.crc32(datos, self._valor)
+
+    def hexdigest(self):
+        return f"{self._valor:08x}"
+
+def _crear_hasher(algoritmo: str):
+    """Devuelve un objeto con update()/hexdigest() para el algoritmo indicado."""
+    if algoritmo == "sha256":
+        return hashlib.sha256()
+    if algoritmo == "blake2b":
+        return hashlib.blake2b()
+    if algoritmo == "crc32":
+        return _HasherCRC32()
+    raise ValueError(f"Algoritmo de hash no soportado: {algoritmo}")
+
+def dividir_ruta_zip(ruta_archivo: str):
     """
-    Calcula el hash SHA256 de un archivo dado.
+    Separa una ruta virtual "archivo.zip!/ruta/interna" en (ruta_zip, ruta_interna).
+
+    Returns:
+        tuple[str, str]: La ruta del .zip y el nombre del miembro, o None si no es una ruta virtual.
+    """
+    indice = ruta_archivo.lower().find(".zip" + SEPARADOR_ZIP)
+    if indice == -1:
+        return None
+    fin_zip = indice + len(".zip")
+    return ruta_archivo[:fin_zip], ruta_archivo[fin_zip + len(SEPARADOR_ZIP):]
+
+def _calcular_hash_miembro_zip(ruta_zip: str, nombre_miembro: str, tam_bloque: int, algoritmo: str):
+    """Descomprime en flujo un miembro de un .zip y calcula su hash sin extraerlo al disco."""
+    hasher = _crear_hasher(algoritmo)
+    try:
+        with zipfile.ZipFile(ruta_zip) as archivo_zip, archivo_zip.open(nombre_miembro) as miembro:
+            while True:
+                bloque = miembro.read(tam_bloque)
+                if not bloque:
+                    break
+                hasher.update(bloque)
+        return hasher.hexdigest()
+    except Exception as e:
+        logger.error(f"Error al calcular el hash de {ruta_zip}{SEPARADOR_ZIP}{nombre_miembro}: {e}")
+        return None
+
+def _tipo_cache(tipo_base: str, ruta_archivo: str, solo_contenido: bool) -> str:
+    """Etiqueta de caché del hash: los hashes sin metadatos de archivos multimedia se guardan aparte."""
+    if solo_contenido and es_archivo_multimedia(ruta_archivo):
+        return f"{tipo_base}:contenido"
+    return tipo_base
+
+def _leer_rango_virtual(f, rangos: list[tuple[int, int]], inicio: int, longitud: int) -> bytes:
+    """Lee `longitud` bytes a partir de `inicio` contando solo los bytes dentro de `rangos`."""
+    datos = bytearray()
+    posicion = 0
+    for inicio_rango, longitud_rango in rangos:
+        if inicio < posicion + longitud_rango and inicio + longitud > posicion:
+            desde = max(inicio, posicion) - posicion
+            hasta = min(inicio + longitud, posicion + longitud_rango) - posicion
+            f.seek(inicio_rango + desde)
+            datos += f.read(hasta - desde)
+        posicion += longitud_rango
+    return bytes(datos)
+
+def calcular_hash_archivo_sincrono(ruta_archivo, tam_bloque=None, algoritmo="sha256", solo_contenido=False):
+    """
+    Calcula el hash de un archivo completo dentro del hilo actual.
+    Pensada para ejecutarse entera en un hilo de trabajo, sin saltos al bucle de eventos por bloque.
+    Los archivos mayores que UMBRAL_MMAP se leen mediante mmap para no copiar cada bloque a objetos bytes.
+    Las rutas virtuales "archivo.zip!/miembro" se descomprimen y se calcula el hash del miembro.
     
     Args:
         ruta_archivo (str): La ruta del archivo.
-        tam_bloque (int): Tamaño del bloque para leer el archivo.
+        tam_bloque (int, optional): Tamaño del bloque de lectura. Si no se indica, se adapta al tamaño del archivo.
+        algoritmo (str): "sha256", "blake2b" o "crc32".
+        solo_contenido (bool): En archivos de música y fotos, omite las etiquetas ID3/APE y los
+                               segmentos APPn de JPEG y calcula el hash solo del contenido.
     Returns:
-        str: El hash SHA256 del archivo o None si hay un error.
+        str: El hash del archivo o None si hay un error.
     """
-    if not os.path.exists(ruta_archivo):
+    miembro_zip = dividir_ruta_zip(ruta_archivo)
+    if miembro_zip and not os.path.exists(ruta_archivo):
+        return _calcular_hash_miembro_zip(*miembro_zip, tam_bloque or 1024 * 1024, algoritmo)
+
+    hasher = _crear_hasher(algoritmo)
+    try:
+        with open(ruta_archivo, 'rb') as f:
+            tamanio_archivo = os.fstat(f.fileno()).st_size
+            if tam_bloque is None:
+                tam_bloque = _tamanio_bloque_adaptativo(tamanio_archivo)
+            if solo_contenido and es_archivo_multimedia(ruta_archivo):
+                rangos = obtener_rangos_contenido(f, ruta_archivo, tamanio_archivo)
+            else:
+                rangos = [(0, tamanio_archivo)]
+            if tamanio_archivo >= UMBRAL_MMAP:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+                    with memoryview(mapa) as vista:
+                        for inicio_rango, longitud_rango in rangos:
+                            fin_rango = inicio_rango + longitud_rango
+                            for inicio in range(inicio_rango, fin_rango, tam_bloque):
+                                hasher.update(vista[inicio:min(inicio + tam_bloque, fin_rango)])
+            else:
+                for inicio_rango, longitud_rango in rangos:
+                    f.seek(inicio_rango)
+                    restante = longitud_rango
+                    while restante > 0:
+                        bloque = f.read(min(tam_bloque, restante))
+                        if not bloque:
+                            break
+                        hasher.update(bloque)
+                        restante -= len(bloque)
+        return hasher.hexdigest()
+    except FileNotFoundError:
         logger.warning(f"Archivo no encontrado para calcular hash: {ruta_archivo}")
         return None
+    except Exception as e:
+        logger.error(f"Error al calcular el hash de {ruta_archivo}: {e}")
+        return None
+
+async def calcular_hash_archivo(ruta_archivo, tam_bloque=None, algoritmo="sha256", solo_contenido=False):
+    """
+    Calcula el hash de un archivo dado en un hilo de trabajo.
     
+    Args:
+        ruta_archivo (str): La ruta del archivo.
+        tam_bloque (int, optional): Tamaño del bloque para leer el archivo. Si no se indica, se adapta al tamaño del archivo.
+        algoritmo (str): "sha256", "blake2b" o "crc32".
+        solo_contenido (bool): Si es True, en archivos multimedia se ignoran los metadatos.
+    Returns:
+        str: El hash del archivo o None si hay un error.
+    """
+    return await asyncio.to_thread(calcular_hash_archivo_sincrono, ruta_archivo, tam_bloque, algoritmo, solo_contenido)
+
+async def _ejecutar_en_paralelo(elementos: list, funcion, max_concurrencia: int, en_progreso=None) -> list:
+    """
+    Ejecuta `funcion(elemento)` para cada elemento en un grupo acotado de hilos de trabajo.
+    Como máximo `max_concurrencia` archivos se procesan a la vez; el progreso se notifica
+    desde el bucle de eventos a medida que termina cada elemento.
+
+    Returns:
+        list: Lista de tuplas (elemento, resultado) en orden de finalización.
+    """
+    total = len(elementos)
+    if not total:
+        return []
+    bucle = asyncio.get_running_loop()
+    pendientes = iter(elementos)
+    resultados = []
+
+    with ThreadPoolExecutor(max_workers=max_concurrencia, thread_name_prefix="hash") as ejecutor:
+        async def trabajador():
+            for elemento in pendientes:
+                resultado = await bucle.run_in_executor(ejecutor, funcion, elemento)
+                resultados.append((elemento, resultado))
+                if en_progreso:
+                    en_progreso(len(resultados), total)
+
+        await asyncio.gather(*(trabajador() for _ in range(min(max_concurrencia, total))))
+    return resultados
+
+def calcular_hash_parcial(ruta_archivo, tamanio_archivo, tam_bloque=4096, solo_contenido=False):
+    """
+    Calcula un hash SHA256 rápido usando solo el bloque inicial y el bloque final de un archivo.
+    Sirve como filtro previo: dos archivos con distinto hash parcial no pueden ser idénticos.
+
+    Args:
+        ruta_archivo (str): La ruta del archivo.
+        tamanio_archivo (int): Tamaño del archivo en bytes (ya conocido por el escaneo).
+        tam_bloque (int): Tamaño de cada bloque leído al inicio y al final.
+        solo_contenido (bool): Si es True, en archivos multimedia los bloques se toman del contenido sin metadatos.
+    Returns:
+        str: El hash parcial del archivo o None si hay un error.
+    """
     sha256 = hashlib.sha256()
     try:
         with open(ruta_archivo, 'rb') as f:
-            while True:
-                bloque = await asyncio.to_thread(f.read, tam_bloque)
-                if not bloque:
-                    break
-                sha256.update(bloque)
+            if solo_contenido and es_archivo_multimedia(ruta_archivo):
+                rangos = obtener_rangos_contenido(f, ruta_archivo, tamanio_archivo)
+            else:
+                rangos = [(0, tamanio_archivo)]
+            tamanio_contenido = sum(longitud for _, longitud in rangos)
+            sha256.update(_leer_rango_virtual(f, rangos, 0, tam_bloque))
+            if tamanio_contenido > tam_bloque:
+                inicio_final = max(tam_bloque, tamanio_contenido - tam_bloque)
+                sha256.update(_leer_rango_virtual(f, rangos, inicio_final, tamanio_contenido - inicio_final))
         return sha256.hexdigest()
     except Exception as e:
-        logger.error(f"Error al calcular el hash de {ruta_archivo}: {e}")
+        logger.error(f"Error al calcular el hash parcial de {ruta_archivo}: {e}")
         return None
 
-async def encontrar_archivos_duplicados(directorio: str, en_progreso=None):
+def _listar_con_catalogo(directorio: str, catalogo) -> list[str]:
     """
-    Escanea un directorio en busca de archivos duplicados basándose en su contenido (hash SHA256).
-    
+    Rutas de los archivos del directorio según el catálogo compartido, que solo vuelve a listar las carpetas
+    modificadas. Solo sirve para enumerarlas: el tamaño catalogado puede estar desfasado (un archivo reescrito
+    en su sitio no cambia el mtime de su carpeta), así que no se usa para filtrar.
+    Las rutas se devuelven con la misma forma que daría os.walk(directorio).
+    """
+    rutas = [entrada.ruta for entrada in catalogo.listar(directorio)]
+    raiz = os.path.abspath(directorio)
+    if raiz != directorio:
+        rutas = [os.path.join(directorio, os.path.relpath(ruta, raiz)) for ruta in rutas]
+    return rutas
+
+def _agrupar_por_tamanio(directorio: str, rutas_vistas: set[str] = None, filtrar_unicos: bool = True,
+                         solo_contenido: bool = False, catalogo=None) -> dict[int, list[tuple[str, os.stat_result]]]:
+    """
+    Recorre el directorio y agrupa los archivos (ruta, estado) por su tamaño en bytes.
+    Las rutas que son enlaces duros a un mismo inodo (st_dev, st_ino) se cuentan una sola vez:
+    son el mismo archivo en disco y borrar una de ellas no libera espacio.
+    Solo se conservan los grupos con más de un archivo, ya que un tamaño único no puede tener duplicados
+    (salvo con `filtrar_unicos=False`, necesario cuando también se comparan miembros de archivos .zip).
+    Si se pasa `rutas_vistas`, se añaden a él todas las rutas de archivos regulares encontradas.
+    Con `solo_contenido`, los archivos multimedia se agrupan por el tamaño de su contenido sin metadatos.
+    Con `catalogo` (CatalogoArchivos) la lista de archivos sale del catálogo, pero todos se agrupan por el tamaño
+    real de os.stat, que además es el estado que valida los hashes guardados en caché.
+    """
+    if catalogo is not None:
+        rutas_archivos = _listar_con_catalogo(directorio, catalogo)
+    else:
+        rutas_archivos = (os.path.join(raiz, archivo) for raiz, _, archivos in os.walk(directorio) for archivo in archivos)
+    mapa_tamanios = {}
+    inodos_vistos = set()
+    for ruta_archivo in rutas_archivos:
+        try:
+            estado = os.stat(ruta_archivo)
+        except OSError as e:
+            logger.warning(f"No se pudo obtener información de {ruta_archivo}: {e}")
+            continue
+        if stat.S_ISREG(estado.st_mode):
+            if rutas_vistas is not None:
+                rutas_vistas.add(ruta_archivo)
+            # En sistemas sin inodos reales (st_ino == 0) no se puede colapsar
+            if estado.st_ino:
+                clave_inodo = (estado.st_dev, estado.st_ino)
+                if clave_inodo in inodos_vistos:
+                    continue
+                inodos_vistos.add(clave_inodo)
+            tamanio = estado.st_size
+            if solo_contenido and es_archivo_multimedia(ruta_archivo):
+                try:
+                    tamanio = calcular_tamanio_contenido(ruta_archivo, estado.st_size)
+                except OSError as e:
+                    logger.warning(f"No se pudieron leer las cabeceras de {ruta_archivo}: {e}")
+                    continue
+            mapa_tamanios.setdefault(tamanio, []).append((ruta_archivo, estado))
+    if not filtrar_unicos:
+        return mapa_tamanios
+    return {tamanio: archivos for tamanio, archivos in mapa_tamanios.items() if len(archivos) > 1}
+
+def _indexar_miembros_zip(archivos_zip: list[tuple[str, os.stat_result]]) -> list[tuple[str, os.stat_result, int, int]]:
+    """
+    Lee solo el directorio central de cada .zip (sin descomprimir nada) y devuelve sus miembros
+    como (ruta_virtual, estado_del_zip, tamaño_descomprimido, crc32). Se omiten carpetas y miembros vacíos.
+    El estado del .zip sirve de clave de caché: si el .zip no cambia, sus miembros tampoco.
+    """
+    miembros = []
+    for ruta_zip, estado_zip in archivos_zip:
+        try:
+            with zipfile.ZipFile(ruta_zip) as archivo_zip:
+                for info in archivo_zip.infolist():
+                    if info.is_dir() or info.file_size == 0:
+                        continue
+                    miembros.append((f"{ruta_zip}{SEPARADOR_ZIP}{info.filename}", estado_zip, info.file_size, info.CRC))
+        except (zipfile.BadZipFile, OSError) as e:
+            logger.warning(f"No se pudo leer el índice del archivo comprimido {ruta_zip}: {e}")
+    return miembros
+
+def _leer_cabecera(ruta_archivo: str, tam_bloque: int = 4096, solo_contenido: bool = False) -> Optional[bytes]:
+    """
+    Primer bloque de un archivo o de un miembro de .zip (del miembro solo se descomprime ese bloque).
+    Con `solo_contenido`, en archivos multimedia sueltos el bloque se toma del contenido sin metadatos,
+    que es lo que cubrirá su hash completo.
+    """
+    miembro_zip = dividir_ruta_zip(ruta_archivo)
+    try:
+        if miembro_zip and not os.path.exists(ruta_archivo):
+            with zipfile.ZipFile(miembro_zip[0]) as archivo_zip, archivo_zip.open(miembro_zip[1]) as miembro:
+                return miembro.read(tam_bloque)
+        with open(ruta_archivo, 'rb') as f:
+            if solo_contenido and es_archivo_multimedia(ruta_archivo):
+                rangos = obtener_rangos_contenido(f, ruta_archivo, os.fstat(f.fileno()).st_size)
+                return _leer_rango_virtual(f, rangos, 0, tam_bloque)
+            return f.read(tam_bloque)
+    except Exception as e:
+        logger.warning(f"No se pudo leer el inicio de {ruta_archivo}: {e}")
+        return None
+
+def _cruzar_por_cabecera(sueltos: list, miembros: list, solo_contenido: bool = False) -> tuple[list, list, list]:
+    """
+    Empareja los archivos sueltos y los miembros de .zip de un mismo tamaño por su primer bloque.
+
+    Returns:
+        tuple[list, list, list]: (sueltos sin ningún miembro con su mismo inicio, miembros sin ningún suelto
+        con su mismo inicio, grupos mixtos de sueltos y miembros que empiezan igual).
+    """
+    por_cabecera = {}
+    miembros_restantes = []
+    for ruta_virtual, estado_zip, crc in miembros:
+        cabecera = _leer_cabecera(ruta_virtual)
+        if cabecera is None:
+            miembros_restantes.append((ruta_virtual, estado_zip, crc))
+        else:
+            por_cabecera.setdefault(cabecera, ([], []))[1].append((ruta_virtual, estado_zip, crc))
+    sueltos_restantes = []
+    for ruta_archivo, estado in sueltos:
+        cabecera = _leer_cabecera(ruta_archivo, solo_contenido=solo_contenido)
+        if cabecera in por_cabecera:
+            por_cabecera[cabecera][0].append((ruta_archivo, estado))
+        else:
+            sueltos_restantes.append((ruta_archivo, estado))
+    grupos_mixtos = []
+    for sueltos_cabecera, miembros_cabecera in por_cabecera.values():
+        if sueltos_cabecera:
+            grupos_mixtos.append(sueltos_cabecera + [(ruta_virtual, estado_zip) for ruta_virtual, estado_zip, _ in miembros_cabecera])
+        else:
+            miembros_restantes.extend(miembros_cabecera)
+    return sueltos_restantes, miembros_restantes, grupos_mixtos
+
+def _agrupar_miembros_zip(grupos_tamanio: dict, rutas_vistas: set[str],
+                          solo_contenido: bool = False) -> list[list[tuple[str, os.stat_result]]]:
+    """
+    Cruza los miembros de los .zip encontrados con los archivos sueltos usando el tamaño y el CRC32
+    del directorio central como filtro previo. Los miembros sin CRC propio que comparar (porque coinciden
+    en tamaño con archivos sueltos) se filtran por su primer bloque, del que solo se descomprime ese bloque.
+    Los grupos mixtos devueltos van directamente a la etapa de hash completo. Modifica `grupos_tamanio`
+    retirando solo los archivos sueltos que pasan a esos grupos; el resto sigue por la etapa de hash parcial.
+    Un miembro solo se descomprimirá entero si coincide en tamaño e inicio con un archivo suelto, o en tamaño y CRC con otro miembro.
+    """
+    archivos_zip = [(ruta, estado) for archivos in grupos_tamanio.values() for ruta, estado in archivos
+                    if ruta.lower().endswith(".zip")]
+    miembros_por_tamanio = {}
+    for ruta_virtual, estado_zip, tamanio, crc in _indexar_miembros_zip(archivos_zip):
+        miembros_por_tamanio.setdefault(tamanio, []).append((ruta_virtual, estado_zip, crc))
+        rutas_vistas.add(ruta_virtual)
+
+    grupos_mixtos = []
+    for tamanio, miembros in miembros_por_tamanio.items():
+        sueltos = grupos_tamanio.get(tamanio)
+        if sueltos:
+            grupos_tamanio[tamanio], miembros, mixtos = _cruzar_por_cabecera(sueltos, miembros, solo_contenido)
+            grupos_mixtos.extend(mixtos)
+        por_crc = {}
+        for ruta_virtual, estado_zip, crc in miembros:
+            por_crc.setdefault(crc, []).append((ruta_virtual, estado_zip))
+        grupos_mixtos.extend(grupo for grupo in por_crc.values() if len(grupo) > 1)
+    return grupos_mixtos
+
+async def _hashear_archivos(archivos: list, algoritmo: str, cache, ejecutor, semaforo, al_calcular=None,
+                            solo_contenido: bool = False) -> dict:
+    """
+    Calcula el hash completo de cada archivo (ruta, estado), reutilizando la caché cuando es posible.
+    Las lecturas se hacen en `ejecutor` y `semaforo` limita cuántos archivos se leen a la vez.
+    Los hashes guardados en caché se etiquetan con el algoritmo usado ("completo:<algoritmo>").
+
+    Returns:
+        dict: Mapa de hash -> lista de tuplas (ruta, estado).
+    """
+    bucle = asyncio.get_running_loop()
+    mapa_hashes = {}
+    # La caché se consulta y se actualiza una vez por grupo y en un hilo, para no bloquear el bucle de eventos
+    consultas = [(ruta_archivo, estado, _tipo_cache(f"completo:{algoritmo}", ruta_archivo, solo_contenido))
+                 for ruta_archivo, estado in archivos]
+    guardados = await asyncio.to_thread(cache.obtener_lote, consultas) if cache else [None] * len(consultas)
+    nuevos = []
+
+    async def hashear(ruta_archivo, estado, tipo_cache, hash_archivo):
+        if not hash_archivo:
+            async with semaforo:
+                hash_archivo = await bucle.run_in_executor(
+                    ejecutor, calcular_hash_archivo_sincrono, ruta_archivo,
+                    _tamanio_bloque_adaptativo(estado.st_size), algoritmo, solo_contenido
+                )
+            if hash_archivo and cache:
+                nuevos.append((ruta_archivo, estado, tipo_cache, hash_archivo))
+        if hash_archivo:
+            mapa_hashes.setdefault(hash_archivo, []).append((ruta_archivo, estado))
+        if al_calcular:
+            al_calcular()
+
+    await asyncio.gather(*(hashear(*consulta, guardado) for consulta, guardado in zip(consultas, guardados)))
+    if nuevos:
+        await asyncio.to_thread(cache.guardar_lote, nuevos)
+    return mapa_hashes
+
+def _guardar_digests_en_catalogo(catalogo, digests: list[tuple[str, os.stat_result, str]]):
+    """Guarda en el catálogo los hashes completos (ruta, estado, "algoritmo:hex") de un grupo."""
+    for ruta_archivo, estado, digest in digests:
+        catalogo.guardar_metadatos(ruta_archivo, estado, digest=digest)
+
+async def _confirmar_grupo(grupo: list, algoritmo: str, cache, ejecutor, semaforo, al_calcular=None,
+                           solo_contenido: bool = False) -> dict:
+    """
+    Calcula los hashes completos de un grupo de candidatos con el mismo tamaño y hash parcial.
+    Con el modo "rapido" primero se usa CRC32 y solo las coincidencias se confirman con SHA-256.
+    """
+    if algoritmo != "rapido":
+        return await _hashear_archivos(grupo, algoritmo, cache, ejecutor, semaforo, al_calcular, solo_contenido)
+    grupos_crc = await _hashear_archivos(grupo, "crc32", cache, ejecutor, semaforo, al_calcular, solo_contenido)
+    mapa_hashes = {}
+    for subgrupo in grupos_crc.values():
+        if len(subgrupo) > 1:
+            mapa_hashes.update(await _hashear_archivos(subgrupo, "sha256", cache, ejecutor, semaforo, None, solo_contenido))
+    return mapa_hashes
+
+async def iterar_archivos_duplicados(directorio: str, en_progreso=None, en_etapa=None, cache=None,
+                                     max_concurrencia: int = CONCURRENCIA_POR_DEFECTO, algoritmo: str = "sha256",
+                                     incluir_zip: bool = False, solo_contenido: bool = False, catalogo=None):
+    """
+    Versión en flujo de `encontrar_archivos_duplicados`: genera cada grupo de duplicados en cuanto
+    queda confirmado, sin esperar a que termine el escaneo completo.
+    El escaneo se hace por etapas para evitar leer archivos que no pueden tener duplicados:
+      1. Agrupación por tamaño (solo metadatos).
+      2. Hash parcial (bloque inicial y final) de los archivos con tamaño repetido.
+      3. Hash completo solo de los archivos cuyo hash parcial coincide.
+    Los hashes de las etapas 2 y 3 se calculan en paralelo, con varios archivos en curso a la vez.
+
     Args:
         directorio (str): El directorio a escanear.
         en_progreso (callable, optional): Una función de callback para actualizar el progreso.
-                                         Se llamará con (progreso_actual, total).
-    Returns:
-        dict: Un diccionario donde las claves son hashes de archivo y los valores son listas de rutas de archivos duplicados.
+                                         Se llamará con (progreso_actual, total) y se reinicia en cada etapa.
+        en_etapa (callable, optional): Callback llamado con el nombre de la etapa al comenzar cada una.
+        cache (CacheHashes, optional): Caché persistente de hashes. Los archivos sin cambios
+                                       (mismo tamaño, mtime e inodo) reutilizan el hash guardado.
+        max_concurrencia (int): Número máximo de archivos que se leen simultáneamente.
+        algoritmo (str): Una de las claves de ALGORITMOS_HASH. Con "rapido" el hash completo se calcula
+                         primero con CRC32 y solo las colisiones se confirman con SHA-256.
+        incluir_zip (bool): Si es True, también se comparan los miembros de los archivos .zip, que aparecen
+                            como rutas "archivo.zip!/ruta/interna".
+        solo_contenido (bool): Si es True, los archivos de música y fotos se comparan sin sus metadatos
+                               (etiquetas ID3v1/ID3v2/APE y segmentos APPn/COM de JPEG). Los miembros
+                               de archivos .zip se comparan siempre completos.
+        catalogo (CatalogoArchivos, optional): Catálogo compartido. Si se indica, la lista de archivos sale de él
+                                               (sin volver a listar las carpetas que no han cambiado) y los hashes
+                                               completos calculados se guardan en él.
+    Yields:
+        tuple[str, list[str]]: (hash, rutas ordenadas) de cada grupo de archivos duplicados.
     """
     if not os.path.isdir(directorio):
         logger.error(f"El directorio especificado no existe o no es válido: {directorio}")
-        return {}
+        return
+    if algoritmo not in ALGORITMOS_HASH:
+        logger.error(f"Algoritmo de hash no soportado: {algoritmo}")
+        return
+    max_concurrencia = max(1, int(max_concurrencia))
 
-    mapa_hashes = {}
-    todos_los_archivos = []
-    for raiz, _, archivos in os.walk(directorio):
-        for archivo in archivos:
-            ruta_archivo = os.path.join(raiz, archivo)
-            if os.path.isfile(ruta_archivo):
-                todos_los_archivos.append(ruta_archivo)
+    # Etapa 1: agrupar por tamaño
+    if en_etapa:
+        en_etapa("Agrupando archivos por tamaño")
+    rutas_vistas = set()
+    grupos_tamanio = await asyncio.to_thread(_agrupar_por_tamanio, directorio, rutas_vistas, not incluir_zip, solo_contenido,
+                                             catalogo)
+    grupos_mixtos = []
+    if incluir_zip:
+        if en_etapa:
+            en_etapa("Indexando archivos .zip")
+        grupos_mixtos = await asyncio.to_thread(_agrupar_miembros_zip, grupos_tamanio, rutas_vistas, solo_contenido)
+        grupos_tamanio = {tamanio: archivos for tamanio, archivos in grupos_tamanio.items() if len(archivos) > 1}
+    total_candidatos = sum(len(archivos) for archivos in grupos_tamanio.values())
+    logger.info(f"Etapa de tamaño: {total_candidatos} archivos candidatos en {len(grupos_tamanio)} grupos en {directorio}")
 
-    total_archivos = len(todos_los_archivos)
-    logger.info(f"Escaneando {total_archivos} archivos en busca de duplicados en {directorio}")
+    # Etapa 2: hash parcial de los grupos con tamaño repetido
+    if en_etapa:
+        en_etapa("Calculando hash parcial")
+    mapa_parcial = {}
+    sin_hash_parcial = []
+    # Todos los hashes parciales guardados se consultan de una vez en un hilo, sin bloquear el bucle de eventos
+    consultas = [(ruta_archivo, estado, _tipo_cache("parcial", ruta_archivo, solo_contenido))
+                 for tamanio, archivos in grupos_tamanio.items() if tamanio for ruta_archivo, estado in archivos]
+    guardados = iter(await asyncio.to_thread(cache.obtener_lote, consultas) if cache else [None] * len(consultas))
+    for tamanio, archivos in grupos_tamanio.items():
+        for ruta_archivo, estado in archivos:
+            # Todos los archivos vacíos son idénticos; no hace falta leerlos
+            hash_parcial = next(guardados) if tamanio else ""
+            if hash_parcial is None:
+                sin_hash_parcial.append((ruta_archivo, estado, tamanio))
+            else:
+                mapa_parcial.setdefault((tamanio, hash_parcial), []).append((ruta_archivo, estado))
 
-    for i, ruta_archivo in enumerate(todos_los_archivos):
-        hash_archivo = await calcular_hash_archivo(ruta_archivo)
-        if hash_archivo:
-            mapa_hashes.setdefault(hash_archivo, []).append(ruta_archivo)
-        
+    ya_resueltos = total_candidatos - len(sin_hash_parcial)
+    calculados = await _ejecutar_en_paralelo(
+        sin_hash_parcial,
+        lambda archivo: calcular_hash_parcial(archivo[0], archivo[1].st_size, solo_contenido=solo_contenido),
+        max_concurrencia,
+        (lambda actual, total: en_progreso(ya_resueltos + actual, total_candidatos)) if en_progreso else None
+    )
+    nuevos_parciales = []
+    for (ruta_archivo, estado, tamanio), hash_parcial in calculados:
+        if hash_parcial:
+            mapa_parcial.setdefault((tamanio, hash_parcial), []).append((ruta_archivo, estado))
+            nuevos_parciales.append((ruta_archivo, estado, _tipo_cache("parcial", ruta_archivo, solo_contenido), hash_parcial))
+    if cache and nuevos_parciales:
+        await asyncio.to_thread(cache.guardar_lote, nuevos_parciales)
+    grupos_parciales = [grupo for grupo in mapa_parcial.values() if len(grupo) > 1] + grupos_mixtos
+    del mapa_parcial, grupos_tamanio, grupos_mixtos
+
+    # Etapa 3: hash completo solo de los archivos que siguen coincidiendo.
+    # Cada grupo confirmado se entrega por la cola en cuanto terminan todos sus archivos.
+    total_archivos = sum(len(grupo) for grupo in grupos_parciales)
+    logger.info(f"Etapa de hash parcial: {total_archivos} archivos requieren hash completo")
+    if en_etapa:
+        en_etapa(f"Calculando hash completo ({ALGORITMOS_HASH[algoritmo]})")
+
+    cola_resultados = asyncio.Queue()
+    semaforo = asyncio.Semaphore(max_concurrencia)
+    pendientes = iter(grupos_parciales)
+    procesados = 0
+    total_grupos = 0
+
+    def al_calcular():
+        nonlocal procesados
+        procesados += 1
         if en_progreso:
-            en_progreso((i + 1), total_archivos)
+            en_progreso(procesados, total_archivos)
+
+    # Hash de contenido completo que se guarda en el catálogo (los de "solo contenido" no son del archivo entero)
+    algoritmo_catalogo = None if catalogo is None or solo_contenido else ("sha256" if algoritmo == "rapido" else algoritmo)
+
+    with ThreadPoolExecutor(max_workers=max_concurrencia, thread_name_prefix="hash") as ejecutor:
+        async def trabajador():
+            for grupo in pendientes:
+                mapa_hashes = await _confirmar_grupo(grupo, algoritmo, cache, ejecutor, semaforo, al_calcular, solo_contenido)
+                if algoritmo_catalogo:
+                    # Un único paso por el catálogo por grupo, en un hilo para no bloquear el bucle de eventos
+                    await asyncio.to_thread(_guardar_digests_en_catalogo, catalogo, [
+                        (ruta, estado, f"{algoritmo_catalogo}:{valor_hash}")
+                        for valor_hash, archivos in mapa_hashes.items() for ruta, estado in archivos
+                    ])
+                for valor_hash, archivos in mapa_hashes.items():
+                    if len(archivos) > 1:
+                        # Los archivos sueltos van primero para que el "original" sea siempre un archivo real
+                        rutas = sorted((ruta for ruta, _ in archivos), key=lambda ruta: (dividir_ruta_zip(ruta) is not None, ruta))
+                        await cola_resultados.put((valor_hash, rutas))
+
+        async def coordinar():
+            try:
+                await asyncio.gather(*(trabajador() for _ in range(min(max_concurrencia, len(grupos_parciales)))))
+            finally:
+                await cola_resultados.put(None)
+
+        tarea = asyncio.create_task(coordinar())
+        try:
+            while True:
+                resultado = await cola_resultados.get()
+                if resultado is None:
+                    break
+                total_grupos += 1
+                yield resultado
+            await tarea
+        finally:
+            if not tarea.done():
+                tarea.cancel()
+                await asyncio.gather(tarea, return_exceptions=True)
+            # El commit de SQLite puede esperar al disco: fuera del bucle de eventos, como las lecturas y escrituras
+            if cache:
+                await asyncio.to_thread(cache.confirmar)
+            if catalogo is not None:
+                await asyncio.to_thread(catalogo.confirmar)
+
+    if cache:
+        await asyncio.to_thread(cache.purgar_obsoletos, directorio, rutas_vistas)
+    logger.info(f"Escaneo de duplicados completado. Encontrados {total_grupos} grupos de duplicados.")
+
+async def encontrar_archivos_duplicados(directorio: str, en_progreso=None, en_etapa=None, cache=None,
+                                       max_concurrencia: int = CONCURRENCIA_POR_DEFECTO, algoritmo: str = "sha256",
+                                       incluir_zip: bool = False, solo_contenido: bool = False, catalogo=None):
+    """
+    Escanea un directorio en busca de archivos duplicados basándose en su contenido (hash).
+    Recoge en un diccionario todos los grupos generados por `iterar_archivos_duplicados`;
+    los argumentos tienen el mismo significado.
     
-    archivos_duplicados = {valor_hash: rutas for valor_hash, rutas in mapa_hashes.items() if len(rutas) > 1}
-    logger.info(f"Escaneo de duplicados completado. Encontrados {len(archivos_duplicados)} grupos de duplicados.")
+    Returns:
+        dict: Un diccionario donde las claves son hashes de archivo y los valores son listas de rutas de archivos duplicados.
+    """
+    archivos_duplicados = {}
+    async for valor_hash, rutas in iterar_archivos_duplicados(directorio, en_progreso, en_etapa, cache, max_concurrencia,
+                                                            algoritmo, incluir_zip, solo_contenido, catalogo):
+        archivos_duplicados[valor_hash] = rutas
     return archivos_duplicados
 
+def _hash_merkle_directorios(directorio: str, hash_por_ruta: dict[str, str]) -> dict[str, str]:
+    """
+    Calcula de abajo hacia arriba un hash Merkle por carpeta a partir de los nombres y hashes de sus hijos.
+    Una carpeta solo recibe hash si todos sus archivos tienen un duplicado confirmado (están en
+    `hash_por_ruta`) y todas sus subcarpetas también lo tienen: si no, no puede existir una copia idéntica.
+    Las carpetas sin ningún archivo en su subárbol se ignoran.
+
+    Returns:
+        dict: Mapa de ruta de carpeta -> hash Merkle.
+    """
+    hash_por_carpeta = {}
+    for raiz, subcarpetas, archivos in os.walk(directorio, topdown=False):
+        entradas = []
+        completa = True
+        for archivo in archivos:
+            hash_archivo = hash_por_ruta.get(os.path.join(raiz, archivo))
+            if hash_archivo is None:
+                completa = False
+                break
+            entradas.append(f"f\0{archivo}\0{hash_archivo}")
+        if completa:
+            for subcarpeta in subcarpetas:
+                ruta_subcarpeta = os.path.join(raiz, subcarpeta)
+                if os.path.islink(ruta_subcarpeta):
+                    continue
+                hash_subcarpeta = hash_por_carpeta.get(ruta_subcarpeta)
+                if hash_subcarpeta is None:
+                    # Subcarpeta única o vacía: solo se admite si está vacía
+                    if any(True for _ in os.scandir(ruta_subcarpeta)):
+                        completa = False
+                        break
+                    continue
+                entradas.append(f"d\0{subcarpeta}\0{hash_subcarpeta}")
+        if completa and entradas:
+            sha256 = hashlib.sha256()
+            for entrada in sorted(entradas):
+                sha256.update(entrada.encode('utf-8', 'surrogateescape'))
+                sha256.update(b"\n")
+            hash_por_carpeta[raiz] = sha256.hexdigest()
+    return hash_por_carpeta
+
+def agrupar_directorios_duplicados(directorio: str, archivos_duplicados: dict[str, list[str]]) -> tuple[dict[str, list[str]], dict[str, list[str]]]:
+    """
+    Detecta subárboles de carpetas idénticos (mismos nombres y mismo contenido) usando hashes Merkle
+    construidos con los hashes ya calculados por el escaneo de duplicados, sin volver a leer ningún archivo.
+    Solo se informan las carpetas más altas de cada copia, y los grupos de archivos que quedan
+    completamente dentro de carpetas duplicadas se retiran del resultado de archivos.
+
+    Args:
+        directorio (str): El directorio escaneado.
+        archivos_duplicados (dict): Resultado de `encontrar_archivos_duplicados` (hash -> rutas).
+    Returns:
+        tuple[dict, dict]: (carpetas duplicadas hash -> rutas de carpetas, grupos de archivos restantes).
+    """
+    hash_por_ruta = {ruta: valor_hash for valor_hash, rutas in archivos_duplicados.items() for ruta in rutas}
+    hash_por_carpeta = _hash_merkle_directorios(directorio, hash_por_ruta)
+
+    mapa_carpetas = {}
+    for ruta_carpeta, hash_carpeta in hash_por_carpeta.items():
+        mapa_carpetas.setdefault(hash_carpeta, []).append(ruta_carpeta)
+    carpetas_repetidas = {ruta for rutas in mapa_carpetas.values() if len(rutas) > 1 for ruta in rutas}
+
+    # Solo las carpetas cuya carpeta padre no es también una copia
+    carpetas_duplicadas = {}
+    for hash_carpeta, rutas in mapa_carpetas.items():
+        if len(rutas) < 2:
+            continue
+        superiores = sorted(ruta for ruta in rutas if os.path.dirname(ruta) not in carpetas_repetidas)
+        if len(superiores) > 1:
+            carpetas_duplicadas[hash_carpeta] = superiores
+
+    cubiertas = tuple(os.path.join(ruta, '') for rutas in carpetas_duplicadas.values() for ruta in rutas)
+    archivos_restantes = {
+        valor_hash: rutas for valor_hash, rutas in archivos_duplicados.items()
+        if not all(ruta.startswith(cubiertas) for ruta in rutas)
+    } if cubiertas else dict(archivos_duplicados)
+
+    logger.info(f"Detección de carpetas duplicadas: {len(carpetas_duplicadas)} grupos de carpetas en {directorio}")
+    return carpetas_duplicadas, archivos_restantes
+
 def eliminar_archivos(rutas_archivos: list[str]) -> int:
     """
-    Elimina los archivos especificados.
+    Elimina los archivos especificados. Las rutas de carpetas (grupos de carpetas duplicadas)
+    se eliminan junto con todo su contenido.
     
     Args:
-        rutas_archivos (list[str]): Una lista de rutas de archivos a eliminar.
+        rutas_archivos (list[str]): Una lista de rutas de archivos o carpetas a eliminar.
     Returns:
-        int: El número de archivos eliminados exitosamente.
+        int: El número de archivos o carpetas eliminados exitosamente.
     """
     contador_eliminados = 0
     for ruta in rutas_archivos:
         if os.path.exists(ruta):
             try:
-                os.remove(ruta)
-                logger.info(f"Archivo eliminado: {ruta}")
+                if os.path.isdir(ruta) and not os.path.islink(ruta):
+                    shutil.rmtree(ruta)
+                    logger.info(f"Carpeta eliminada: {ruta}")
+                else:
+                    os.remove(ruta)
+                    logger.info(f"Archivo eliminado: {ruta}")
                 contador_eliminados += 1
             except OSError as e:
                 logger.error(f"Error al eliminar {ruta}: {e}")
@@ -94,4 +740,102 @@ def eliminar_archivos(rutas_archivos: list[str]) -> int:
                 logger.error(f"Un error inesperado ocurrió al eliminar {ruta}: {e}")
         else:
             logger.warning(f"Intento de eliminar archivo no existente: {ruta}")
-    return contador_eliminados
\ No newline at end of file
+    return contador_eliminados
+
+# Modos de reemplazo de duplicados por enlaces (clave -> descripción)
+MODOS_ENLACE = {
+    "auto": "Reflink si el sistema lo soporta, si no enlace duro",
+    "reflink": "Reflink (copia por referencia)",
+    "enlace_duro": "Enlace duro",
+}
+
+# ioctl FICLONE de Linux (_IOW(0x94, 9, int)) para clonar un archivo por referencia en Btrfs/XFS
+_FICLONE = 0x40049409
+
+def _crear_reflink(ruta_origen: str, ruta_destino: str):
+    """Crea `ruta_destino` como clon por referencia de `ruta_origen`. Lanza OSError si no es posible."""
+    if not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, "Reflink solo soportado en Linux")
+    import fcntl
+    with open(ruta_origen, 'rb') as origen, open(ruta_destino, 'xb') as destino:
+        fcntl.ioctl(destino.fileno(), _FICLONE, origen.fileno())
+    shutil.copystat(ruta_origen, ruta_destino)
+
+def _reemplazar_por_enlace(ruta_original: str, ruta_duplicado: str, modo: str) -> str:
+    """
+    Sustituye `ruta_duplicado` por un enlace a `ruta_original` de forma atómica: el enlace se crea
+    con un nombre temporal en el mismo directorio y luego se renombra encima del duplicado.
+    Si algo falla, el duplicado queda intacto.
+
+    Returns:
+        str: El tipo de enlace creado ("reflink" o "enlace_duro").
+    """
+    directorio, nombre = os.path.split(ruta_duplicado)
+    ruta_temporal = os.path.join(directorio, f".{nombre}.{uuid.uuid4().hex}.tmp")
+    try:
+        tipo_creado = None
+        if modo in ("auto", "reflink"):
+            try:
+                _crear_reflink(ruta_original, ruta_temporal)
+                tipo_creado = "reflink"
+            except OSError:
+                if os.path.exists(ruta_temporal):
+                    os.remove(ruta_temporal)
+                if modo == "reflink":
+                    raise
+        if tipo_creado is None:
+            os.link(ruta_original, ruta_temporal)
+            tipo_creado = "enlace_duro"
+        os.replace(ruta_temporal, ruta_duplicado)
+        return tipo_creado
+    except BaseException:
+        if os.path.exists(ruta_temporal):
+            os.remove(ruta_temporal)
+        raise
+
+def reemplazar_por_enlaces(pares_duplicados: list[tuple[str, str]], modo: str = "auto") -> int:
+    """
+    Reemplaza archivos duplicados por enlaces al original, liberando espacio sin romper las rutas
+    de las que dependen otras herramientas.
+    
+    Args:
+        pares_duplicados (list[tuple[str, str]]): Lista de tuplas (ruta_original, ruta_duplicado).
+        modo (str): Una de las claves de MODOS_ENLACE.
+    Returns:
+        int: El número de archivos reemplazados exitosamente.
+    """
+    if modo not in MODOS_ENLACE:
+        logger.error(f"Modo de enlace no soportado: {modo}")
+        return 0
+
+    contador_reemplazados = 0
+    for ruta_original, ruta_duplicado in pares_duplicados:
+        try:
+            estado_original = os.stat(ruta_original)
+            estado_duplicado = os.stat(ruta_duplicado)
+            if stat.S_ISDIR(estado_original.st_mode) or stat.S_ISDIR(estado_duplicado.st_mode):
+                logger.warning(f"Las carpetas duplicadas no se pueden enlazar, omitiendo: {ruta_duplicado}")
+                continue
+            if (estado_original.st_dev, estado_original.st_ino) == (estado_duplicado.st_dev, estado_duplicado.st_ino):
+                logger.info(f"Ya es un enlace al original, omitiendo: {ruta_duplicado}")
+                continue
+            if estado_original.st_dev != estado_duplicado.st_dev:
+                logger.warning(f"No se puede enlazar entre dispositivos distintos: {ruta_duplicado}")
+                continue
+            # Comprobación barata de que el contenido no ha cambiado desde el escaneo
+            if (estado_original.st_size != estado_duplicado.st_size or
+                    calcular_hash_parcial(ruta_original, estado_original.st_size) !=
+                    calcular_hash_parcial(ruta_duplicado, estado_duplicado.st_size)):
+                logger.warning(f"El archivo cambió desde el escaneo, omitiendo: {ruta_duplicado}")
+                continue
+
+            tipo_creado = _reemplazar_por_enlace(ruta_original, ruta_duplicado, modo)
+            logger.info(f"Duplicado reemplazado por {tipo_creado}: {ruta_duplicado} -> {ruta_original}")
+            contador_reemplazados += 1
+        except FileNotFoundError:
+            logger.warning(f"Archivo no encontrado, omitiendo: {ruta_duplicado}")
+        except OSError as e:
+            logger.error(f"Error al reemplazar {ruta_duplicado} por un enlace: {e}")
+        except Exception as e:
+            logger.error(f"Un error inesperado ocurrió al reemplazar {ruta_duplicado}: {e}")
+    return contador_reemplazados
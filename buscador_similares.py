@@ -0,0 +1,195 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Extensiones que Pillow puede decodificar sin complementos adicionales
+EXTENSIONES_IMAGEN = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp')
+
+# Métodos de huella perceptual disponibles (clave -> descripción)
+METODOS_HUELLA = {
+    "dhash": "dHash (diferencias)",
+    "phash": "pHash (DCT)",
+}
+
+# Número de bits de cada huella (8x8)
+BITS_HUELLA = 64
+
+def _matriz_dct(n: int) -> np.ndarray:
+    """Matriz de la DCT-II ortonormal de tamaño n x n, para aplicar la transformada con dos productos matriciales."""
+    k = np.arange(n).reshape(-1, 1)
+    i = np.arange(n).reshape(1, -1)
+    matriz = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matriz[0, :] = np.sqrt(1 / n)
+    return matriz
+
+_DCT_32 = _matriz_dct(32)
+
+def _bits_a_entero(bits: np.ndarray) -> int:
+    """Empaqueta un arreglo booleano en un entero (el primer bit es el más significativo)."""
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+def _cargar_gris_reducida(ruta_archivo: str, ancho: int, alto: int) -> np.ndarray:
+    """
+    Abre la imagen, la pasa a escala de grises y la reduce a ancho x alto.
+    Con `draft` los JPEG se decodifican directamente a una escala menor, sin procesar todos los píxeles.
+    """
+    with Image.open(ruta_archivo) as img:
+        img.draft('L', (ancho * 8, alto * 8))
+        reducida = img.convert('L').resize((ancho, alto), Image.LANCZOS)
+        return np.asarray(reducida, dtype=np.float32)
+
+def calcular_dhash(ruta_archivo: str) -> int:
+    """
+    Calcula el dHash de 64 bits: compara cada píxel con su vecino derecho en una miniatura de 9x8.
+
+    Args:
+        ruta_archivo (str): La ruta de la imagen.
+    Returns:
+        int: La huella de 64 bits.
+    """
+    pixeles = _cargar_gris_reducida(ruta_archivo, 9, 8)
+    return _bits_a_entero(pixeles[:, 1:] > pixeles[:, :-1])
+
+def calcular_phash(ruta_archivo: str) -> int:
+    """
+    Calcula el pHash de 64 bits: DCT de una miniatura de 32x32 y comparación de las 8x8
+    frecuencias más bajas con su mediana.
+
+    Args:
+        ruta_archivo (str): La ruta de la imagen.
+    Returns:
+        int: La huella de 64 bits.
+    """
+    pixeles = _cargar_gris_reducida(ruta_archivo, 32, 32)
+    frecuencias = (_DCT_32 @ pixeles @ _DCT_32.T)[:8, :8]
+    mediana = np.median(frecuencias.ravel()[1:])
+    return _bits_a_entero(frecuencias > mediana)
+
+def distancia_hamming(huella_a: int, huella_b: int) -> int:
+    """Número de bits distintos entre dos huellas."""
+    return bin(huella_a ^ huella_b).count('1')
+
+class ArbolBK:
+    """
+    Árbol BK sobre la distancia de Hamming. Permite buscar todas las huellas a distancia <= k
+    descartando ramas completas por la desigualdad triangular, sin comparar contra todos los elementos.
+    Las rutas con la misma huella comparten nodo.
+    """
+    def __init__(self):
+        self._raiz = None
+
+    def insertar(self, huella: int, ruta_archivo: str):
+        if self._raiz is None:
+            self._raiz = (huella, [ruta_archivo], {})
+            return
+        nodo = self._raiz
+        while True:
+            distancia = distancia_hamming(huella, nodo[0])
+            if distancia == 0:
+                nodo[1].append(ruta_archivo)
+                return
+            hijo = nodo[2].get(distancia)
+            if hijo is None:
+                nodo[2][distancia] = (huella, [ruta_archivo], {})
+                return
+            nodo = hijo
+
+    def buscar(self, huella: int, distancia_maxima: int) -> list[tuple[str, int]]:
+        """
+        Devuelve todas las rutas cuya huella está a distancia <= distancia_maxima.
+
+        Returns:
+            list[tuple[str, int]]: Tuplas (ruta, distancia).
+        """
+        resultados = []
+        if self._raiz is None:
+            return resultados
+        pendientes = [self._raiz]
+        while pendientes:
+            valor, rutas, hijos = pendientes.pop()
+            distancia = distancia_hamming(huella, valor)
+            if distancia <= distancia_maxima:
+                resultados.extend((ruta, distancia) for ruta in rutas)
+            for distancia_hijo, hijo in hijos.items():
+                if distancia - distancia_maxima <= distancia_hijo <= distancia + distancia_maxima:
+                    pendientes.append(hijo)
+        return resultados
+
+def _calcular_huella_segura(ruta_archivo: str, metodo: str):
+    try:
+        return calcular_phash(ruta_archivo) if metodo == "phash" else calcular_dhash(ruta_archivo)
+    except Exception as e:
+        logger.warning(f"No se pudo calcular la huella perceptual de {ruta_archivo}: {e}")
+        return None
+
+def encontrar_imagenes_similares(directorio: str, distancia_maxima: int = 5, metodo: str = "dhash",
+                                 en_progreso=None, max_concurrencia: int = None, catalogo=None) -> list[list[tuple[str, float]]]:
+    """
+    Busca imágenes casi idénticas (redimensionadas, recodificadas o convertidas de formato)
+    comparando huellas perceptuales indexadas en un árbol BK.
+
+    Args:
+        directorio (str): El directorio a escanear.
+        distancia_maxima (int): Distancia de Hamming máxima (de 0 a 64) para considerar dos imágenes similares.
+        metodo (str): "dhash" o "phash".
+        en_progreso (callable, optional): Callback llamado con (progreso_actual, total) al calcular las huellas.
+        max_concurrencia (int, optional): Número de hilos para decodificar imágenes.
+        catalogo (CatalogoArchivos, optional): Si se indica, las imágenes se buscan en el catálogo compartido
+                                               en lugar de recorrer el directorio.
+    Returns:
+        list[list[tuple[str, float]]]: Grupos de imágenes similares. Cada grupo es una lista de
+            (ruta, similitud en %) cuyo primer elemento es la imagen de referencia (100 %).
+    """
+    if not os.path.isdir(directorio):
+        logger.error(f"El directorio especificado no existe o no es válido: {directorio}")
+        return []
+    if metodo not in METODOS_HUELLA:
+        logger.error(f"Método de huella no soportado: {metodo}")
+        return []
+
+    if catalogo is not None:
+        rutas_imagenes = [entrada.ruta for entrada in catalogo.listar(directorio, extensiones=EXTENSIONES_IMAGEN)]
+    else:
+        rutas_imagenes = []
+        for raiz, _, archivos in os.walk(directorio):
+            for archivo in archivos:
+                if archivo.lower().endswith(EXTENSIONES_IMAGEN):
+                    rutas_imagenes.append(os.path.join(raiz, archivo))
+    rutas_imagenes.sort()
+    total_imagenes = len(rutas_imagenes)
+    logger.info(f"Calculando huellas perceptuales ({metodo}) de {total_imagenes} imágenes en {directorio}")
+
+    huellas = {}
+    arbol = ArbolBK()
+    with ThreadPoolExecutor(max_workers=max_concurrencia) as ejecutor:
+        for i, (ruta_archivo, huella) in enumerate(
+            zip(rutas_imagenes, ejecutor.map(lambda ruta: _calcular_huella_segura(ruta, metodo), rutas_imagenes))
+        ):
+            if huella is not None:
+                huellas[ruta_archivo] = huella
+                arbol.insertar(huella, ruta_archivo)
+            if en_progreso:
+                en_progreso(i + 1, total_imagenes)
+
+    grupos = []
+    agrupadas = set()
+    for ruta_archivo, huella in huellas.items():
+        if ruta_archivo in agrupadas:
+            continue
+        vecinas = [(ruta, distancia) for ruta, distancia in arbol.buscar(huella, distancia_maxima)
+                   if ruta != ruta_archivo and ruta not in agrupadas]
+        if not vecinas:
+            continue
+        vecinas.sort(key=lambda vecina: (vecina[1], vecina[0]))
+        grupo = [(ruta_archivo, 100.0)]
+        grupo.extend((ruta, 100.0 * (1 - distancia / BITS_HUELLA)) for ruta, distancia in vecinas)
+        agrupadas.update(ruta for ruta, _ in grupo)
+        grupos.append(grupo)
+
+    logger.info(f"Búsqueda de imágenes similares completada. Encontrados {len(grupos)} grupos.")
+    return grupos
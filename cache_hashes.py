@@ -0,0 +1,144 @@
+import os
+import sqlite3
+import threading
+import logging
+from typing import Optional
+
+from config import HASH_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+class CacheHashes:
+    """
+    Caché persistente en SQLite de los hashes calculados por el buscador de duplicados.
+
+    Cada entrada se identifica por (ruta, tipo), donde el tipo registra también el algoritmo
+    usado (p. ej. "parcial" o "completo:blake2b"), y guarda el tamaño, mtime_ns e inodo del
+    archivo en el momento del cálculo. Un hash solo se reutiliza si esos tres valores
+    siguen coincidiendo con el estado actual del archivo.
+    """
+    def __init__(self, ruta_bd: str = HASH_CACHE_PATH):
+        directorio_bd = os.path.dirname(ruta_bd)
+        if directorio_bd:
+            os.makedirs(directorio_bd, exist_ok=True)
+        self._bloqueo = threading.Lock()
+        self._conexion = sqlite3.connect(ruta_bd, check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.execute(
+            """CREATE TABLE IF NOT EXISTS hashes (
+                ruta TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                tamanio INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inodo INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                PRIMARY KEY (ruta, tipo)
+            )"""
+        )
+        # Las entradas antiguas sin algoritmo se calcularon siempre con SHA-256
+        self._conexion.execute("UPDATE OR IGNORE hashes SET tipo = 'completo:sha256' WHERE tipo = 'completo'")
+        self._conexion.commit()
+
+    def obtener(self, ruta_archivo: str, estado: os.stat_result, tipo: str):
+        """
+        Devuelve el hash guardado para el archivo si su tamaño, mtime e inodo no han cambiado.
+
+        Args:
+            ruta_archivo (str): La ruta del archivo.
+            estado (os.stat_result): El resultado actual de os.stat del archivo.
+            tipo (str): El tipo de hash ("parcial", "completo:sha256", ...).
+        Returns:
+            str: El hash guardado o None si no existe o está desactualizado.
+        """
+        return self.obtener_lote([(ruta_archivo, estado, tipo)])[0]
+
+    def obtener_lote(self, consultas: list[tuple[str, os.stat_result, str]]) -> list[Optional[str]]:
+        """
+        Versión por lotes de `obtener`: consulta los hashes de muchos archivos tomando el bloqueo una sola vez.
+        Hace E/S síncrona, así que desde código asíncrono debe llamarse con asyncio.to_thread.
+
+        Args:
+            consultas (list[tuple[str, os.stat_result, str]]): (ruta, estado, tipo) de cada archivo.
+        Returns:
+            list[str | None]: El hash guardado de cada archivo, en el mismo orden (None si no existe o está desactualizado).
+        """
+        resultados = []
+        with self._bloqueo:
+            for ruta_archivo, estado, tipo in consultas:
+                fila = self._conexion.execute(
+                    "SELECT tamanio, mtime_ns, inodo, digest FROM hashes WHERE ruta = ? AND tipo = ?",
+                    (os.path.abspath(ruta_archivo), tipo)
+                ).fetchone()
+                vigente = fila and fila[:3] == (estado.st_size, estado.st_mtime_ns, estado.st_ino)
+                resultados.append(fila[3] if vigente else None)
+        return resultados
+
+    def guardar(self, ruta_archivo: str, estado: os.stat_result, tipo: str, digest: str):
+        """Guarda (o reemplaza) el hash de un archivo. Los cambios se confirman con `confirmar`."""
+        self.guardar_lote([(ruta_archivo, estado, tipo, digest)])
+
+    def guardar_lote(self, entradas: list[tuple[str, os.stat_result, str, str]]):
+        """
+        Versión por lotes de `guardar` para entradas (ruta, estado, tipo, digest). Como `obtener_lote`,
+        desde código asíncrono debe llamarse con asyncio.to_thread.
+        """
+        with self._bloqueo:
+            self._conexion.executemany(
+                "INSERT OR REPLACE INTO hashes (ruta, tipo, tamanio, mtime_ns, inodo, digest) VALUES (?, ?, ?, ?, ?, ?)",
+                [(os.path.abspath(ruta_archivo), tipo, estado.st_size, estado.st_mtime_ns, estado.st_ino, digest)
+                 for ruta_archivo, estado, tipo, digest in entradas]
+            )
+
+    def confirmar(self):
+        """Confirma en disco las escrituras pendientes."""
+        with self._bloqueo:
+            self._conexion.commit()
+
+    def purgar_obsoletos(self, directorio: str, rutas_vigentes: set[str]) -> int:
+        """
+        Elimina las entradas bajo `directorio` cuyos archivos ya no existen en el último escaneo.
+
+        Args:
+            directorio (str): El directorio escaneado.
+            rutas_vigentes (set[str]): Las rutas de todos los archivos vistos en el escaneo.
+        Returns:
+            int: El número de entradas eliminadas.
+        """
+        prefijo = os.path.join(os.path.abspath(directorio), '')
+        vigentes = {os.path.abspath(ruta) for ruta in rutas_vigentes}
+        with self._bloqueo:
+            filas = self._conexion.execute(
+                "SELECT DISTINCT ruta FROM hashes WHERE substr(ruta, 1, ?) = ?",
+                (len(prefijo), prefijo)
+            ).fetchall()
+            # Los miembros de un .zip ("archivo.zip!/miembro") siguen vigentes mientras exista su .zip
+            obsoletas = [(ruta,) for (ruta,) in filas
+                         if ruta not in vigentes and ruta.partition("!/")[0] not in vigentes]
+            self._conexion.executemany("DELETE FROM hashes WHERE ruta = ?", obsoletas)
+            self._conexion.commit()
+        if obsoletas:
+            logger.info(f"Caché de hashes: eliminadas {len(obsoletas)} entradas obsoletas en {directorio}")
+        return len(obsoletas)
+
+    def invalidar(self, directorio: str = None):
+        """
+        Borra la caché completa o solo las entradas bajo un directorio.
+
+        Args:
+            directorio (str, optional): Si se indica, solo se borran las entradas de ese árbol.
+        """
+        with self._bloqueo:
+            if directorio:
+                prefijo = os.path.join(os.path.abspath(directorio), '')
+                self._conexion.execute("DELETE FROM hashes WHERE substr(ruta, 1, ?) = ?", (len(prefijo), prefijo))
+            else:
+                self._conexion.execute("DELETE FROM hashes")
+            self._conexion.commit()
+        logger.info(f"Caché de hashes invalidada{f' para {directorio}' if directorio else ''}.")
+
+    def cerrar(self):
+        """Cierra la conexión con la base de datos."""
+        with self._bloqueo:
+            self._conexion.commit()
+            self._conexion.close()
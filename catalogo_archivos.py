@@ -0,0 +1,482 @@
+import os
+import re
+import sqlite3
+import fnmatch
+import logging
+import threading
+from collections import namedtuple
+from typing import Optional
+
+from config import CATALOG_DB_PATH
+from resumen_directorio import ResumenDirectorio, MAX_ARCHIVOS_MAYORES, INODO_SIN_COSTE
+
+logger = logging.getLogger(__name__)
+
+# Máximo de resultados que devuelve una búsqueda por nombre
+MAX_RESULTADOS_BUSQUEDA = 500
+
+# Caracteres que convierten una consulta de búsqueda en un patrón glob
+_COMODINES_GLOB = ('*', '?', '[')
+
+EntradaCatalogo = namedtuple(
+    "EntradaCatalogo",
+    ["ruta", "tamanio", "mtime_ns", "inodo", "extension", "digest", "ancho", "alto"]
+)
+EntradaCatalogo.__doc__ = """
+Un archivo del catálogo.
+
+extension: extensión en minúsculas con el punto (".pdf", "" si no tiene).
+digest: hash del contenido como "algoritmo:hex", o None si ninguna herramienta lo ha calculado.
+ancho / alto: dimensiones en píxeles de las imágenes ya abiertas por alguna herramienta, o None.
+"""
+
+def _rango_arbol(raiz: str) -> tuple[str, str]:
+    """Límites (exclusivos) de las rutas que cuelgan de `raiz`, para consultarlas por el índice de la clave."""
+    prefijo = os.path.join(raiz, '')
+    return prefijo, prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+
+def _like_literal(texto: str) -> str:
+    """Patrón LIKE que acepta `texto` literal; % y _ pasan a ser _ (el patrón es más amplio, nunca más estricto)."""
+    return texto.replace('%', '_')
+
+def _like_glob(patron: str) -> str:
+    """Traduce un patrón glob a un patrón LIKE que acepta al menos lo mismo ([...] pasa a ser un carácter cualquiera)."""
+    partes, indice = [], 0
+    while indice < len(patron):
+        caracter = patron[indice]
+        if caracter == '*':
+            partes.append('%')
+        elif caracter == '[' and ']' in patron[indice + 2:]:
+            partes.append('_')
+            indice = patron.index(']', indice + 2)
+        else:
+            partes.append('_' if caracter in '?%' else caracter)
+        indice += 1
+    return ''.join(partes)
+
+class CatalogoArchivos:
+    """
+    Catálogo persistente en SQLite de los archivos de los árboles con los que trabaja la aplicación:
+    ruta, tamaño, mtime, inodo, extensión y, opcionalmente, el hash del contenido y las dimensiones
+    de las imágenes. Lo comparten todas las herramientas (organizar, resumen, duplicados, renombrar,
+    imágenes y audio), de modo que un árbol ya catalogado no se vuelve a listar por cada una.
+
+    Al actualizar un árbol solo se listan los directorios cuyo mtime ha cambiado desde que se catalogaron
+    (es decir, en los que se han creado, borrado o renombrado entradas); los archivos del resto se toman del
+    catálogo sin consultarlos. Como en InstantaneasDirectorio, un archivo reescrito en su sitio sin cambiar su
+    directorio no se detecta hasta que se invalida el catálogo; el hash y las dimensiones se descartan en
+    cuanto se ve que el archivo ha cambiado.
+
+    Las rutas de los archivos se indexan además por trigramas (FTS5) para buscarlas por subcadena o patrón
+    glob (ver buscar); unos disparadores mantienen el índice al día con cada cambio de la tabla.
+    """
+    def __init__(self, ruta_bd: str = CATALOG_DB_PATH):
+        directorio_bd = os.path.dirname(ruta_bd)
+        if directorio_bd:
+            os.makedirs(directorio_bd, exist_ok=True)
+        self._bloqueo = threading.Lock()
+        self._conexion = sqlite3.connect(ruta_bd, check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        # Para que INSERT OR REPLACE también quite del índice de búsqueda la fila que reemplaza
+        self._conexion.execute("PRAGMA recursive_triggers=ON")
+        self._conexion.executescript(
+            """CREATE TABLE IF NOT EXISTS archivos (
+                ruta TEXT PRIMARY KEY,
+                directorio TEXT NOT NULL,
+                es_dir INTEGER NOT NULL,
+                tamanio INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inodo INTEGER NOT NULL,
+                extension TEXT NOT NULL,
+                digest TEXT,
+                ancho INTEGER,
+                alto INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS archivos_por_directorio ON archivos (directorio, es_dir);"""
+        )
+        self._conexion.commit()
+        self._busqueda_indexada = self._crear_indice_busqueda()
+
+    def _crear_indice_busqueda(self) -> bool:
+        """
+        Crea (si no existe) el índice de trigramas de las rutas de los archivos. Es una tabla FTS5 de contenido
+        externo: guarda solo el índice y lee las rutas de la tabla archivos. Devuelve False si esta versión
+        de SQLite no tiene el tokenizador trigram (SQLite < 3.34); entonces las búsquedas recorren la tabla.
+        """
+        existia = self._conexion.execute("SELECT 1 FROM sqlite_master WHERE name = 'busqueda'").fetchone() is not None
+        if not existia:
+            try:
+                self._conexion.execute(
+                    "CREATE VIRTUAL TABLE busqueda USING fts5(ruta, content='archivos', content_rowid='rowid', tokenize='trigram')"
+                )
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Índice de búsqueda no disponible ({e}); las búsquedas recorrerán todo el catálogo")
+                return False
+        self._conexion.executescript(
+            """CREATE TRIGGER IF NOT EXISTS busqueda_alta AFTER INSERT ON archivos WHEN new.es_dir = 0 BEGIN
+                INSERT INTO busqueda (rowid, ruta) VALUES (new.rowid, new.ruta);
+            END;
+            CREATE TRIGGER IF NOT EXISTS busqueda_baja AFTER DELETE ON archivos WHEN old.es_dir = 0 BEGIN
+                INSERT INTO busqueda (busqueda, rowid, ruta) VALUES ('delete', old.rowid, old.ruta);
+            END;
+            CREATE TRIGGER IF NOT EXISTS busqueda_movimiento AFTER UPDATE OF ruta ON archivos WHEN old.es_dir = 0 BEGIN
+                INSERT INTO busqueda (busqueda, rowid, ruta) VALUES ('delete', old.rowid, old.ruta);
+                INSERT INTO busqueda (rowid, ruta) VALUES (new.rowid, new.ruta);
+            END;"""
+        )
+        if not existia:
+            # Catálogo creado antes que el índice: se indexa lo que ya contiene
+            self._conexion.execute("INSERT INTO busqueda (rowid, ruta) SELECT rowid, ruta FROM archivos WHERE es_dir = 0")
+        self._conexion.commit()
+        return True
+
+    def _listar_directorio(self, directorio: str, dispositivo: int, estados_conocidos) -> Optional[dict]:
+        """
+        Lista un directorio (del dispositivo `dispositivo`, su st_dev). Devuelve ruta -> (es_dir, tamanio, mtime_ns, inodo),
+        o None si no se puede leer.
+        """
+        vistos = {}
+        try:
+            with os.scandir(directorio) as entradas:
+                for entrada in entradas:
+                    try:
+                        if entrada.is_dir(follow_symlinks=False):
+                            vistos[entrada.path] = (1, 0, -1, entrada.inode())
+                        elif entrada.is_file():
+                            conocido = estados_conocidos.get((dispositivo, entrada.inode())) if estados_conocidos else None
+                            if conocido is None:
+                                estado = entrada.stat()
+                                vistos[entrada.path] = (0, estado.st_size, estado.st_mtime_ns, estado.st_ino)
+                            else:
+                                vistos[entrada.path] = (0, *conocido, entrada.inode())
+                    except OSError as e:
+                        logger.warning(f"No se pudo consultar {entrada.path}: {e}")
+        except OSError as e:
+            logger.warning(f"No se pudo leer el directorio {directorio}: {e}")
+            return None
+        return vistos
+
+    def _borrar_arbol(self, ruta: str):
+        desde, hasta = _rango_arbol(ruta)
+        self._conexion.execute("DELETE FROM archivos WHERE ruta = ? OR (ruta > ? AND ruta < ?)", (ruta, desde, hasta))
+
+    def actualizar(self, directorio: str, recursivo: bool = True, estados_conocidos: Optional[dict] = None) -> int:
+        """
+        Pone al día el catálogo de un árbol listando solo los directorios que han cambiado.
+
+        Args:
+            directorio (str): El directorio raíz.
+            recursivo (bool): Si es False solo se actualiza el primer nivel.
+            estados_conocidos (dict, optional): (st_dev, inodo) -> (tamaño, mtime_ns) de archivos ya consultados
+                                                (ver resumen_directorio); no se vuelven a consultar.
+        Returns:
+            int: Número de directorios listados.
+        """
+        raiz = os.path.abspath(directorio)
+        if not INODO_SIN_COSTE:
+            estados_conocidos = None
+        listados = 0
+        pendientes = [raiz]
+        try:
+            while pendientes:
+                actual = pendientes.pop()
+                try:
+                    estado_directorio = os.stat(actual)
+                except OSError as e:
+                    logger.warning(f"No se pudo consultar el directorio {actual}: {e}")
+                    with self._bloqueo:
+                        self._borrar_arbol(actual)
+                    continue
+                mtime_directorio = estado_directorio.st_mtime_ns
+                with self._bloqueo:
+                    fila = self._conexion.execute(
+                        "SELECT mtime_ns FROM archivos WHERE ruta = ? AND es_dir = 1", (actual,)
+                    ).fetchone()
+                    if fila and fila[0] == mtime_directorio:
+                        # Sin altas ni bajas: su contenido es el del catálogo
+                        if recursivo:
+                            pendientes.extend(ruta for (ruta,) in self._conexion.execute(
+                                "SELECT ruta FROM archivos WHERE directorio = ? AND es_dir = 1", (actual,)
+                            ))
+                        continue
+                listados += 1
+                vistos = self._listar_directorio(actual, estado_directorio.st_dev, estados_conocidos)
+                if vistos is None:
+                    continue
+                self._guardar_directorio(actual, mtime_directorio, vistos)
+                if recursivo:
+                    pendientes.extend(ruta for ruta, datos in vistos.items() if datos[0])
+        finally:
+            with self._bloqueo:
+                self._conexion.commit()
+        logger.info(f"Catálogo de {raiz}: {listados} directorios listados")
+        return listados
+
+    def _guardar_directorio(self, directorio: str, mtime_directorio: int, vistos: dict):
+        with self._bloqueo:
+            previos = {ruta: datos for ruta, *datos in self._conexion.execute(
+                "SELECT ruta, es_dir, tamanio, mtime_ns, inodo FROM archivos WHERE directorio = ?", (directorio,)
+            )}
+            for ruta, (es_dir, *_) in previos.items():
+                if ruta not in vistos or vistos[ruta][0] != es_dir:
+                    if es_dir:
+                        self._borrar_arbol(ruta)
+                    else:
+                        self._conexion.execute("DELETE FROM archivos WHERE ruta = ?", (ruta,))
+            # Los archivos sin cambios conservan su hash y sus dimensiones
+            self._conexion.executemany(
+                """INSERT INTO archivos (ruta, directorio, es_dir, tamanio, mtime_ns, inodo, extension)
+                   VALUES (?, ?, 0, ?, ?, ?, ?)
+                   ON CONFLICT (ruta) DO UPDATE SET tamanio = excluded.tamanio, mtime_ns = excluded.mtime_ns,
+                   inodo = excluded.inodo, digest = NULL, ancho = NULL, alto = NULL""",
+                [(ruta, directorio, tamanio, mtime_ns, inodo, os.path.splitext(ruta)[1].lower())
+                 for ruta, (es_dir, tamanio, mtime_ns, inodo) in vistos.items()
+                 if not es_dir and previos.get(ruta) != [0, tamanio, mtime_ns, inodo]]
+            )
+            # Los subdirectorios nuevos quedan pendientes de listar (mtime -1)
+            self._conexion.executemany(
+                "INSERT OR IGNORE INTO archivos (ruta, directorio, es_dir, tamanio, mtime_ns, inodo, extension) "
+                "VALUES (?, ?, 1, 0, -1, ?, '')",
+                [(ruta, directorio, datos[3]) for ruta, datos in vistos.items() if datos[0]]
+            )
+            self._conexion.execute(
+                """INSERT INTO archivos (ruta, directorio, es_dir, tamanio, mtime_ns, inodo, extension)
+                   VALUES (?, ?, 1, 0, ?, 0, '')
+                   ON CONFLICT (ruta) DO UPDATE SET mtime_ns = excluded.mtime_ns""",
+                (directorio, os.path.dirname(directorio), mtime_directorio)
+            )
+
+    def listar(self, directorio: str, recursivo: bool = True, extensiones=None, actualizar: bool = True) -> list[EntradaCatalogo]:
+        """
+        Devuelve los archivos de un directorio según el catálogo, ordenados por ruta.
+
+        Args:
+            directorio (str): El directorio.
+            recursivo (bool): Si es True también se incluyen los archivos de las subcarpetas.
+            extensiones (iterable[str], optional): Extensiones admitidas (".jpg", ...). None = todas.
+            actualizar (bool): Si es True, antes se pone al día el catálogo del directorio (ver actualizar).
+        Returns:
+            list[EntradaCatalogo]: Los archivos.
+        """
+        if actualizar:
+            self.actualizar(directorio, recursivo)
+        raiz = os.path.abspath(directorio)
+        if recursivo:
+            condicion, parametros = "ruta > ? AND ruta < ?", list(_rango_arbol(raiz))
+        else:
+            condicion, parametros = "directorio = ?", [raiz]
+        if extensiones is not None:
+            extensiones = [extension.lower() for extension in extensiones]
+            condicion += f" AND extension IN ({', '.join('?' * len(extensiones))})"
+            parametros.extend(extensiones)
+        with self._bloqueo:
+            filas = self._conexion.execute(
+                f"""SELECT ruta, tamanio, mtime_ns, inodo, extension, digest, ancho, alto FROM archivos
+                    WHERE es_dir = 0 AND {condicion} ORDER BY ruta""",
+                parametros
+            ).fetchall()
+        return [EntradaCatalogo(*fila) for fila in filas]
+
+    def resumir(self, directorio: str, max_mayores: int = MAX_ARCHIVOS_MAYORES) -> ResumenDirectorio:
+        """
+        Resume un árbol a partir del catálogo (sin tocar el disco): bytes y archivos por extensión,
+        archivos más grandes y bytes por directorio. Conviene llamar antes a actualizar.
+        """
+        raiz = os.path.abspath(directorio)
+        desde, hasta = _rango_arbol(raiz)
+        with self._bloqueo:
+            filas = self._conexion.execute(
+                """SELECT extension, SUM(tamanio), COUNT(*) FROM archivos
+                   WHERE es_dir = 0 AND ruta > ? AND ruta < ? GROUP BY extension""", (desde, hasta)
+            ).fetchall()
+            mayores = self._conexion.execute(
+                """SELECT tamanio, ruta FROM archivos WHERE es_dir = 0 AND ruta > ? AND ruta < ?
+                   ORDER BY tamanio DESC LIMIT ?""", (desde, hasta, max_mayores)
+            ).fetchall()
+            directos = self._conexion.execute(
+                """SELECT directorio, SUM(tamanio) FROM archivos WHERE es_dir = 0 AND ruta > ? AND ruta < ?
+                   GROUP BY directorio""", (desde, hasta)
+            ).fetchall()
+            subdirectorios = self._conexion.execute(
+                "SELECT ruta FROM archivos WHERE es_dir = 1 AND ruta > ? AND ruta < ?", (desde, hasta)
+            ).fetchall()
+        bytes_por_directorio = {raiz: 0}
+        bytes_por_directorio.update((ruta, 0) for (ruta,) in subdirectorios)
+        for ruta, bytes_directos in directos:
+            while True:
+                bytes_por_directorio[ruta] = bytes_por_directorio.get(ruta, 0) + bytes_directos
+                padre = os.path.dirname(ruta)
+                if ruta == raiz or padre == ruta:
+                    break
+                ruta = padre
+        bytes_por_extension = {extension: bytes_ext for extension, bytes_ext, _ in filas}
+        archivos_por_extension = {extension: archivos for extension, _, archivos in filas}
+        return ResumenDirectorio(bytes_por_extension, archivos_por_extension, [tuple(fila) for fila in mayores],
+                                 sum(archivos_por_extension.values()), sum(bytes_por_extension.values()),
+                                 bytes_por_directorio)
+
+    def buscar(self, consulta: str, directorio: Optional[str] = None,
+               limite: int = MAX_RESULTADOS_BUSQUEDA) -> list[EntradaCatalogo]:
+        """
+        Busca archivos catalogados por nombre o ruta relativa con el índice de trigramas, sin tocar el disco
+        (conviene haber llamado antes a actualizar). No distingue mayúsculas de minúsculas.
+
+        Sin comodines, la consulta es una subcadena de la ruta relativa ("factura 2023", "fotos/playa").
+        Con comodines (*, ?, [...]) es un patrón glob que se compara con el nombre del archivo ("*.pdf"),
+        o con la ruta relativa si incluye un separador ("fotos/*.jpg"). El índice solo acota la búsqueda
+        si la consulta tiene al menos 3 caracteres seguidos sin comodines; si no, se recorre entero.
+
+        Args:
+            consulta (str): La subcadena o el patrón glob.
+            directorio (str, optional): Árbol en el que buscar; las rutas relativas lo son a él. None = todo el catálogo.
+            limite (int): Número máximo de resultados.
+        Returns:
+            list[EntradaCatalogo]: Los archivos encontrados (como mucho `limite`), ordenados por ruta.
+        """
+        consulta = consulta.strip().replace('/', os.sep)
+        if not consulta:
+            return []
+        if directorio is None:
+            prefijo, condicion, parametros = '', '', []
+        else:
+            raiz = os.path.abspath(directorio)
+            prefijo, condicion, parametros = os.path.join(raiz, ''), " AND a.ruta > ? AND a.ruta < ?", list(_rango_arbol(raiz))
+        # La consulta SQL acepta de más (sin mayúsculas, comodines como caracteres cualquiera...);
+        # cada candidato se comprueba después con `coincide`
+        por_ruta = True
+        if any(comodin in consulta for comodin in _COMODINES_GLOB):
+            por_ruta = os.sep in consulta
+            if por_ruta:
+                if not prefijo:
+                    consulta = os.path.join('*', consulta)
+                patron_like = _like_literal(prefijo) + _like_glob(consulta)
+            else:
+                patron_like = '%' + os.sep + _like_glob(consulta)
+            fragmentos = re.split(r'[*?]|\[.+?\]', consulta)
+            patron = consulta.casefold()
+            coincide = lambda texto: fnmatch.fnmatchcase(texto, patron)
+        else:
+            patron_like = '%' + _like_literal(consulta) + '%'
+            fragmentos = [consulta]
+            subcadena = consulta.casefold()
+            coincide = lambda texto: subcadena in texto
+        # Cada fragmento literal de 3 o más caracteres es una frase de trigramas que el índice resuelve sin recorrer nada
+        if prefijo and os.path.basename(raiz):
+            # Acota también al árbol: sus rutas contienen "/<nombre de la raíz>/"
+            fragmentos.append(os.sep + os.path.basename(raiz) + os.sep)
+        frases = ['"' + fragmento.replace('"', '""') + '"' for fragmento in fragmentos if len(fragmento) >= 3]
+        columnas = "a.ruta, a.tamanio, a.mtime_ns, a.inodo, a.extension, a.digest, a.ancho, a.alto"
+        if self._busqueda_indexada and frases:
+            # CROSS JOIN fija el orden: primero el índice y después la tabla
+            sql = f"""SELECT {columnas} FROM busqueda CROSS JOIN archivos a ON a.rowid = busqueda.rowid
+                      WHERE busqueda MATCH ?{condicion}"""
+            parametros.insert(0, ' AND '.join(frases))
+        else:
+            sql = f"SELECT {columnas} FROM archivos a WHERE a.es_dir = 0 AND a.ruta LIKE ?{condicion}"
+            parametros.insert(0, patron_like)
+        resultados = []
+        with self._bloqueo:
+            for fila in self._conexion.execute(sql, parametros):
+                relativa = fila[0][len(prefijo):]
+                if coincide((relativa if por_ruta else os.path.basename(relativa)).casefold()):
+                    resultados.append(EntradaCatalogo(*fila))
+                    if len(resultados) >= limite:
+                        break
+        resultados.sort(key=lambda entrada: entrada.ruta)
+        return resultados
+
+    def registrar(self, ruta_archivo: str, dimensiones: Optional[tuple[int, int]] = None):
+        """
+        Añade o actualiza un archivo que acaba de escribir una herramienta (p. ej. una imagen convertida),
+        con sus dimensiones si se conocen. Los cambios se confirman con `confirmar`.
+        """
+        ruta = os.path.abspath(ruta_archivo)
+        try:
+            estado = os.stat(ruta)
+        except OSError as e:
+            logger.warning(f"No se pudo catalogar {ruta}: {e}")
+            return
+        ancho, alto = dimensiones if dimensiones else (None, None)
+        with self._bloqueo:
+            self._conexion.execute(
+                """INSERT OR REPLACE INTO archivos (ruta, directorio, es_dir, tamanio, mtime_ns, inodo, extension, ancho, alto)
+                   VALUES (?, ?, 0, ?, ?, ?, ?, ?, ?)""",
+                (ruta, os.path.dirname(ruta), estado.st_size, estado.st_mtime_ns, estado.st_ino,
+                 os.path.splitext(ruta)[1].lower(), ancho, alto)
+            )
+
+    def guardar_metadatos(self, ruta_archivo: str, estado: Optional[os.stat_result] = None, digest: Optional[str] = None,
+                          dimensiones: Optional[tuple[int, int]] = None):
+        """
+        Guarda el hash y/o las dimensiones de un archivo catalogado. Los cambios se confirman con `confirmar`.
+
+        Args:
+            ruta_archivo (str): La ruta del archivo.
+            estado (os.stat_result, optional): Estado actual del archivo. Si no coincide con el catalogado,
+                                               se actualiza y se descartan los metadatos anteriores.
+            digest (str, optional): Hash del contenido, como "algoritmo:hex".
+            dimensiones (tuple[int, int], optional): (ancho, alto) en píxeles.
+        """
+        ruta = os.path.abspath(ruta_archivo)
+        with self._bloqueo:
+            fila = self._conexion.execute(
+                "SELECT tamanio, mtime_ns, inodo, digest, ancho, alto FROM archivos WHERE ruta = ? AND es_dir = 0", (ruta,)
+            ).fetchone()
+            if fila is None:
+                return
+            tamanio, mtime_ns, inodo, digest_previo, ancho, alto = fila
+            if estado is not None and (tamanio, mtime_ns, inodo) != (estado.st_size, estado.st_mtime_ns, estado.st_ino):
+                tamanio, mtime_ns, inodo = estado.st_size, estado.st_mtime_ns, estado.st_ino
+                digest_previo, ancho, alto = None, None, None
+            if dimensiones:
+                ancho, alto = dimensiones
+            self._conexion.execute(
+                "UPDATE archivos SET tamanio = ?, mtime_ns = ?, inodo = ?, digest = ?, ancho = ?, alto = ? WHERE ruta = ?",
+                (tamanio, mtime_ns, inodo, digest or digest_previo, ancho, alto, ruta)
+            )
+
+    def registrar_movimientos(self, movimientos: list[tuple[str, str]]):
+        """
+        Traslada en el catálogo los archivos movidos o renombrados (ruta_origen, ruta_destino), conservando
+        su hash y sus dimensiones. Los directorios afectados se vuelven a listar en la próxima actualización.
+        """
+        with self._bloqueo:
+            with self._conexion:
+                for ruta_origen, ruta_destino in movimientos:
+                    ruta_origen, ruta_destino = os.path.abspath(ruta_origen), os.path.abspath(ruta_destino)
+                    self._conexion.execute("DELETE FROM archivos WHERE ruta = ?", (ruta_destino,))
+                    self._conexion.execute(
+                        "UPDATE archivos SET ruta = ?, directorio = ?, extension = ? WHERE ruta = ? AND es_dir = 0",
+                        (ruta_destino, os.path.dirname(ruta_destino), os.path.splitext(ruta_destino)[1].lower(), ruta_origen)
+                    )
+
+    def confirmar(self):
+        """Confirma en disco las escrituras pendientes."""
+        with self._bloqueo:
+            self._conexion.commit()
+
+    def invalidar(self, directorio: str = None) -> int:
+        """
+        Borra el catálogo de un árbol (o completo si no se indica), forzando a volver a listarlo.
+
+        Returns:
+            int: Número de entradas eliminadas.
+        """
+        with self._bloqueo:
+            with self._conexion:
+                if directorio is None:
+                    cursor = self._conexion.execute("DELETE FROM archivos")
+                else:
+                    raiz = os.path.abspath(directorio)
+                    desde, hasta = _rango_arbol(raiz)
+                    cursor = self._conexion.execute(
+                        "DELETE FROM archivos WHERE ruta = ? OR (ruta > ? AND ruta < ?)", (raiz, desde, hasta)
+                    )
+            return cursor.rowcount
+
+    def cerrar(self):
+        """Cierra la conexión con la base de datos."""
+        with self._bloqueo:
+            self._conexion.commit()
+            self._conexion.close()
@@ -9,4 +9,16 @@ DEFAULT_FOLDERS = {
 }
 
 # Ruta centralizada para el archivo de log
-LOG_FILE_PATH = './assets/file_manager.log'
\ No newline at end of file
+LOG_FILE_PATH = './assets/file_manager.log'
+
+# Base de datos SQLite con los hashes ya calculados por el buscador de duplicados
+HASH_CACHE_PATH = './assets/hash_cache.db'
+
+# Directorio de los diarios de organización (permiten reanudar y deshacer ejecuciones)
+JOURNAL_DIR = './assets/diarios'
+
+# Base de datos SQLite con las instantáneas de directorios (organización y resumen incrementales)
+SNAPSHOT_DB_PATH = './assets/instantaneas.db'
+
+# Base de datos SQLite con el catálogo de archivos compartido por todas las herramientas
+CATALOG_DB_PATH = './assets/catalogo.db'
@@ -0,0 +1,130 @@
+import os
+import logging
+
+from config import DEFAULT_FOLDERS
+
+logger = logging.getLogger(__name__)
+
+# Extensiones cuyo hash puede ignorar los metadatos (etiquetas de audio, segmentos APPn de JPEG)
+EXTENSIONES_AUDIO = {f".{ext}" for ext in DEFAULT_FOLDERS['Music']}
+EXTENSIONES_JPEG = {'.jpg', '.jpeg'}
+EXTENSIONES_CONTENIDO = EXTENSIONES_AUDIO | {f".{ext}" for ext in DEFAULT_FOLDERS['Photos']}
+
+def es_archivo_multimedia(ruta_archivo: str) -> bool:
+    """Indica si el archivo es de música o foto según las extensiones de config.DEFAULT_FOLDERS."""
+    return os.path.splitext(ruta_archivo)[1].lower() in EXTENSIONES_CONTENIDO
+
+def _entero_syncsafe(datos: bytes) -> int:
+    """Decodifica un entero "syncsafe" de ID3v2 (7 bits útiles por byte)."""
+    valor = 0
+    for byte in datos:
+        valor = (valor << 7) | (byte & 0x7F)
+    return valor
+
+def _rangos_audio(f, tamanio: int) -> list[tuple[int, int]]:
+    """
+    Excluye las etiquetas ID3v2 del principio y las etiquetas APEv2 e ID3v1 del final,
+    leyendo solo sus cabeceras.
+    """
+    inicio = 0
+    # Puede haber varias etiquetas ID3v2 seguidas
+    while True:
+        f.seek(inicio)
+        cabecera = f.read(10)
+        if (len(cabecera) < 10 or cabecera[:3] != b'ID3' or cabecera[3] == 0xFF
+                or any(byte >= 0x80 for byte in cabecera[6:10])):
+            break
+        longitud = 10 + _entero_syncsafe(cabecera[6:10]) + (10 if cabecera[5] & 0x10 else 0)
+        if inicio + longitud > tamanio:
+            break
+        inicio += longitud
+
+    fin = tamanio
+    if fin - inicio >= 128:
+        f.seek(fin - 128)
+        if f.read(3) == b'TAG':
+            fin -= 128
+    if fin - inicio >= 32:
+        f.seek(fin - 32)
+        pie = f.read(32)
+        if pie[:8] == b'APETAGEX':
+            longitud = int.from_bytes(pie[12:16], 'little')
+            banderas = int.from_bytes(pie[20:24], 'little')
+            # El tamaño incluye el pie pero no la cabecera opcional de 32 bytes
+            longitud += 32 if banderas & 0x80000000 else 0
+            if longitud <= fin - inicio:
+                fin -= longitud
+    return [(inicio, fin - inicio)]
+
+def _rangos_jpeg(f, tamanio: int) -> list[tuple[int, int]]:
+    """
+    Recorre los segmentos de un JPEG hasta el inicio de los datos de imagen (SOS) y excluye
+    los segmentos APP0-APP15 (JFIF, EXIF, XMP, ICC...) y COM. Si el archivo no tiene
+    la estructura esperada se devuelve el archivo completo.
+    """
+    completo = [(0, tamanio)]
+    f.seek(0)
+    if f.read(2) != b'\xff\xd8':
+        return completo
+    rangos = [(0, 2)]
+    posicion = 2
+    while posicion + 4 <= tamanio:
+        f.seek(posicion)
+        cabecera = f.read(4)
+        if cabecera[0] != 0xFF:
+            return completo
+        marcador = cabecera[1]
+        if marcador == 0xFF:
+            # Byte de relleno entre segmentos
+            posicion += 1
+            continue
+        if marcador == 0xDA:
+            # Desde SOS hasta el final son los datos comprimidos de la imagen
+            rangos.append((posicion, tamanio - posicion))
+            return _fusionar_rangos(rangos)
+        if marcador == 0x01 or 0xD0 <= marcador <= 0xD8:
+            # Marcadores sin longitud
+            rangos.append((posicion, 2))
+            posicion += 2
+            continue
+        longitud = 2 + int.from_bytes(cabecera[2:4], 'big')
+        if not (0xE0 <= marcador <= 0xEF or marcador == 0xFE):
+            rangos.append((posicion, longitud))
+        posicion += longitud
+    return completo
+
+def _fusionar_rangos(rangos: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Une los rangos contiguos para reducir el número de lecturas."""
+    fusionados = []
+    for inicio, longitud in rangos:
+        if fusionados and fusionados[-1][0] + fusionados[-1][1] == inicio:
+            fusionados[-1] = (fusionados[-1][0], fusionados[-1][1] + longitud)
+        else:
+            fusionados.append((inicio, longitud))
+    return fusionados
+
+def obtener_rangos_contenido(f, ruta_archivo: str, tamanio: int) -> list[tuple[int, int]]:
+    """
+    Calcula qué zonas de un archivo son contenido (audio o imagen) y no metadatos, leyendo solo cabeceras.
+
+    Args:
+        f: El archivo abierto en modo binario.
+        ruta_archivo (str): La ruta del archivo (se usa su extensión para elegir el analizador).
+        tamanio (int): Tamaño del archivo en bytes.
+    Returns:
+        list[tuple[int, int]]: Lista ordenada de rangos (desplazamiento, longitud) que forman el contenido.
+    """
+    extension = os.path.splitext(ruta_archivo)[1].lower()
+    try:
+        if extension in EXTENSIONES_AUDIO:
+            return _rangos_audio(f, tamanio)
+        if extension in EXTENSIONES_JPEG:
+            return _rangos_jpeg(f, tamanio)
+    except OSError as e:
+        logger.warning(f"No se pudieron analizar los metadatos de {ruta_archivo}: {e}")
+    return [(0, tamanio)]
+
+def calcular_tamanio_contenido(ruta_archivo: str, tamanio: int) -> int:
+    """Devuelve el número de bytes de contenido (sin metadatos) de un archivo multimedia."""
+    with open(ruta_archivo, 'rb') as f:
+        return sum(longitud for _, longitud in obtener_rangos_contenido(f, ruta_archivo, tamanio))
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Optional
+
+from config import JOURNAL_DIR
+
+logger = logging.getLogger(__name__)
+
+# Se fuerza fsync tras este número de registros o este número de segundos, lo que ocurra antes
+REGISTROS_POR_SINCRONIZACION = 500
+SEGUNDOS_POR_SINCRONIZACION = 2.0
+
+def ruta_diario(dir_origen: str, directorio_diarios: str = JOURNAL_DIR) -> str:
+    """Ruta del diario de organización asociado a un directorio (uno por directorio de origen)."""
+    clave = hashlib.sha1(os.path.abspath(dir_origen).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directorio_diarios, f"organizar_{clave}.jsonl")
+
+class DiarioMovimientos:
+    """
+    Diario de solo adición (JSON Lines) de una ejecución de organización.
+
+    Registros: "inicio", un "plan" por movimiento, "hecho" por cada movimiento completado, "fin"
+    al terminar, y "revertido"/"revertido_fin" al deshacer. Cada lote del plan se sincroniza con fsync
+    antes de mover sus archivos; los registros "hecho" se sincronizan por lotes. Es seguro usarlo
+    desde varios hilos.
+    """
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        self._archivo = open(ruta, 'a', encoding='utf-8')
+        self._cerrojo = threading.Lock()
+        self._sin_sincronizar = 0
+        self._ultima_sincronizacion = time.monotonic()
+
+    def _escribir(self, registro: dict):
+        self._archivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        self._sin_sincronizar += 1
+        if (self._sin_sincronizar >= REGISTROS_POR_SINCRONIZACION
+                or time.monotonic() - self._ultima_sincronizacion >= SEGUNDOS_POR_SINCRONIZACION):
+            self._sincronizar()
+
+    def _sincronizar(self):
+        self._archivo.flush()
+        os.fsync(self._archivo.fileno())
+        self._sin_sincronizar = 0
+        self._ultima_sincronizacion = time.monotonic()
+
+    def iniciar(self, dir_origen: str, movimientos: list[tuple[str, str]] = ()):
+        """Escribe la cabecera y el plan (si ya se conoce), y lo sincroniza antes de empezar a mover."""
+        with self._cerrojo:
+            self._escribir({"t": "inicio", "origen": os.path.abspath(dir_origen),
+                            "fecha": datetime.now().isoformat(timespec='seconds')})
+        self.planificar(movimientos)
+
+    def planificar(self, movimientos: list[tuple[str, str]]):
+        """Añade movimientos al plan y sincroniza. Debe llamarse antes de ejecutarlos."""
+        with self._cerrojo:
+            for ruta_origen, ruta_destino in movimientos:
+                self._escribir({"t": "plan", "o": ruta_origen, "d": ruta_destino})
+            self._sincronizar()
+
+    def registrar(self, tipo: str, indice: int):
+        """Registra un movimiento completado ("hecho") o revertido ("revertido") por su índice en el plan."""
+        with self._cerrojo:
+            self._escribir({"t": tipo, "i": indice})
+
+    def finalizar(self, tipo: str = "fin"):
+        """Escribe el registro final ("fin" o "revertido_fin") y sincroniza."""
+        with self._cerrojo:
+            self._escribir({"t": tipo})
+            self._sincronizar()
+
+    def cerrar(self):
+        with self._cerrojo:
+            if not self._archivo.closed:
+                self._sincronizar()
+                self._archivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.cerrar()
+
+def cargar_diario(ruta: str) -> Optional[dict]:
+    """
+    Lee un diario y reconstruye el estado de la ejecución.
+    Una última línea incompleta (escritura interrumpida) se ignora.
+
+    Returns:
+        dict | None: {"origen", "fecha", "movimientos", "hechos", "revertidos", "finalizado", "revertido"}
+                     o None si no hay diario.
+    """
+    if not os.path.isfile(ruta):
+        return None
+    estado = {"origen": None, "fecha": None, "movimientos": [], "hechos": set(), "revertidos": set(),
+              "finalizado": False, "revertido": False}
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+            except json.JSONDecodeError:
+                logger.warning(f"Línea incompleta ignorada en el diario {ruta}")
+                continue
+            tipo = registro.get("t")
+            if tipo == "inicio":
+                estado["origen"] = registro.get("origen")
+                estado["fecha"] = registro.get("fecha")
+            elif tipo == "plan":
+                estado["movimientos"].append((registro["o"], registro["d"]))
+            elif tipo == "hecho":
+                estado["hechos"].add(registro["i"])
+            elif tipo == "revertido":
+                estado["revertidos"].add(registro["i"])
+            elif tipo == "fin":
+                estado["finalizado"] = True
+            elif tipo == "revertido_fin":
+                estado["revertido"] = True
+    return estado
+
+def obtener_ejecucion_pendiente(dir_origen: str, directorio_diarios: str = JOURNAL_DIR) -> Optional[dict]:
+    """Devuelve el estado de la última ejecución del directorio si quedó a medias, o None."""
+    estado = cargar_diario(ruta_diario(dir_origen, directorio_diarios))
+    if estado and estado["movimientos"] and not estado["finalizado"] and not estado["revertido"]:
+        return estado
+    return None
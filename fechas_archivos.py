@@ -0,0 +1,110 @@
+import os
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Formatos de los que Pillow lee el EXIF sin complementos adicionales
+EXTENSIONES_EXIF = ('.jpg', '.jpeg', '.tif', '.tiff', '.webp', '.png')
+
+# Etiquetas EXIF: subdirectorio Exif, DateTimeOriginal (dentro de él) y DateTime (IFD0)
+_ETIQUETA_IFD_EXIF = 0x8769
+_ETIQUETA_FECHA_ORIGINAL = 36867
+_ETIQUETA_FECHA = 306
+
+# Máximo de entradas en la caché de fechas (por inodo)
+MAX_ENTRADAS_CACHE = 100_000
+
+def leer_fecha_exif(ruta_archivo: str) -> Optional[datetime]:
+    """
+    Lee la fecha de captura (DateTimeOriginal, o DateTime si no existe) del EXIF de una imagen.
+    Image.open solo analiza la cabecera: los píxeles no se decodifican.
+
+    Args:
+        ruta_archivo (str): La ruta de la imagen.
+    Returns:
+        datetime | None: La fecha de captura, o None si la imagen no la tiene o no se puede leer.
+    """
+    try:
+        with Image.open(ruta_archivo) as img:
+            if img.format == 'PNG':
+                # PngImageFile.getexif() decodifica la imagen entera si no hay un chunk eXIf antes de IDAT:
+                # solo se usa el que ya se ha leído con la cabecera
+                exif = Image.Exif()
+                if img.info.get("exif"):
+                    exif.load(img.info["exif"])
+            else:
+                exif = img.getexif()
+            texto = exif.get_ifd(_ETIQUETA_IFD_EXIF).get(_ETIQUETA_FECHA_ORIGINAL) or exif.get(_ETIQUETA_FECHA)
+    except Exception as e:
+        logger.debug(f"No se pudo leer el EXIF de {ruta_archivo}: {e}")
+        return None
+    if not texto:
+        return None
+    try:
+        return datetime.strptime(str(texto).strip('\x00 ')[:19], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+
+def subcarpeta_fecha(anio: int, mes: int) -> str:
+    """Ruta relativa AAAA/MM de una fecha."""
+    return os.path.join(f"{anio:04d}", f"{mes:02d}")
+
+class LectorFechas:
+    """
+    Obtiene el año y el mes de cada archivo: la fecha de captura EXIF en las imágenes y la fecha
+    de modificación en el resto (o si la imagen no tiene EXIF). Los resultados se guardan por inodo,
+    válidos mientras no cambien el tamaño ni la fecha de modificación.
+    """
+    def __init__(self, max_concurrencia: Optional[int] = None):
+        self.max_concurrencia = max_concurrencia
+        self._cache: dict[tuple[int, int], tuple[int, int, tuple[int, int]]] = {}
+        self._bloqueo = threading.Lock()
+
+    def obtener(self, ruta_archivo: str, estado: Optional[os.stat_result] = None) -> Optional[tuple[int, int]]:
+        """
+        Devuelve (año, mes) del archivo, o None si no se puede consultar.
+
+        Args:
+            ruta_archivo (str): La ruta del archivo.
+            estado (os.stat_result, optional): Resultado de os.stat ya conocido.
+        """
+        try:
+            if estado is None:
+                estado = os.stat(ruta_archivo)
+        except OSError as e:
+            logger.warning(f"No se pudo leer la fecha de {ruta_archivo}: {e}")
+            return None
+        clave = (estado.st_dev, estado.st_ino)
+        with self._bloqueo:
+            guardado = self._cache.get(clave)
+        if guardado and guardado[:2] == (estado.st_size, estado.st_mtime_ns):
+            return guardado[2]
+        fecha = None
+        if ruta_archivo.lower().endswith(EXTENSIONES_EXIF):
+            fecha = leer_fecha_exif(ruta_archivo)
+        if fecha is None:
+            fecha = datetime.fromtimestamp(estado.st_mtime)
+        resultado = (fecha.year, fecha.month)
+        with self._bloqueo:
+            if len(self._cache) >= MAX_ENTRADAS_CACHE:
+                self._cache.clear()
+            self._cache[clave] = (estado.st_size, estado.st_mtime_ns, resultado)
+        return resultado
+
+    def obtener_lote(self, rutas_archivos: list[str]) -> dict[str, Optional[tuple[int, int]]]:
+        """
+        Obtiene en paralelo las fechas de un lote de archivos (las lecturas de EXIF se solapan).
+
+        Returns:
+            dict[str, tuple[int, int] | None]: ruta -> (año, mes).
+        """
+        if len(rutas_archivos) <= 1:
+            return {ruta: self.obtener(ruta) for ruta in rutas_archivos}
+        with ThreadPoolExecutor(max_workers=self.max_concurrencia) as ejecutor:
+            return dict(zip(rutas_archivos, ejecutor.map(self.obtener, rutas_archivos)))
@@ -0,0 +1,178 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Bytes leídos del principio de cada archivo
+BYTES_CABECERA = 64
+
+# Máximo de entradas en la caché de tipos detectados (por inodo)
+MAX_ENTRADAS_CACHE = 100_000
+
+def _patron(*partes) -> tuple:
+    """Construye un patrón a partir de bytes literales y comodines (None = cualquier byte)."""
+    patron = []
+    for parte in partes:
+        if parte is None:
+            patron.append(None)
+        elif isinstance(parte, int):
+            patron.extend([None] * parte)
+        else:
+            patron.extend(parte)
+    return tuple(patron)
+
+# Firmas (magic numbers) de los formatos de config.DEFAULT_FOLDERS -> extensión representativa.
+# Los enteros indican un número de bytes comodín. Cuando dos formatos comparten contenedor
+# (p. ej. MKV/WebM o DOCX/XLSX) se usa una extensión de la misma carpeta.
+FIRMAS = [
+    # Música
+    (_patron(b'ID3'), 'mp3'),
+    (_patron(b'\xff\xfb'), 'mp3'),
+    (_patron(b'\xff\xf3'), 'mp3'),
+    (_patron(b'\xff\xf2'), 'mp3'),
+    (_patron(b'\xff\xf1'), 'aac'),
+    (_patron(b'\xff\xf9'), 'aac'),
+    (_patron(b'fLaC'), 'flac'),
+    (_patron(b'OggS'), 'ogg'),
+    (_patron(b'RIFF', 4, b'WAVE'), 'wav'),
+    (_patron(4, b'ftypM4A '), 'aac'),
+    # Fotos
+    (_patron(b'\xff\xd8\xff'), 'jpg'),
+    (_patron(b'\x89PNG\r\n\x1a\n'), 'png'),
+    (_patron(b'GIF87a'), 'gif'),
+    (_patron(b'GIF89a'), 'gif'),
+    (_patron(b'BM', 4, b'\x00\x00\x00\x00'), 'bmp'),
+    (_patron(b'II*\x00'), 'tiff'),
+    (_patron(b'MM\x00*'), 'tiff'),
+    (_patron(b'RIFF', 4, b'WEBP'), 'webp'),
+    (_patron(4, b'ftypheic'), 'heic'),
+    (_patron(4, b'ftypheix'), 'heic'),
+    (_patron(4, b'ftypmif1'), 'heic'),
+    (_patron(b'<svg'), 'svg'),
+    (_patron(b'%!PS-Adobe-'), 'eps'),
+    (_patron(b'\xc5\xd0\xd3\xc6'), 'eps'),
+    # Documentos
+    (_patron(b'%PDF-'), 'pdf'),
+    (_patron(b'{\\rtf'), 'rtf'),
+    (_patron(b'8BPS'), 'psd'),
+    (_patron(b'PK\x03\x04', 26, b'[Content_Types].xml'), 'docx'),
+    (_patron(b'PK\x03\x04', 26, b'mimetype', 0, b'application/epub+zip'), 'epub'),
+    (_patron(b'PK\x03\x04', 26, b'mimetype', 0, b'application/vnd.oasis.opendocument'), 'odt'),
+    # Videos
+    (_patron(4, b'ftypisom'), 'mp4'),
+    (_patron(4, b'ftypiso2'), 'mp4'),
+    (_patron(4, b'ftypmp41'), 'mp4'),
+    (_patron(4, b'ftypmp42'), 'mp4'),
+    (_patron(4, b'ftypavc1'), 'mp4'),
+    (_patron(4, b'ftypM4V '), 'm4v'),
+    (_patron(4, b'ftypqt  '), 'mov'),
+    (_patron(4, b'ftyp3gp'), '3gp'),
+    (_patron(4, b'ftyp3g2'), '3gp'),
+    (_patron(b'\x1a\x45\xdf\xa3'), 'mkv'),
+    (_patron(b'RIFF', 4, b'AVI '), 'avi'),
+    (_patron(b'FLV\x01'), 'flv'),
+    (_patron(b'\x00\x00\x01\xba'), 'mpeg'),
+    (_patron(b'\x00\x00\x01\xb3'), 'mpeg'),
+    (_patron(b'\x30\x26\xb2\x75\x8e\x66\xcf\x11'), 'wmv'),
+]
+
+class _NodoTrie:
+    __slots__ = ("hijos", "comodin", "extension")
+
+    def __init__(self):
+        self.hijos = {}
+        self.comodin = None
+        self.extension = None
+
+def _construir_trie(firmas) -> _NodoTrie:
+    raiz = _NodoTrie()
+    for patron, extension in firmas:
+        nodo = raiz
+        for byte in patron:
+            if byte is None:
+                if nodo.comodin is None:
+                    nodo.comodin = _NodoTrie()
+                nodo = nodo.comodin
+            else:
+                nodo = nodo.hijos.setdefault(byte, _NodoTrie())
+        nodo.extension = extension
+    return raiz
+
+_TRIE_FIRMAS = _construir_trie(FIRMAS)
+
+def identificar_cabecera(cabecera: bytes):
+    """
+    Busca en el trie de firmas la coincidencia más larga con el principio de `cabecera`.
+    El coste depende solo de la longitud de las firmas, no de su número.
+
+    Args:
+        cabecera (bytes): Los primeros bytes del archivo.
+    Returns:
+        str: La extensión del formato detectado o None.
+    """
+    mejor = None
+    pendientes = [(_TRIE_FIRMAS, 0)]
+    while pendientes:
+        nodo, posicion = pendientes.pop()
+        if nodo.extension is not None and (mejor is None or posicion > mejor[1]):
+            mejor = (nodo.extension, posicion)
+        if posicion >= len(cabecera):
+            continue
+        hijo = nodo.hijos.get(cabecera[posicion])
+        if hijo is not None:
+            pendientes.append((hijo, posicion + 1))
+        if nodo.comodin is not None:
+            pendientes.append((nodo.comodin, posicion + 1))
+    return mejor[0] if mejor else None
+
+class DetectorFirmas:
+    """
+    Detecta el formato de un archivo por sus primeros bytes, con caché por inodo
+    (válida mientras no cambien el tamaño ni la fecha de modificación).
+    """
+    def __init__(self, max_concurrencia: Optional[int] = None):
+        self.max_concurrencia = max_concurrencia
+        self._cache: dict[tuple[int, int], tuple[int, int, str]] = {}
+        self._bloqueo = threading.Lock()
+
+    def detectar(self, ruta_archivo: str, estado: Optional[os.stat_result] = None):
+        """
+        Devuelve la extensión que corresponde al contenido del archivo, o None si no se reconoce.
+
+        Args:
+            ruta_archivo (str): La ruta del archivo.
+            estado (os.stat_result, optional): Resultado de os.stat ya conocido.
+        """
+        try:
+            if estado is None:
+                estado = os.stat(ruta_archivo)
+            clave = (estado.st_dev, estado.st_ino)
+            with self._bloqueo:
+                guardado = self._cache.get(clave)
+            if guardado and guardado[:2] == (estado.st_size, estado.st_mtime_ns):
+                return guardado[2]
+            with open(ruta_archivo, 'rb') as f:
+                extension = identificar_cabecera(f.read(BYTES_CABECERA))
+        except OSError as e:
+            logger.warning(f"No se pudo leer la cabecera de {ruta_archivo}: {e}")
+            return None
+        with self._bloqueo:
+            if len(self._cache) >= MAX_ENTRADAS_CACHE:
+                self._cache.clear()
+            self._cache[clave] = (estado.st_size, estado.st_mtime_ns, extension)
+        return extension
+
+    def detectar_lote(self, rutas_archivos: list[str]) -> dict[str, str]:
+        """
+        Detecta en paralelo el formato de un lote de archivos (las lecturas de cabecera se solapan).
+
+        Returns:
+            dict[str, str]: ruta -> extensión detectada (o None).
+        """
+        if len(rutas_archivos) <= 1:
+            return {ruta: self.detectar(ruta) for ruta in rutas_archivos}
+        with ThreadPoolExecutor(max_workers=self.max_concurrencia) as ejecutor:
+            return dict(zip(rutas_archivos, ejecutor.map(self.detectar, rutas_archivos)))
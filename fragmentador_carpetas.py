@@ -0,0 +1,233 @@
+import os
+import json
+import hashlib
+import logging
+import string
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Índice que describe cómo está fragmentada una carpeta
+NOMBRE_INDICE = ".indice_fragmentos.json"
+
+# Los fragmentos se dimensionan para quedar, de media, a esta fracción del máximo (margen para crecer)
+OCUPACION_OBJETIVO = 0.5
+
+# Máximo de caracteres hexadecimales del prefijo (16^4 = 65536 subcarpetas)
+MAX_CARACTERES_FRAGMENTO = 4
+
+_HEXADECIMALES = frozenset(string.hexdigits.lower())
+
+def fragmento_de(nombre_archivo: str, caracteres: int) -> str:
+    """Subcarpeta de fragmento de un archivo: prefijo de `caracteres` dígitos del MD5 de su nombre."""
+    return hashlib.md5(nombre_archivo.encode('utf-8', 'surrogateescape')).hexdigest()[:caracteres]
+
+def _es_fragmento(nombre: str, caracteres: Optional[int] = None) -> bool:
+    """Indica si `nombre` puede ser una subcarpeta de fragmento (de `caracteres` dígitos, o de cualquier longitud)."""
+    if caracteres is None:
+        return 0 < len(nombre) <= MAX_CARACTERES_FRAGMENTO and set(nombre) <= _HEXADECIMALES
+    return len(nombre) == caracteres and set(nombre) <= _HEXADECIMALES
+
+def cargar_indice(carpeta: str) -> Optional[dict]:
+    """
+    Lee el índice de fragmentación de una carpeta.
+
+    Returns:
+        dict | None: {"modo": "hash", "caracteres": int, "max_entradas": int} o None si no está fragmentada.
+    """
+    try:
+        with open(os.path.join(carpeta, NOMBRE_INDICE), 'r', encoding='utf-8') as f:
+            indice = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Índice de fragmentos ilegible en {carpeta}: {e}")
+        return None
+    if indice.get("modo") != "hash" or not isinstance(indice.get("caracteres"), int):
+        return None
+    return indice
+
+def guardar_indice(carpeta: str, caracteres: int, max_entradas: int):
+    """Escribe el índice de fragmentación de forma atómica (temporal + os.replace)."""
+    ruta = os.path.join(carpeta, NOMBRE_INDICE)
+    ruta_temporal = ruta + ".tmp"
+    with open(ruta_temporal, 'w', encoding='utf-8') as f:
+        json.dump({"modo": "hash", "caracteres": caracteres, "max_entradas": max_entradas}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(ruta_temporal, ruta)
+
+class UbicadorFragmentos:
+    """
+    Traduce la ruta lógica de un archivo (carpeta/nombre) a su ruta real dentro de una carpeta
+    fragmentada. El índice de cada carpeta se lee una sola vez.
+    """
+    def __init__(self):
+        self._caracteres: dict[str, int] = {}
+
+    def caracteres(self, carpeta: str) -> int:
+        """Caracteres del prefijo de fragmento de la carpeta (0 si no está fragmentada)."""
+        if carpeta not in self._caracteres:
+            indice = cargar_indice(carpeta)
+            self._caracteres[carpeta] = indice["caracteres"] if indice else 0
+        return self._caracteres[carpeta]
+
+    def ubicar(self, ruta_logica: str) -> str:
+        """Ruta en la que debe guardarse `ruta_logica` según el índice de su carpeta."""
+        carpeta, nombre_archivo = os.path.split(ruta_logica)
+        caracteres = self.caracteres(carpeta)
+        if not caracteres:
+            return ruta_logica
+        return os.path.join(carpeta, fragmento_de(nombre_archivo, caracteres), nombre_archivo)
+
+    def carpeta_logica(self, directorio: str) -> str:
+        """Carpeta lógica de un directorio: su padre si es un fragmento, o él mismo."""
+        padre, nombre = os.path.split(directorio)
+        return padre if self.caracteres(padre) and _es_fragmento(nombre) else directorio
+
+    def olvidar(self, carpeta: str):
+        self._caracteres.pop(carpeta, None)
+
+def es_archivo_indice(nombre_archivo: str) -> bool:
+    """Indica si `nombre_archivo` es el índice de fragmentos (o su temporal), que las herramientas deben ignorar."""
+    return nombre_archivo in (NOMBRE_INDICE, NOMBRE_INDICE + ".tmp")
+
+def carpetas_de_fragmentos(carpeta: str) -> list[str]:
+    """
+    Rutas de las subcarpetas de fragmento de una carpeta, o lista vacía si no está fragmentada.
+    Las herramientas que trabajan con un solo nivel de carpeta las recorren además de la carpeta
+    para ver también los archivos repartidos en fragmentos.
+    """
+    if cargar_indice(carpeta) is None:
+        return []
+    try:
+        with os.scandir(carpeta) as entradas:
+            return sorted(entrada.path for entrada in entradas
+                          if entrada.is_dir(follow_symlinks=False) and _es_fragmento(entrada.name))
+    except OSError as e:
+        logger.warning(f"No se pudieron listar los fragmentos de {carpeta}: {e}")
+        return []
+
+def listar_archivos_carpeta(carpeta: str) -> list[str]:
+    """
+    Archivos de una carpeta lógica: los suyos y, si está fragmentada, los de sus fragmentos.
+    El índice de fragmentos no se incluye.
+
+    Returns:
+        list[str]: Rutas relativas a `carpeta` ("nombre" o "fragmento/nombre").
+    """
+    relativas = []
+    for directorio in [carpeta, *carpetas_de_fragmentos(carpeta)]:
+        prefijo = os.path.relpath(directorio, carpeta) if directorio != carpeta else ""
+        try:
+            with os.scandir(directorio) as entradas:
+                relativas.extend(os.path.join(prefijo, entrada.name) if prefijo else entrada.name
+                                 for entrada in entradas if entrada.is_file() and not es_archivo_indice(entrada.name))
+        except OSError as e:
+            logger.warning(f"No se pudo listar {directorio}: {e}")
+    return relativas
+
+def _caracteres_necesarios(total: int, max_entradas: int) -> int:
+    caracteres = 1
+    while caracteres < MAX_CARACTERES_FRAGMENTO and total > max_entradas * OCUPACION_OBJETIVO * 16 ** caracteres:
+        caracteres += 1
+    return caracteres
+
+def planificar_fragmentacion(carpeta: str, max_entradas: int) -> tuple[int, list[tuple[str, str]]]:
+    """
+    Calcula los movimientos para que ninguna carpeta supere `max_entradas` archivos. Los archivos
+    sobrantes se reparten en subcarpetas deterministas según el prefijo del hash de su nombre.
+    Si algún fragmento existente quedaría por encima del máximo, se refragmenta todo con un prefijo más largo.
+    Solo se listan la carpeta y, cuando hace falta refragmentar, sus fragmentos.
+
+    Args:
+        carpeta (str): La carpeta a revisar.
+        max_entradas (int): Número máximo de archivos por carpeta.
+    Returns:
+        tuple[int, list[tuple[str, str]]]: (caracteres del prefijo, movimientos). (0, []) si no hace falta fragmentar.
+    """
+    indice = cargar_indice(carpeta)
+    caracteres = indice["caracteres"] if indice else 0
+    sueltos, fragmentos = [], []
+    try:
+        with os.scandir(carpeta) as entradas:
+            for entrada in entradas:
+                if es_archivo_indice(entrada.name):
+                    continue
+                if entrada.is_file(follow_symlinks=False):
+                    sueltos.append(entrada.name)
+                elif caracteres and entrada.is_dir(follow_symlinks=False) and _es_fragmento(entrada.name, caracteres):
+                    fragmentos.append(entrada.name)
+    except OSError as e:
+        logger.error(f"No se pudo listar {carpeta}: {e}")
+        return caracteres, []
+
+    if not caracteres:
+        if len(sueltos) <= max_entradas:
+            return 0, []
+        caracteres = _caracteres_necesarios(len(sueltos), max_entradas)
+        return caracteres, [(os.path.join(carpeta, nombre), os.path.join(carpeta, fragmento_de(nombre, caracteres), nombre))
+                            for nombre in sueltos]
+
+    # Ya fragmentada: se reparten los archivos sueltos y se comprueba que ningún fragmento se desborde
+    contenido = {fragmento: [] for fragmento in fragmentos}
+    for fragmento in fragmentos:
+        with os.scandir(os.path.join(carpeta, fragmento)) as entradas:
+            contenido[fragmento] = [entrada.name for entrada in entradas if entrada.is_file(follow_symlinks=False)]
+    llegadas = {}
+    for nombre in sueltos:
+        llegadas.setdefault(fragmento_de(nombre, caracteres), []).append(nombre)
+    desbordado = any(len(contenido.get(fragmento, ())) + len(nombres) > max_entradas for fragmento, nombres in llegadas.items())
+    desbordado = desbordado or any(len(nombres) > max_entradas for nombres in contenido.values())
+    if not desbordado or caracteres >= MAX_CARACTERES_FRAGMENTO:
+        return caracteres, [(os.path.join(carpeta, nombre), os.path.join(carpeta, fragmento, nombre))
+                            for fragmento, nombres in llegadas.items() for nombre in nombres]
+
+    total = len(sueltos) + sum(len(nombres) for nombres in contenido.values())
+    nuevos_caracteres = max(caracteres + 1, _caracteres_necesarios(total, max_entradas))
+    logger.info(f"Refragmentando {carpeta} ({total} archivos) con prefijos de {nuevos_caracteres} caracteres")
+    movimientos = [(os.path.join(carpeta, nombre), os.path.join(carpeta, fragmento_de(nombre, nuevos_caracteres), nombre))
+                   for nombre in sueltos]
+    for fragmento, nombres in contenido.items():
+        movimientos.extend((os.path.join(carpeta, fragmento, nombre),
+                            os.path.join(carpeta, fragmento_de(nombre, nuevos_caracteres), nombre)) for nombre in nombres)
+    return nuevos_caracteres, movimientos
+
+def reconstruir_indice(carpeta: str) -> int:
+    """
+    Ajusta el índice de una carpeta a los fragmentos que contienen archivos (p. ej. después de deshacer
+    una organización que la había fragmentado o refragmentado). Elimina los fragmentos vacíos y, si no
+    queda ninguno, el índice.
+
+    Returns:
+        int: Caracteres del prefijo resultante (0 si la carpeta ya no está fragmentada).
+    """
+    indice = cargar_indice(carpeta)
+    if indice is None:
+        return 0
+    archivos_por_longitud = {}
+    try:
+        with os.scandir(carpeta) as entradas:
+            fragmentos = [entrada.name for entrada in entradas
+                          if entrada.is_dir(follow_symlinks=False) and _es_fragmento(entrada.name)]
+    except OSError as e:
+        logger.error(f"No se pudo listar {carpeta}: {e}")
+        return indice["caracteres"]
+    for fragmento in fragmentos:
+        ruta_fragmento = os.path.join(carpeta, fragmento)
+        try:
+            os.rmdir(ruta_fragmento)
+            continue
+        except OSError:
+            pass
+        with os.scandir(ruta_fragmento) as entradas:
+            archivos = sum(1 for entrada in entradas if entrada.is_file(follow_symlinks=False))
+        archivos_por_longitud[len(fragmento)] = archivos_por_longitud.get(len(fragmento), 0) + archivos
+    if not archivos_por_longitud:
+        os.remove(os.path.join(carpeta, NOMBRE_INDICE))
+        logger.info(f"{carpeta} ya no está fragmentada")
+        return 0
+    caracteres = max(archivos_por_longitud, key=archivos_por_longitud.get)
+    if caracteres != indice["caracteres"]:
+        guardar_indice(carpeta, caracteres, indice.get("max_entradas", 0))
+    return caracteres
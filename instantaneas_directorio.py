@@ -0,0 +1,290 @@
+import os
+import sqlite3
+import logging
+import threading
+from collections import namedtuple
+
+from config import SNAPSHOT_DB_PATH
+from resumen_directorio import ResumenDirectorio, MAX_ARCHIVOS_MAYORES, INODO_SIN_COSTE
+
+logger = logging.getLogger(__name__)
+
+# Resultado de comparar el estado actual de un directorio con su instantánea anterior.
+# nuevos, modificados y eliminados: dict ruta_relativa -> (tamanio, mtime_ns) (para eliminados, los valores anteriores).
+DiferenciaInstantanea = namedtuple(
+    "DiferenciaInstantanea",
+    ["nuevos", "modificados", "eliminados", "es_primera", "directorios_listados"]
+)
+
+class InstantaneasDirectorio:
+    """
+    Instantáneas persistentes en SQLite del contenido de directorios (nombres, tamaños y mtimes).
+
+    Cada instantánea se identifica por (raiz, ambito), para que varias herramientas puedan seguir el
+    mismo directorio por separado. Al actualizarla solo se listan los directorios cuyo mtime ha cambiado
+    (es decir, en los que se han creado, borrado o renombrado entradas); el resto se toma de la instantánea.
+    Junto a cada instantánea se mantiene el resumen de bytes por extensión, que se ajusta con la diferencia.
+
+    Un archivo reescrito en el mismo sitio sin cambiar su directorio no se detecta hasta que se invalida
+    la instantánea.
+    """
+    def __init__(self, ruta_bd: str = SNAPSHOT_DB_PATH):
+        directorio_bd = os.path.dirname(ruta_bd)
+        if directorio_bd:
+            os.makedirs(directorio_bd, exist_ok=True)
+        self._bloqueo = threading.Lock()
+        self._conexion = sqlite3.connect(ruta_bd, check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.executescript(
+            """CREATE TABLE IF NOT EXISTS entradas (
+                raiz TEXT NOT NULL,
+                ambito TEXT NOT NULL,
+                ruta TEXT NOT NULL,
+                es_dir INTEGER NOT NULL,
+                tamanio INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                PRIMARY KEY (raiz, ambito, ruta)
+            );
+            CREATE TABLE IF NOT EXISTS resumenes (
+                raiz TEXT NOT NULL,
+                ambito TEXT NOT NULL,
+                extension TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                archivos INTEGER NOT NULL,
+                PRIMARY KEY (raiz, ambito, extension)
+            );
+            CREATE TABLE IF NOT EXISTS configuraciones (
+                raiz TEXT NOT NULL,
+                ambito TEXT NOT NULL,
+                firma TEXT NOT NULL,
+                PRIMARY KEY (raiz, ambito)
+            );
+            CREATE INDEX IF NOT EXISTS entradas_por_tamanio ON entradas (raiz, ambito, es_dir, tamanio);"""
+        )
+        self._conexion.commit()
+
+    def _cargar(self, raiz: str, ambito: str) -> dict[str, tuple[int, int, int]]:
+        filas = self._conexion.execute(
+            "SELECT ruta, es_dir, tamanio, mtime_ns FROM entradas WHERE raiz = ? AND ambito = ?", (raiz, ambito)
+        )
+        return {ruta: (es_dir, tamanio, mtime_ns) for ruta, es_dir, tamanio, mtime_ns in filas}
+
+    def actualizar(self, directorio: str, ambito: str = "resumen", profundidad_maxima: int = None,
+                   carpetas_omitidas=(), estados_conocidos: dict = None) -> DiferenciaInstantanea:
+        """
+        Compara el directorio con su instantánea, guarda la nueva y devuelve la diferencia.
+
+        Args:
+            directorio (str): El directorio raíz (se recorre recursivamente).
+            ambito (str): Nombre de la instantánea ("resumen", "organizar"...).
+            profundidad_maxima (int, optional): Niveles de subcarpetas a recorrer (0 = solo el primer nivel).
+            carpetas_omitidas (iterable[str]): Nombres de carpetas del primer nivel que no se recorren.
+            estados_conocidos (dict, optional): (st_dev, inodo) -> (tamaño, mtime_ns) de archivos ya consultados
+                                                (ver resumen_directorio); no se vuelven a consultar.
+        Returns:
+            DiferenciaInstantanea: Archivos nuevos, modificados y eliminados desde la instantánea anterior.
+        """
+        raiz = os.path.abspath(directorio)
+        if not INODO_SIN_COSTE:
+            estados_conocidos = None
+        with self._bloqueo:
+            previo = self._cargar(raiz, ambito)
+        hijos_previos = {}
+        for ruta in previo:
+            if ruta:
+                hijos_previos.setdefault(ruta.rpartition(os.sep)[0], []).append(ruta)
+
+        carpetas_omitidas = set(carpetas_omitidas)
+
+        def recorrer_subdirectorio(relativa, profundidad):
+            if profundidad_maxima is not None and profundidad > profundidad_maxima:
+                return False
+            return not (profundidad == 1 and relativa in carpetas_omitidas)
+
+        actual = {}
+        directorios_listados = 0
+        pendientes = [("", 0)]
+        while pendientes:
+            relativa, profundidad = pendientes.pop()
+            ruta_absoluta = os.path.join(raiz, relativa) if relativa else raiz
+            try:
+                estado_directorio = os.stat(ruta_absoluta)
+            except OSError as e:
+                logger.warning(f"No se pudo consultar el directorio {ruta_absoluta}: {e}")
+                continue
+            mtime_directorio = estado_directorio.st_mtime_ns
+            actual[relativa] = (1, 0, mtime_directorio)
+            anterior = previo.get(relativa)
+            if anterior and anterior[0] == 1 and anterior[2] == mtime_directorio:
+                # Sin altas ni bajas en este directorio: sus entradas son las de la instantánea
+                for hijo in hijos_previos.get(relativa, ()):
+                    if previo[hijo][0]:
+                        if recorrer_subdirectorio(hijo, profundidad + 1):
+                            pendientes.append((hijo, profundidad + 1))
+                    else:
+                        actual[hijo] = previo[hijo]
+                continue
+            directorios_listados += 1
+            try:
+                with os.scandir(ruta_absoluta) as entradas:
+                    for entrada in entradas:
+                        hijo = os.path.join(relativa, entrada.name) if relativa else entrada.name
+                        try:
+                            if entrada.is_dir(follow_symlinks=False):
+                                if recorrer_subdirectorio(hijo, profundidad + 1):
+                                    pendientes.append((hijo, profundidad + 1))
+                            elif entrada.is_file():
+                                conocido = estados_conocidos.get((estado_directorio.st_dev, entrada.inode())) if estados_conocidos else None
+                                if conocido is None:
+                                    estado = entrada.stat()
+                                    conocido = (estado.st_size, estado.st_mtime_ns)
+                                actual[hijo] = (0, *conocido)
+                        except OSError as e:
+                            logger.warning(f"No se pudo consultar {entrada.path}: {e}")
+            except OSError as e:
+                logger.warning(f"No se pudo leer el directorio {ruta_absoluta}: {e}")
+
+        nuevos, modificados, eliminados = {}, {}, {}
+        for ruta, datos in actual.items():
+            anterior = previo.get(ruta)
+            if datos[0]:
+                continue
+            if anterior is None or anterior[0]:
+                nuevos[ruta] = datos[1:]
+            elif anterior != datos:
+                modificados[ruta] = datos[1:]
+        for ruta, datos in previo.items():
+            if not datos[0] and (ruta not in actual or actual[ruta][0]):
+                eliminados[ruta] = datos[1:]
+
+        self._guardar_diferencia(raiz, ambito, previo, actual, nuevos, modificados, eliminados)
+        logger.info(f"Instantánea '{ambito}' de {raiz}: {directorios_listados} directorios listados, "
+                    f"{len(nuevos)} nuevos, {len(modificados)} modificados, {len(eliminados)} eliminados")
+        return DiferenciaInstantanea(nuevos, modificados, eliminados, not previo, directorios_listados)
+
+    def _guardar_diferencia(self, raiz, ambito, previo, actual, nuevos, modificados, eliminados):
+        borrar = [(raiz, ambito, ruta) for ruta in previo if ruta not in actual]
+        escribir = [(raiz, ambito, ruta, *datos) for ruta, datos in actual.items() if previo.get(ruta) != datos]
+        ajustes = {}
+        for ruta, (tamanio, _) in nuevos.items():
+            extension = os.path.splitext(ruta)[1].lower()
+            bytes_ext, archivos_ext = ajustes.get(extension, (0, 0))
+            ajustes[extension] = (bytes_ext + tamanio, archivos_ext + 1)
+        for ruta, (tamanio, _) in modificados.items():
+            extension = os.path.splitext(ruta)[1].lower()
+            bytes_ext, archivos_ext = ajustes.get(extension, (0, 0))
+            ajustes[extension] = (bytes_ext + tamanio - previo[ruta][1], archivos_ext)
+        for ruta, (tamanio, _) in eliminados.items():
+            extension = os.path.splitext(ruta)[1].lower()
+            bytes_ext, archivos_ext = ajustes.get(extension, (0, 0))
+            ajustes[extension] = (bytes_ext - tamanio, archivos_ext - 1)
+
+        with self._bloqueo:
+            with self._conexion:
+                self._conexion.executemany("DELETE FROM entradas WHERE raiz = ? AND ambito = ? AND ruta = ?", borrar)
+                self._conexion.executemany(
+                    "INSERT OR REPLACE INTO entradas (raiz, ambito, ruta, es_dir, tamanio, mtime_ns) VALUES (?, ?, ?, ?, ?, ?)",
+                    escribir
+                )
+                for extension, (bytes_ext, archivos_ext) in ajustes.items():
+                    self._conexion.execute(
+                        """INSERT INTO resumenes (raiz, ambito, extension, bytes, archivos) VALUES (?, ?, ?, ?, ?)
+                           ON CONFLICT (raiz, ambito, extension)
+                           DO UPDATE SET bytes = bytes + excluded.bytes, archivos = archivos + excluded.archivos""",
+                        (raiz, ambito, extension, bytes_ext, archivos_ext)
+                    )
+                self._conexion.execute(
+                    "DELETE FROM resumenes WHERE raiz = ? AND ambito = ? AND archivos <= 0", (raiz, ambito)
+                )
+
+    def obtener_resumen(self, directorio: str, ambito: str = "resumen") -> dict[str, int]:
+        """Devuelve el resumen guardado de la instantánea: extensión -> bytes totales."""
+        with self._bloqueo:
+            filas = self._conexion.execute(
+                "SELECT extension, bytes FROM resumenes WHERE raiz = ? AND ambito = ?",
+                (os.path.abspath(directorio), ambito)
+            ).fetchall()
+        return dict(filas)
+
+    def obtener_detalle(self, directorio: str, ambito: str = "resumen",
+                        max_mayores: int = MAX_ARCHIVOS_MAYORES) -> ResumenDirectorio:
+        """Devuelve el resumen guardado con número de archivos por extensión y los archivos más grandes."""
+        raiz = os.path.abspath(directorio)
+        with self._bloqueo:
+            filas = self._conexion.execute(
+                "SELECT extension, bytes, archivos FROM resumenes WHERE raiz = ? AND ambito = ?", (raiz, ambito)
+            ).fetchall()
+            mayores = self._conexion.execute(
+                """SELECT tamanio, ruta FROM entradas WHERE raiz = ? AND ambito = ? AND es_dir = 0
+                   ORDER BY tamanio DESC LIMIT ?""",
+                (raiz, ambito, max_mayores)
+            ).fetchall()
+        bytes_por_extension = {extension: bytes_ext for extension, bytes_ext, _ in filas}
+        archivos_por_extension = {extension: archivos for extension, _, archivos in filas}
+        return ResumenDirectorio(bytes_por_extension, archivos_por_extension,
+                                 [(tamanio, os.path.join(raiz, ruta)) for tamanio, ruta in mayores],
+                                 sum(archivos_por_extension.values()), sum(bytes_por_extension.values()))
+
+    def olvidar(self, directorio: str, ambito: str, rutas_relativas: list[str]):
+        """
+        Quita entradas de la instantánea para que la próxima actualización las considere nuevas
+        (p. ej. archivos que no se pudieron mover). El resumen no se modifica.
+        """
+        raiz = os.path.abspath(directorio)
+        with self._bloqueo:
+            with self._conexion:
+                self._conexion.executemany(
+                    "DELETE FROM entradas WHERE raiz = ? AND ambito = ? AND ruta = ?",
+                    [(raiz, ambito, ruta) for ruta in rutas_relativas]
+                )
+                # El directorio que los contiene debe volver a listarse
+                self._conexion.executemany(
+                    "UPDATE entradas SET mtime_ns = -1 WHERE raiz = ? AND ambito = ? AND ruta = ?",
+                    [(raiz, ambito, ruta.rpartition(os.sep)[0]) for ruta in rutas_relativas]
+                )
+
+    def obtener_firma(self, directorio: str, ambito: str):
+        """Firma de la configuración con la que se procesó la instantánea, o None."""
+        with self._bloqueo:
+            fila = self._conexion.execute(
+                "SELECT firma FROM configuraciones WHERE raiz = ? AND ambito = ?", (os.path.abspath(directorio), ambito)
+            ).fetchone()
+        return fila[0] if fila else None
+
+    def guardar_firma(self, directorio: str, ambito: str, firma):
+        """Guarda (o borra, si es None) la firma de la configuración asociada a la instantánea."""
+        raiz = os.path.abspath(directorio)
+        with self._bloqueo:
+            with self._conexion:
+                if firma is None:
+                    self._conexion.execute("DELETE FROM configuraciones WHERE raiz = ? AND ambito = ?", (raiz, ambito))
+                else:
+                    self._conexion.execute(
+                        "INSERT OR REPLACE INTO configuraciones (raiz, ambito, firma) VALUES (?, ?, ?)", (raiz, ambito, firma)
+                    )
+
+    def invalidar(self, directorio: str = None) -> int:
+        """
+        Borra las instantáneas de un directorio (o todas si no se indica), forzando un recorrido completo.
+
+        Returns:
+            int: Número de entradas eliminadas.
+        """
+        with self._bloqueo:
+            with self._conexion:
+                if directorio is None:
+                    cursor = self._conexion.execute("DELETE FROM entradas")
+                    self._conexion.execute("DELETE FROM resumenes")
+                    self._conexion.execute("DELETE FROM configuraciones")
+                else:
+                    raiz = os.path.abspath(directorio)
+                    cursor = self._conexion.execute("DELETE FROM entradas WHERE raiz = ?", (raiz,))
+                    self._conexion.execute("DELETE FROM resumenes WHERE raiz = ?", (raiz,))
+                    self._conexion.execute("DELETE FROM configuraciones WHERE raiz = ?", (raiz,))
+            return cursor.rowcount
+
+    def cerrar(self):
+        """Cierra la conexión con la base de datos."""
+        with self._bloqueo:
+            self._conexion.close()
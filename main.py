@@ -3,12 +3,12 @@ import shutil
 import logging
 from datetime import datetime
 import flet as ft
-import matplotlib.pyplot as plt
 import numpy as np
 import io
 import base64
 import hashlib
 import asyncio
+import time
 from PIL import Image 
 import subprocess
 import logging
@@ -22,15 +22,40 @@ from config import DEFAULT_FOLDERS, LOG_FILE_PATH
 # Importar las funciones de los módulos existentes
 from organizador_archivos import (
     obtener_carpetas_configuradas,
+    interpretar_criterios,
+    compilar_reglas,
     organizar_archivos_en_directorio,
-    resumir_archivos_directorio,
+    previsualizar_organizacion,
+    formatear_texto_previsualizacion,
+    deshacer_ultima_organizacion,
+    obtener_resumen_directorio,
+    tamanios_en_mb,
     formatear_texto_resumen,
-    generar_grafico_resumen,
+    calcular_secciones_grafico,
+    exportar_grafico_resumen,
+    PALETA_GRAFICO,
 )
 from buscador_duplicados import (
-    encontrar_archivos_duplicados,
+    iterar_archivos_duplicados,
     eliminar_archivos,
+    reemplazar_por_enlaces,
+    agrupar_directorios_duplicados,
+    dividir_ruta_zip,
+    CONCURRENCIA_POR_DEFECTO,
+    ALGORITMOS_HASH,
 )
+from cache_hashes import CacheHashes
+from firmas_archivos import DetectorFirmas
+from fechas_archivos import LectorFechas
+from buscador_similares import (
+    encontrar_imagenes_similares,
+    METODOS_HUELLA,
+)
+from vigilante_carpetas import VigilanteCarpeta
+from instantaneas_directorio import InstantaneasDirectorio
+from catalogo_archivos import CatalogoArchivos, MAX_RESULTADOS_BUSQUEDA
+from fragmentador_carpetas import UbicadorFragmentos
+from resumen_directorio import iterar_resumen_directorio, hijos_directorio, calcular_treemap
 from procesador_imagenes import (
     redimensionar_imagenes,
     convertir_imagenes_formato
@@ -75,11 +100,19 @@ configurar_logging()
 
 logger = logging.getLogger(__name__)
 
-plt.switch_backend('Agg')
-
 ANCHO_VENTANA_POR_DEFECTO = 1280
 ALTO_VENTANA_POR_DEFECTO = 760
 
+# Renderizado de resultados de duplicados: grupos por lote de actualización y grupos visibles por página
+TAMANIO_LOTE_DUPLICADOS_UI = 50
+INTERVALO_LOTE_DUPLICADOS_UI = 0.5  # segundos máximos entre actualizaciones durante el escaneo
+GRUPOS_POR_PAGINA_DUPLICADOS = 200
+
+# Área de dibujo del mapa de uso de disco (píxeles) y lado mínimo para rotular un rectángulo
+ANCHO_TREEMAP_USO_DISCO = 760
+ALTO_TREEMAP_USO_DISCO = 420
+LADO_MINIMO_ETIQUETA_TREEMAP = 40
+
 class AplicacionGestorArchivos:
     """
     Una aplicación Flet para organizar archivos en carpetas categorizadas y ofrecer
@@ -92,6 +125,19 @@ class AplicacionGestorArchivos:
         self._campo_texto_destino_actual: ft.TextField = None
         self._selector_archivos = ft.FilePicker(on_result=self._al_seleccionar_archivo_resultado)
         self.pagina.overlay.append(self._selector_archivos)
+        self._selector_exportar_grafico = ft.FilePicker(on_result=self._al_elegir_ruta_exportar_grafico)
+        self.pagina.overlay.append(self._selector_exportar_grafico)
+        self._tamanios_ultimo_resumen: dict[str, float] = {}
+        self._resumen_uso_disco = None # Último ResumenDirectorio (parcial o completo) del análisis de uso de disco
+        self._directorio_treemap: str = None # Directorio que se está desglosando en el mapa
+        self._consultas_busqueda = 0 # Número de la última búsqueda lanzada (las respuestas atrasadas se descartan)
+        self.cache_hashes = CacheHashes()
+        self.instantaneas_directorio = InstantaneasDirectorio()
+        # Catálogo de archivos compartido por todas las pestañas (evita volver a listar los mismos árboles)
+        self.catalogo_archivos = CatalogoArchivos()
+        # La caché de tipos detectados por contenido se conserva entre ejecuciones
+        self.detector_firmas = DetectorFirmas()
+        self.lector_fechas = LectorFechas()
 
         # Verificar FFmpeg al inicializar
         self._verificar_ffmpeg_disponible()
@@ -101,9 +147,13 @@ class AplicacionGestorArchivos:
         self.pagina.update()
 
         self.carpetas_personalizadas: list[tuple[str, list[str]]] = []
+        self.reglas_personalizadas: list[tuple[str, str, object]] = [] # (carpeta, tipo, valor) en orden de prioridad
+        self.vigilante_carpeta = None # VigilanteCarpeta activo, si hay vigilancia
         self.archivos_seleccionados_para_fusion: list[str] = []
         self.archivos_seleccionados_para_renombrar: list[str] = [] # Almacena las rutas originales para renombrar
         self.mapa_archivos_duplicados: dict[str, list[str]] = {}
+        self._grupos_duplicados_sin_mostrar: list[tuple[list[str], list[float], bool]] = []
+        self._limite_grupos_duplicados_visibles = GRUPOS_POR_PAGINA_DUPLICADOS
 
     def _configurar_pagina(self):
         self.pagina.title = "Administrador de Archivos Inteligente"
@@ -135,6 +185,8 @@ class AplicacionGestorArchivos:
         self.barra_progreso_general = ft.ProgressBar(value=0, visible=False, width=400)
         
         self._inicializar_ui_organizacion()
+        self._inicializar_ui_uso_disco()
+        self._inicializar_ui_busqueda()
         self._inicializar_ui_duplicados()
         self._inicializar_ui_redimensionar()
         self._inicializar_ui_renombrar()
@@ -154,6 +206,16 @@ class AplicacionGestorArchivos:
             on_click=self._al_hacer_click_organizar,
             width=200
         )
+        self.boton_previsualizar_organizacion = ft.OutlinedButton(
+            "Vista Previa",
+            icon=ft.Icons.VISIBILITY,
+            on_click=self._al_hacer_click_previsualizar_organizacion
+        )
+        self.boton_deshacer_organizacion = ft.OutlinedButton(
+            "Deshacer Última Organización",
+            icon=ft.Icons.UNDO,
+            on_click=self._al_hacer_click_deshacer_organizacion
+        )
         self.area_texto_resumen = ft.TextField(
             label="Resumen de Archivos",
             multiline=True,
@@ -162,12 +224,22 @@ class AplicacionGestorArchivos:
             max_lines=10,
             expand=True
         )
-        self.imagen_grafico_resumen = ft.Image(visible=False, width=300, height=300, fit=ft.ImageFit.CONTAIN)
+        self.grafico_resumen = ft.PieChart(
+            visible=False, width=300, height=300, sections_space=1, center_space_radius=40
+        )
+        self.boton_exportar_grafico = ft.OutlinedButton(
+            "Exportar Gráfico",
+            icon=ft.Icons.SAVE_ALT,
+            disabled=True,
+            on_click=lambda _: self._selector_exportar_grafico.save_file(
+                dialog_title="Exportar gráfico", file_name="resumen.png", allowed_extensions=["png", "svg"]
+            )
+        )
 
         self.entrada_nombre_carpeta_personalizada = ft.TextField(label="Nombre de Carpeta", width=150)
         self.entrada_extensiones_personalizadas = ft.TextField(
-            label="Extensiones (separadas por ,)",
-            hint_text="ej: mp3,wav",
+            label="Extensiones o reglas (separadas por ,)",
+            hint_text="ej: mp3,wav,IMG_*,re:^scan,>100MB,>30d",
             width=250
         )
         self.boton_anadir_personalizada = ft.ElevatedButton(
@@ -177,6 +249,94 @@ class AplicacionGestorArchivos:
         )
         self.lista_carpetas_personalizadas_ui = ft.Column()
 
+        self.checkbox_organizar_recursivo = ft.Checkbox(label="Incluir subcarpetas", value=False)
+        self.checkbox_organizar_incremental = ft.Checkbox(label="Solo archivos nuevos o modificados", value=True)
+        self.checkbox_detectar_por_contenido = ft.Checkbox(
+            label="Detectar el tipo por contenido (archivos sin extensión conocida)", value=False
+        )
+        self.checkbox_subcarpetas_fecha = ft.Checkbox(label="Subcarpetas por fecha (AAAA/MM)", value=False)
+        self.entrada_max_archivos_carpeta = ft.TextField(
+            label="Máx. archivos por carpeta",
+            hint_text="vacío = sin límite",
+            keyboard_type=ft.KeyboardType.NUMBER,
+            width=180
+        )
+        self.entrada_profundidad_maxima = ft.TextField(
+            label="Profundidad máxima",
+            hint_text="vacío = sin límite",
+            keyboard_type=ft.KeyboardType.NUMBER,
+            width=150
+        )
+        self.entrada_patrones_incluir = ft.TextField(label="Incluir (globs separados por ,)", hint_text="ej: *.jpg,IMG_*", width=250)
+        self.switch_vigilar_carpeta = ft.Switch(
+            label="Vigilar carpeta (organizar al llegar)",
+            value=False,
+            on_change=self._al_cambiar_vigilancia_carpeta
+        )
+        self.texto_estado_vigilancia = ft.Text("")
+        self.entrada_patrones_excluir = ft.TextField(label="Excluir (globs separados por ,)", hint_text="ej: node_modules,*.tmp", width=250)
+
+    def _inicializar_ui_uso_disco(self):
+        self.entrada_ruta_uso_disco = ft.TextField(
+            label="Carpeta a Analizar",
+            read_only=True,
+            expand=True,
+            on_focus=lambda e: self._abrir_dialogo_seleccion_carpeta(self.entrada_ruta_uso_disco)
+        )
+        self.boton_seleccionar_uso_disco = ft.ElevatedButton(
+            "Seleccionar Carpeta",
+            icon=ft.Icons.FOLDER_OPEN,
+            on_click=lambda e: self._abrir_dialogo_seleccion_carpeta(self.entrada_ruta_uso_disco)
+        )
+        self.entrada_max_mayores_uso_disco = ft.TextField(
+            label="Archivos más grandes",
+            value="20",
+            keyboard_type=ft.KeyboardType.NUMBER,
+            width=170
+        )
+        self.boton_analizar_uso_disco = ft.ElevatedButton(
+            "Analizar Uso de Disco",
+            icon=ft.Icons.DATA_USAGE,
+            on_click=self._al_hacer_click_analizar_uso_disco
+        )
+        self.boton_subir_uso_disco = ft.OutlinedButton(
+            "Subir un Nivel",
+            icon=ft.Icons.ARROW_UPWARD,
+            disabled=True,
+            on_click=self._al_hacer_click_subir_uso_disco
+        )
+        self.texto_estado_uso_disco = ft.Text("")
+        self.texto_directorio_treemap = ft.Text("", weight=ft.FontWeight.BOLD)
+        self.treemap_uso_disco = ft.Stack(width=ANCHO_TREEMAP_USO_DISCO, height=ALTO_TREEMAP_USO_DISCO)
+        self.lista_mayores_uso_disco = ft.Column(spacing=2, scroll=ft.ScrollMode.ADAPTIVE, height=ALTO_TREEMAP_USO_DISCO, expand=True)
+
+    def _inicializar_ui_busqueda(self):
+        self.entrada_ruta_busqueda = ft.TextField(
+            label="Carpeta (vacío = todas las indexadas)",
+            read_only=True,
+            expand=True,
+            on_focus=lambda e: self._abrir_dialogo_seleccion_carpeta(self.entrada_ruta_busqueda)
+        )
+        self.boton_seleccionar_busqueda = ft.ElevatedButton(
+            "Seleccionar Carpeta",
+            icon=ft.Icons.FOLDER_OPEN,
+            on_click=lambda e: self._abrir_dialogo_seleccion_carpeta(self.entrada_ruta_busqueda)
+        )
+        self.boton_indexar_busqueda = ft.ElevatedButton(
+            "Indexar Carpeta",
+            icon=ft.Icons.MANAGE_SEARCH,
+            on_click=self._al_hacer_click_indexar_busqueda
+        )
+        self.entrada_consulta_busqueda = ft.TextField(
+            label="Nombre o ruta",
+            hint_text="ej: factura 2023, *.pdf, fotos/*.jpg",
+            prefix_icon=ft.Icons.SEARCH,
+            expand=True,
+            on_change=self._al_cambiar_consulta_busqueda
+        )
+        self.texto_estado_busqueda = ft.Text("")
+        self.lista_resultados_busqueda = ft.Column(spacing=2, scroll=ft.ScrollMode.ADAPTIVE, height=450, expand=True)
+
     def _inicializar_ui_duplicados(self):
         self.entrada_ruta_duplicados = ft.TextField(
             label="Carpeta para Duplicados",
@@ -200,9 +360,57 @@ class AplicacionGestorArchivos:
             on_click=self._al_hacer_click_eliminar_duplicados,
             disabled=True
         )
+        self.boton_enlazar_duplicados = ft.ElevatedButton(
+            "Reemplazar por Enlaces",
+            icon=ft.Icons.LINK,
+            tooltip="Sustituye los seleccionados por enlaces al original (reflink o enlace duro)",
+            on_click=self._al_hacer_click_enlazar_duplicados,
+            disabled=True
+        )
+        opciones_modo = [ft.dropdown.Option("exactos", "Archivos idénticos")]
+        opciones_modo += [ft.dropdown.Option(metodo, f"Imágenes similares - {descripcion}") for metodo, descripcion in METODOS_HUELLA.items()]
+        self.dropdown_modo_duplicados = ft.Dropdown(
+            label="Modo de Búsqueda",
+            options=opciones_modo,
+            value="exactos",
+            width=300
+        )
+        self.entrada_distancia_similares = ft.TextField(
+            label="Distancia máxima (0-64)",
+            value="5",
+            keyboard_type=ft.KeyboardType.NUMBER,
+            width=180
+        )
+        self.dropdown_algoritmo_hash = ft.Dropdown(
+            label="Algoritmo de Hash",
+            options=[ft.dropdown.Option(clave, descripcion) for clave, descripcion in ALGORITMOS_HASH.items()],
+            value="sha256",
+            width=300
+        )
+        self.checkbox_usar_cache_hashes = ft.Checkbox(label="Usar caché de hashes", value=True)
+        self.checkbox_agrupar_carpetas_duplicadas = ft.Checkbox(label="Agrupar carpetas idénticas", value=False)
+        self.checkbox_incluir_zip_duplicados = ft.Checkbox(label="Buscar dentro de archivos .zip", value=False)
+        self.checkbox_ignorar_metadatos_duplicados = ft.Checkbox(label="Ignorar metadatos (música y fotos)", value=False)
+        self.entrada_concurrencia_duplicados = ft.TextField(
+            label="Archivos en paralelo",
+            value=str(CONCURRENCIA_POR_DEFECTO),
+            keyboard_type=ft.KeyboardType.NUMBER,
+            width=150
+        )
+        self.boton_limpiar_cache_hashes = ft.TextButton(
+            "Limpiar Caché",
+            icon=ft.Icons.CLEANING_SERVICES,
+            on_click=self._al_hacer_click_limpiar_cache_hashes
+        )
         self.texto_estado_duplicados = ft.Text("Listo para escanear duplicados.")
         self.barra_progreso_duplicados = ft.ProgressBar(value=0, visible=False, width=400)
         self.lista_archivos_duplicados_ui = ft.Column(scroll=ft.ScrollMode.ADAPTIVE, expand=True)
+        self.boton_mostrar_mas_duplicados = ft.TextButton(
+            "Mostrar más grupos",
+            icon=ft.Icons.EXPAND_MORE,
+            on_click=self._al_hacer_click_mostrar_mas_duplicados,
+            visible=False
+        )
 
     def _inicializar_ui_redimensionar(self):
         self.entrada_dir_redimensionar_origen = ft.TextField(
@@ -451,9 +659,14 @@ class AplicacionGestorArchivos:
                                         ]
                                     ),
                                     ft.Divider(),
-                                    self.boton_organizar_archivos,
+                                    ft.Row([self.checkbox_organizar_recursivo, self.entrada_profundidad_maxima, self.entrada_patrones_incluir, self.entrada_patrones_excluir]),
+                                    ft.Row([self.checkbox_organizar_incremental, self.checkbox_detectar_por_contenido, self.checkbox_subcarpetas_fecha,
+                                            self.entrada_max_archivos_carpeta]),
+                                    ft.Row([self.boton_organizar_archivos, self.boton_previsualizar_organizacion, self.boton_deshacer_organizacion,
+                                            self.boton_exportar_grafico]),
+                                    ft.Row([self.switch_vigilar_carpeta, self.texto_estado_vigilancia]),
                                     self.barra_progreso_general,
-                                    ft.Row([self.area_texto_resumen, self.imagen_grafico_resumen]),
+                                    ft.Row([self.area_texto_resumen, self.grafico_resumen]),
                                 ],
                                 scroll=ft.ScrollMode.ADAPTIVE,
                                 expand=True
@@ -461,6 +674,67 @@ class AplicacionGestorArchivos:
                             padding=10
                         ),
                     ),
+                    ft.Tab(
+                        text="Uso de Disco",
+                        icon=ft.Icons.DATA_USAGE,
+                        content=ft.Container(
+                            content=ft.Column(
+                                [
+                                    ft.Row(
+                                        [self.entrada_ruta_uso_disco, self.boton_seleccionar_uso_disco],
+                                        alignment=ft.MainAxisAlignment.START,
+                                    ),
+                                    ft.Row([self.entrada_max_mayores_uso_disco, self.boton_analizar_uso_disco, self.boton_subir_uso_disco]),
+                                    self.texto_estado_uso_disco,
+                                    self.texto_directorio_treemap,
+                                    ft.Row(
+                                        [
+                                            ft.Container(
+                                                content=self.treemap_uso_disco,
+                                                border=ft.border.all(1, ft.Colors.BLUE_GREY_700),
+                                            ),
+                                            ft.Container(
+                                                content=self.lista_mayores_uso_disco,
+                                                expand=True,
+                                                border=ft.border.all(1, ft.Colors.BLUE_GREY_700),
+                                                border_radius=5,
+                                                padding=10
+                                            ),
+                                        ],
+                                        vertical_alignment=ft.CrossAxisAlignment.START
+                                    ),
+                                ],
+                                scroll=ft.ScrollMode.ADAPTIVE,
+                                expand=True
+                            ),
+                            padding=10
+                        )
+                    ),
+                    ft.Tab(
+                        text="Buscar",
+                        icon=ft.Icons.SEARCH,
+                        content=ft.Container(
+                            content=ft.Column(
+                                [
+                                    ft.Row(
+                                        [self.entrada_ruta_busqueda, self.boton_seleccionar_busqueda, self.boton_indexar_busqueda],
+                                        alignment=ft.MainAxisAlignment.START,
+                                    ),
+                                    ft.Row([self.entrada_consulta_busqueda]),
+                                    self.texto_estado_busqueda,
+                                    ft.Container(
+                                        content=self.lista_resultados_busqueda,
+                                        border=ft.border.all(1, ft.Colors.BLUE_GREY_700),
+                                        border_radius=5,
+                                        padding=10
+                                    ),
+                                ],
+                                scroll=ft.ScrollMode.ADAPTIVE,
+                                expand=True
+                            ),
+                            padding=10
+                        )
+                    ),
                     ft.Tab(
                         text="Eliminar Duplicados",
                         icon=ft.Icons.COPY_ALL,
@@ -472,7 +746,16 @@ class AplicacionGestorArchivos:
                                         alignment=ft.MainAxisAlignment.START,
                                     ),
                                     ft.Row(
-                                        [self.boton_escanear_duplicados, self.boton_eliminar_duplicados]
+                                        [self.boton_escanear_duplicados, self.boton_eliminar_duplicados, self.boton_enlazar_duplicados]
+                                    ),
+                                    ft.Row(
+                                        [self.dropdown_modo_duplicados, self.entrada_distancia_similares, self.checkbox_agrupar_carpetas_duplicadas, self.checkbox_incluir_zip_duplicados]
+                                    ),
+                                    ft.Row(
+                                        [self.dropdown_algoritmo_hash, self.entrada_concurrencia_duplicados, self.checkbox_usar_cache_hashes, self.boton_limpiar_cache_hashes]
+                                    ),
+                                    ft.Row(
+                                        [self.checkbox_ignorar_metadatos_duplicados]
                                     ),
                                     self.texto_estado_duplicados,
                                     self.barra_progreso_duplicados,
@@ -482,7 +765,8 @@ class AplicacionGestorArchivos:
                                         border=ft.border.all(1, ft.Colors.BLUE_GREY_700),
                                         border_radius=5,
                                         padding=10
-                                    )
+                                    ),
+                                    self.boton_mostrar_mas_duplicados
                                 ],
                                 scroll=ft.ScrollMode.ADAPTIVE,
                                 expand=True
@@ -687,28 +971,38 @@ class AplicacionGestorArchivos:
             self.area_texto_resumen.value = "Organizando archivos..."
             self.pagina.update()
 
-            entradas_carpetas_por_defecto = {
-                'Music': self.entrada_musica.value,
-                'Photos': self.entrada_fotos.value,
-                'Docs': self.entrada_documentos.value,
-                'Videos': self.entrada_videos.value,
-            }
-            carpetas_configuradas = obtener_carpetas_configuradas(self.carpetas_personalizadas, entradas_carpetas_por_defecto)
+            reglas_organizacion = self._obtener_reglas_organizacion()
+            profundidad_maxima, incluir, excluir = self._obtener_opciones_recorrido()
+            texto_max_archivos = (self.entrada_max_archivos_carpeta.value or "").strip()
+            max_archivos_carpeta = int(texto_max_archivos) if texto_max_archivos else None
+            if max_archivos_carpeta is not None and max_archivos_carpeta < 1:
+                raise ValueError("El máximo de archivos por carpeta debe ser mayor que cero.")
 
+            # Tamaños que ve el organizador, para que el resumen no vuelva a consultarlos
+            estados_vistos = {}
             await asyncio.to_thread(
                 organizar_archivos_en_directorio,
                 directorio_origen,
-                carpetas_configuradas,
-                lambda actual, total: self._actualizar_progreso_organizacion(actual, total)
+                reglas_organizacion,
+                lambda actual, total: self._actualizar_progreso_organizacion(actual, total),
+                profundidad_maxima,
+                incluir,
+                excluir,
+                self.instantaneas_directorio if self.checkbox_organizar_incremental.value else None,
+                max_archivos_carpeta,
+                estados_vistos,
+                self.catalogo_archivos
             )
 
-            tamanios_archivos = resumir_archivos_directorio(directorio_origen)
-            texto_resumen = formatear_texto_resumen(tamanios_archivos)
-            base64_grafico = generar_grafico_resumen(tamanios_archivos)
+            resumen = await asyncio.to_thread(
+                obtener_resumen_directorio, directorio_origen, self.instantaneas_directorio, estados_vistos,
+                self.catalogo_archivos
+            )
+            tamanios_archivos = tamanios_en_mb(resumen)
+            texto_resumen = formatear_texto_resumen(tamanios_archivos, resumen)
 
             self.area_texto_resumen.value = texto_resumen
-            self.imagen_grafico_resumen.src_base64 = base64_grafico
-            self.imagen_grafico_resumen.visible = bool(base64_grafico)
+            self._mostrar_grafico_resumen(tamanios_archivos)
             self._mostrar_snackbar("Organización completada.")
             logger.info("Organización de archivos completada exitosamente.")
 
@@ -721,6 +1015,141 @@ class AplicacionGestorArchivos:
             self.boton_organizar_archivos.disabled = False
             self.pagina.update()
 
+    def _mostrar_grafico_resumen(self, tamanios_archivos: dict[str, float]):
+        """Dibuja el resumen con el gráfico circular nativo (los sectores se memorizan por contenido)."""
+        secciones = calcular_secciones_grafico(tamanios_archivos)
+        self.grafico_resumen.sections = [
+            ft.PieChartSection(
+                tamanio,
+                title=f"{etiqueta}\n{porcentaje:.0f}%" if porcentaje >= 4 else "",
+                title_style=ft.TextStyle(size=11, color=ft.Colors.BLACK),
+                color=color,
+                radius=100,
+            )
+            for etiqueta, tamanio, porcentaje, color in secciones
+        ]
+        self.grafico_resumen.visible = bool(secciones)
+        self._tamanios_ultimo_resumen = tamanios_archivos
+        self.boton_exportar_grafico.disabled = not secciones
+
+    async def _al_elegir_ruta_exportar_grafico(self, e: ft.FilePickerResultEvent):
+        if not e.path:
+            return
+        ruta_salida = e.path if os.path.splitext(e.path)[1] else e.path + ".png"
+        exportado = await asyncio.to_thread(exportar_grafico_resumen, self._tamanios_ultimo_resumen, ruta_salida)
+        self._mostrar_snackbar(f"Gráfico exportado a {ruta_salida}" if exportado else "No se pudo exportar el gráfico.")
+
+    def _obtener_reglas_organizacion(self):
+        """Compila la configuración actual de carpetas (por defecto y personalizadas)."""
+        entradas_carpetas_por_defecto = {
+            'Music': self.entrada_musica.value,
+            'Photos': self.entrada_fotos.value,
+            'Docs': self.entrada_documentos.value,
+            'Videos': self.entrada_videos.value,
+        }
+        carpetas_configuradas = obtener_carpetas_configuradas(self.carpetas_personalizadas, entradas_carpetas_por_defecto)
+        detector = self.detector_firmas if self.checkbox_detectar_por_contenido.value else None
+        fechas = self.lector_fechas if self.checkbox_subcarpetas_fecha.value else None
+        return compilar_reglas(carpetas_configuradas, self.reglas_personalizadas, detector, fechas)
+
+    def _obtener_opciones_recorrido(self):
+        """
+        Devuelve (profundidad_maxima, incluir, excluir) a partir de los controles de la pestaña Organizar.
+        Sin "Incluir subcarpetas" solo se organiza el primer nivel.
+        """
+        incluir = [patron for patron in (self.entrada_patrones_incluir.value or "").split(',') if patron.strip()]
+        excluir = [patron for patron in (self.entrada_patrones_excluir.value or "").split(',') if patron.strip()]
+        if not self.checkbox_organizar_recursivo.value:
+            return 0, incluir, excluir
+        texto_profundidad = (self.entrada_profundidad_maxima.value or "").strip()
+        if not texto_profundidad:
+            return None, incluir, excluir
+        profundidad_maxima = int(texto_profundidad)
+        if profundidad_maxima < 0:
+            raise ValueError("La profundidad máxima no puede ser negativa.")
+        return profundidad_maxima, incluir, excluir
+
+    async def _al_cambiar_vigilancia_carpeta(self, e: ft.ControlEvent):
+        if not self.switch_vigilar_carpeta.value:
+            if self.vigilante_carpeta:
+                await asyncio.to_thread(self.vigilante_carpeta.detener)
+                self.texto_estado_vigilancia.value = f"Vigilancia detenida ({self.vigilante_carpeta.total_organizados} archivos organizados)."
+                self.vigilante_carpeta = None
+            self.pagina.update()
+            return
+
+        directorio_origen = self.entrada_ruta_origen.value
+        if not directorio_origen or not os.path.isdir(directorio_origen):
+            self.switch_vigilar_carpeta.value = False
+            self._mostrar_snackbar("Por favor, seleccione una carpeta de origen válida.")
+            return
+        try:
+            reglas_organizacion = self._obtener_reglas_organizacion()
+        except ValueError as ex:
+            self.switch_vigilar_carpeta.value = False
+            self._mostrar_snackbar(str(ex))
+            return
+        self.vigilante_carpeta = VigilanteCarpeta(directorio_origen, reglas_organizacion, self._al_organizar_lote_vigilado)
+        self.vigilante_carpeta.iniciar()
+        self.texto_estado_vigilancia.value = f"Vigilando {directorio_origen}..."
+        self.pagina.update()
+
+    def _al_organizar_lote_vigilado(self, movimientos: list[tuple[str, str]]):
+        """Callback del vigilante (desde su hilo) tras organizar un lote de archivos."""
+        vigilante = self.vigilante_carpeta
+        if not vigilante:
+            return
+        ultimo_origen, ultimo_destino = movimientos[-1]
+        self.texto_estado_vigilancia.value = (
+            f"Vigilando ({vigilante.metodo}): {vigilante.total_organizados} archivos organizados. "
+            f"Último: {os.path.basename(ultimo_origen)} -> {os.path.basename(os.path.dirname(ultimo_destino))}"
+        )
+        self.pagina.update()
+
+    async def _al_hacer_click_previsualizar_organizacion(self, e: ft.ControlEvent):
+        directorio_origen = self.entrada_ruta_origen.value
+        if not directorio_origen or not os.path.isdir(directorio_origen):
+            self._mostrar_snackbar("Por favor, seleccione una carpeta de origen válida.")
+            return
+        try:
+            movimientos, es_reanudacion = await asyncio.to_thread(
+                previsualizar_organizacion, directorio_origen, self._obtener_reglas_organizacion(),
+                *self._obtener_opciones_recorrido()
+            )
+            self.area_texto_resumen.value = formatear_texto_previsualizacion(movimientos, es_reanudacion)
+            self.grafico_resumen.visible = False
+        except Exception as ex:
+            logger.error(f"Error al previsualizar la organización: {ex}")
+            self.area_texto_resumen.value = f"Error: {ex}"
+        self.pagina.update()
+
+    async def _al_hacer_click_deshacer_organizacion(self, e: ft.ControlEvent):
+        directorio_origen = self.entrada_ruta_origen.value
+        if not directorio_origen or not os.path.isdir(directorio_origen):
+            self._mostrar_snackbar("Por favor, seleccione una carpeta de origen válida.")
+            return
+        try:
+            self.boton_deshacer_organizacion.disabled = True
+            self.barra_progreso_general.value = 0
+            self.barra_progreso_general.visible = True
+            self.pagina.update()
+            revertidos = await asyncio.to_thread(
+                deshacer_ultima_organizacion,
+                directorio_origen,
+                lambda actual, total: self._actualizar_progreso_organizacion(actual, total),
+                self.instantaneas_directorio,
+                self.catalogo_archivos
+            )
+            self.area_texto_resumen.value = f"Se devolvieron {revertidos} archivos a su ubicación original."
+            self._mostrar_snackbar("Organización deshecha." if revertidos else "No había nada que deshacer.")
+        except Exception as ex:
+            logger.error(f"Error al deshacer la organización: {ex}")
+            self._mostrar_snackbar(f"Error al deshacer la organización: {ex}")
+        finally:
+            self.barra_progreso_general.visible = False
+            self.boton_deshacer_organizacion.disabled = False
+            self.pagina.update()
+
     def _al_hacer_click_anadir_personalizada(self, e: ft.ControlEvent):
         nombre_carpeta = self.entrada_nombre_carpeta_personalizada.value.strip()
         extensiones_str = self.entrada_extensiones_personalizadas.value.strip()
@@ -728,20 +1157,187 @@ class AplicacionGestorArchivos:
             self._mostrar_snackbar("Por favor, ingrese el nombre de la carpeta y las extensiones.")
             return
 
-        extensiones = [ext.strip().lower() for ext in extensiones_str.split(',') if ext.strip()]
-        if not extensiones:
+        try:
+            extensiones, reglas = interpretar_criterios(extensiones_str)
+            # Se compila ya para rechazar reglas inválidas antes de añadirlas
+            compilar_reglas({nombre_carpeta: extensiones}, [(nombre_carpeta, tipo, valor) for tipo, valor in reglas])
+        except ValueError as ex:
+            self._mostrar_snackbar(str(ex))
+            return
+        if not extensiones and not reglas:
             self._mostrar_snackbar("Por favor, ingrese extensiones válidas separadas por comas.")
             return
 
         self.carpetas_personalizadas.append((nombre_carpeta, extensiones))
+        self.reglas_personalizadas.extend((nombre_carpeta, tipo, valor) for tipo, valor in reglas)
+        criterios = extensiones + [f"{tipo}={valor}" for tipo, valor in reglas]
         self.lista_carpetas_personalizadas_ui.controls.append(
-            ft.Text(f"• {nombre_carpeta}: {', '.join(extensiones)}")
+            ft.Text(f"• {nombre_carpeta}: {', '.join(criterios)}")
         )
         self.entrada_nombre_carpeta_personalizada.value = ""
         self.entrada_extensiones_personalizadas.value = ""
         self.pagina.update()
         self._mostrar_snackbar(f"Carpeta personalizada '{nombre_carpeta}' añadida.")
-        logger.info(f"Carpeta personalizada añadida: {nombre_carpeta} con extensiones {extensiones}")
+        logger.info(f"Carpeta personalizada añadida: {nombre_carpeta} con extensiones {extensiones} y reglas {reglas}")
+
+    async def _al_hacer_click_analizar_uso_disco(self, e: ft.ControlEvent):
+        directorio = self.entrada_ruta_uso_disco.value
+        if not directorio or not os.path.isdir(directorio):
+            self._mostrar_snackbar("Seleccione una carpeta válida para analizar.")
+            return
+        try:
+            max_mayores = int(self.entrada_max_mayores_uso_disco.value or 20)
+            if max_mayores < 1:
+                raise ValueError
+        except ValueError:
+            self._mostrar_snackbar("El número de archivos más grandes debe ser un entero positivo.")
+            return
+
+        self.boton_analizar_uso_disco.disabled = True
+        self._resumen_uso_disco = None
+        self._directorio_treemap = os.path.normpath(directorio)
+        self.texto_estado_uso_disco.value = "Analizando..."
+        self.pagina.update()
+
+        def analizar():
+            # Cada resumen parcial se dibuja en cuanto llega (como mucho cada INTERVALO_RESUMEN_PARCIAL segundos)
+            for resumen in iterar_resumen_directorio(directorio, max_mayores=max_mayores):
+                self._mostrar_uso_disco(resumen, "Analizando...")
+            return resumen
+
+        try:
+            resumen = await asyncio.to_thread(analizar)
+            self._mostrar_uso_disco(resumen, "Análisis completado.")
+        except Exception as ex:
+            logger.error(f"Error al analizar el uso de disco: {ex}")
+            self.texto_estado_uso_disco.value = f"Error: {ex}"
+            self._mostrar_snackbar(f"Error al analizar el uso de disco: {ex}")
+        finally:
+            self.boton_analizar_uso_disco.disabled = False
+            self.pagina.update()
+
+    def _mostrar_uso_disco(self, resumen, estado: str):
+        """Dibuja un resumen (parcial o completo): el mapa del directorio actual y los archivos más grandes."""
+        self._resumen_uso_disco = resumen
+        self.texto_estado_uso_disco.value = (
+            f"{estado} {resumen.total_archivos} archivos, {resumen.total_bytes / (1024 * 1024):.1f} MB "
+            f"en {len(resumen.bytes_por_directorio)} carpetas."
+        )
+        self.lista_mayores_uso_disco.controls = [ft.Text("Archivos más grandes:", weight=ft.FontWeight.BOLD)] + [
+            ft.Text(f"{tamanio / (1024 * 1024):.1f} MB  {ruta}", size=12, selectable=True)
+            for tamanio, ruta in resumen.mayores
+        ]
+        self._dibujar_treemap_uso_disco()
+        self.pagina.update()
+
+    def _dibujar_treemap_uso_disco(self):
+        """Rellena el mapa con los subdirectorios del directorio actual; un clic en uno lo desglosa."""
+        resumen, directorio = self._resumen_uso_disco, self._directorio_treemap
+        rectangulos = calcular_treemap(hijos_directorio(resumen.bytes_por_directorio, directorio),
+                                       ANCHO_TREEMAP_USO_DISCO, ALTO_TREEMAP_USO_DISCO)
+        controles = []
+        for indice, (ruta, tamanio, x, y, ancho, alto) in enumerate(rectangulos):
+            if ruta is None:
+                etiqueta = "Otros"
+            elif ruta == directorio:
+                etiqueta = "(archivos)"
+            else:
+                etiqueta = os.path.basename(ruta)
+            texto = f"{etiqueta}\n{tamanio / (1024 * 1024):.1f} MB"
+            es_subdirectorio = ruta is not None and ruta != directorio
+            controles.append(ft.Container(
+                left=x, top=y, width=ancho, height=alto,
+                bgcolor=PALETA_GRAFICO[indice % len(PALETA_GRAFICO)],
+                border=ft.border.all(1, ft.Colors.WHITE),
+                padding=4,
+                tooltip=texto if ruta is None else f"{ruta}\n{tamanio / (1024 * 1024):.1f} MB",
+                content=ft.Text(texto, size=11, color=ft.Colors.BLACK)
+                        if min(ancho, alto) >= LADO_MINIMO_ETIQUETA_TREEMAP else None,
+                on_click=(lambda e, ruta=ruta: self._al_hacer_click_rectangulo_treemap(ruta)) if es_subdirectorio else None,
+            ))
+        self.treemap_uso_disco.controls = controles
+        total = resumen.bytes_por_directorio.get(directorio, 0)
+        self.texto_directorio_treemap.value = f"{directorio} ({total / (1024 * 1024):.1f} MB)"
+        raiz = os.path.normpath(self.entrada_ruta_uso_disco.value or directorio)
+        self.boton_subir_uso_disco.disabled = directorio == raiz
+
+    def _al_hacer_click_rectangulo_treemap(self, ruta: str):
+        # El desglose sale del resumen ya calculado: no se vuelve a recorrer el disco
+        self._directorio_treemap = ruta
+        self._dibujar_treemap_uso_disco()
+        self.pagina.update()
+
+    def _al_hacer_click_subir_uso_disco(self, e: ft.ControlEvent):
+        if not self._resumen_uso_disco:
+            return
+        self._directorio_treemap = os.path.dirname(self._directorio_treemap)
+        self._dibujar_treemap_uso_disco()
+        self.pagina.update()
+
+    async def _al_hacer_click_indexar_busqueda(self, e: ft.ControlEvent):
+        directorio = self.entrada_ruta_busqueda.value
+        if not directorio or not os.path.isdir(directorio):
+            self._mostrar_snackbar("Seleccione una carpeta válida para indexar.")
+            return
+
+        self.boton_indexar_busqueda.disabled = True
+        self.texto_estado_busqueda.value = "Indexando..."
+        self.pagina.update()
+        try:
+            # Es la misma actualización del catálogo que hacen las demás pestañas: solo se listan las carpetas cambiadas
+            listados = await asyncio.to_thread(self.catalogo_archivos.actualizar, directorio)
+            self.texto_estado_busqueda.value = f"Índice al día ({listados} carpetas leídas)."
+        except Exception as ex:
+            logger.error(f"Error al indexar {directorio}: {ex}")
+            self.texto_estado_busqueda.value = f"Error: {ex}"
+            self._mostrar_snackbar(f"Error al indexar la carpeta: {ex}")
+        finally:
+            self.boton_indexar_busqueda.disabled = False
+            self.pagina.update()
+        if self.entrada_consulta_busqueda.value:
+            await self._buscar_archivos()
+
+    async def _al_cambiar_consulta_busqueda(self, e: ft.ControlEvent):
+        await self._buscar_archivos()
+
+    async def _buscar_archivos(self):
+        """Busca en el índice del catálogo mientras se escribe; solo se muestra la respuesta de la última consulta."""
+        self._consultas_busqueda += 1
+        numero_consulta = self._consultas_busqueda
+        consulta = (self.entrada_consulta_busqueda.value or "").strip()
+        directorio = self.entrada_ruta_busqueda.value or None
+        if not consulta:
+            self.lista_resultados_busqueda.controls = []
+            self.texto_estado_busqueda.value = ""
+            self.pagina.update()
+            return
+
+        inicio = time.perf_counter()
+        try:
+            resultados = await asyncio.to_thread(self.catalogo_archivos.buscar, consulta, directorio)
+        except Exception as ex:
+            logger.error(f"Error al buscar '{consulta}': {ex}")
+            self.texto_estado_busqueda.value = f"Error: {ex}"
+            self.pagina.update()
+            return
+        if numero_consulta != self._consultas_busqueda:
+            return
+        milisegundos = (time.perf_counter() - inicio) * 1000
+        self.texto_estado_busqueda.value = (
+            f"Se muestran los primeros {len(resultados)} resultados ({milisegundos:.0f} ms)."
+            if len(resultados) >= MAX_RESULTADOS_BUSQUEDA else f"{len(resultados)} resultados ({milisegundos:.0f} ms)."
+        )
+        self.lista_resultados_busqueda.controls = [
+            ft.Text(
+                f"{os.path.relpath(entrada.ruta, directorio) if directorio else entrada.ruta}  "
+                f"({entrada.tamanio / (1024 * 1024):.2f} MB)",
+                size=12,
+                selectable=True,
+                tooltip=entrada.ruta
+            )
+            for entrada in resultados
+        ]
+        self.pagina.update()
 
     async def _al_hacer_click_escanear_duplicados(self, e: ft.ControlEvent):
         directorio_escaneo = self.entrada_ruta_duplicados.value
@@ -749,26 +1345,83 @@ class AplicacionGestorArchivos:
             self.texto_estado_duplicados.value = "Por favor, seleccione una carpeta válida para escanear."
             self._mostrar_snackbar("Seleccione una carpeta válida para duplicados.")
             return
+        try:
+            max_concurrencia = int(self.entrada_concurrencia_duplicados.value or CONCURRENCIA_POR_DEFECTO)
+            if max_concurrencia < 1:
+                raise ValueError
+        except ValueError:
+            self.texto_estado_duplicados.value = "El número de archivos en paralelo debe ser un entero positivo."
+            self._mostrar_snackbar("Número de archivos en paralelo inválido.")
+            return
+        modo_busqueda = self.dropdown_modo_duplicados.value or "exactos"
+        try:
+            distancia_maxima = int(self.entrada_distancia_similares.value or 5)
+            if not 0 <= distancia_maxima <= 64:
+                raise ValueError
+        except ValueError:
+            self.texto_estado_duplicados.value = "La distancia máxima debe ser un entero entre 0 y 64."
+            self._mostrar_snackbar("Distancia máxima inválida.")
+            return
 
         self.boton_escanear_duplicados.disabled = True
         self.boton_eliminar_duplicados.disabled = True
+        self.boton_enlazar_duplicados.disabled = True
         self.barra_progreso_duplicados.value = 0
         self.barra_progreso_duplicados.visible = True
         self.texto_estado_duplicados.value = "Escaneando duplicados..."
-        self.lista_archivos_duplicados_ui.controls.clear()
+        self._limpiar_resultados_duplicados_ui()
         self.pagina.update()
 
         try:
-            self.mapa_archivos_duplicados = await encontrar_archivos_duplicados(
+            if modo_busqueda != "exactos":
+                await self._escanear_imagenes_similares(directorio_escaneo, modo_busqueda, distancia_maxima, max_concurrencia)
+                return
+
+            # Los grupos llegan en cuanto se confirman; se pintan por lotes para no sincronizar la página por cada uno.
+            # Si se agrupan carpetas, hay que esperar al final para saber qué archivos quedan dentro de carpetas copiadas.
+            agrupar_carpetas = self.checkbox_agrupar_carpetas_duplicadas.value
+            grupos_en_lote = 0
+            ultima_actualizacion = time.monotonic()
+            async for valor_hash, rutas in iterar_archivos_duplicados(
                 directorio_escaneo,
-                lambda actual, total: self._actualizar_progreso_escaneo_duplicados(actual, total)
-            )
-            
-            if self.mapa_archivos_duplicados:
+                lambda actual, total: self._actualizar_progreso_escaneo_duplicados(actual, total),
+                self._actualizar_etapa_escaneo_duplicados,
+                self.cache_hashes if self.checkbox_usar_cache_hashes.value else None,
+                max_concurrencia,
+                self.dropdown_algoritmo_hash.value or "sha256",
+                self.checkbox_incluir_zip_duplicados.value,
+                self.checkbox_ignorar_metadatos_duplicados.value,
+                self.catalogo_archivos
+            ):
+                self.mapa_archivos_duplicados[valor_hash] = rutas
+                if not agrupar_carpetas:
+                    self._encolar_grupo_duplicado_ui(rutas)
+                grupos_en_lote += 1
+                if grupos_en_lote >= TAMANIO_LOTE_DUPLICADOS_UI or time.monotonic() - ultima_actualizacion >= INTERVALO_LOTE_DUPLICADOS_UI:
+                    self.texto_estado_duplicados.value = f"Escaneando... {len(self.mapa_archivos_duplicados)} grupos encontrados hasta ahora."
+                    self.pagina.update()
+                    grupos_en_lote = 0
+                    ultima_actualizacion = time.monotonic()
+
+            if agrupar_carpetas and self.mapa_archivos_duplicados:
+                carpetas_duplicadas, archivos_restantes = await asyncio.to_thread(
+                    agrupar_directorios_duplicados, directorio_escaneo, self.mapa_archivos_duplicados
+                )
+                for rutas in carpetas_duplicadas.values():
+                    self._encolar_grupo_duplicado_ui(rutas, es_carpeta=True)
+                for rutas in archivos_restantes.values():
+                    self._encolar_grupo_duplicado_ui(rutas)
+                self.mapa_archivos_duplicados = {**carpetas_duplicadas, **archivos_restantes}
+                self.texto_estado_duplicados.value = (
+                    f"Se encontraron {len(carpetas_duplicadas)} grupos de carpetas idénticas "
+                    f"y {len(archivos_restantes)} grupos de archivos duplicados."
+                )
+                self.boton_eliminar_duplicados.disabled = False
+                self.boton_enlazar_duplicados.disabled = False
+            elif self.mapa_archivos_duplicados:
                 self.texto_estado_duplicados.value = f"Se encontraron {len(self.mapa_archivos_duplicados)} grupos de archivos duplicados."
-                for valor_hash, rutas in self.mapa_archivos_duplicados.items():
-                    self._anadir_entrada_duplicado_ui(rutas)
                 self.boton_eliminar_duplicados.disabled = False
+                self.boton_enlazar_duplicados.disabled = False
             else:
                 self.texto_estado_duplicados.value = "No se encontraron archivos duplicados."
             self._mostrar_snackbar("Escaneo de duplicados completado.")
@@ -782,8 +1435,51 @@ class AplicacionGestorArchivos:
             self.boton_escanear_duplicados.disabled = False
             self.pagina.update()
 
-    async def _al_hacer_click_eliminar_duplicados(self, e: ft.ControlEvent):
-        archivos_a_eliminar = []
+    async def _escanear_imagenes_similares(self, directorio_escaneo: str, metodo: str, distancia_maxima: int, max_concurrencia: int):
+        self.texto_estado_duplicados.value = f"Buscando imágenes similares ({METODOS_HUELLA[metodo]})..."
+        self.pagina.update()
+
+        grupos_similares = await asyncio.to_thread(
+            encontrar_imagenes_similares,
+            directorio_escaneo,
+            distancia_maxima,
+            metodo,
+            lambda actual, total: self._actualizar_progreso_escaneo_duplicados(actual, total),
+            max_concurrencia,
+            self.catalogo_archivos
+        )
+        self.mapa_archivos_duplicados = {
+            f"similares-{i}": [ruta for ruta, _ in grupo] for i, grupo in enumerate(grupos_similares)
+        }
+
+        if grupos_similares:
+            self.texto_estado_duplicados.value = f"Se encontraron {len(grupos_similares)} grupos de imágenes similares."
+            for grupo in grupos_similares:
+                self._encolar_grupo_duplicado_ui(
+                    [ruta for ruta, _ in grupo],
+                    [similitud for _, similitud in grupo]
+                )
+            self.boton_eliminar_duplicados.disabled = False
+        else:
+            self.texto_estado_duplicados.value = "No se encontraron imágenes similares."
+        self._mostrar_snackbar("Búsqueda de imágenes similares completada.")
+
+    def _al_hacer_click_limpiar_cache_hashes(self, e: ft.ControlEvent):
+        try:
+            self.cache_hashes.invalidar()
+            # El catálogo no detecta archivos reescritos sin cambios en su carpeta: vaciarlo fuerza a volver a listarlas
+            self.catalogo_archivos.invalidar()
+            self.texto_estado_duplicados.value = ("Caché de hashes y catálogo de archivos vaciados. El próximo escaneo "
+                                                  "volverá a recorrer las carpetas y recalculará todos los hashes.")
+            self._mostrar_snackbar("Caché de hashes y catálogo vaciados.")
+        except Exception as ex:
+            logger.error(f"Error al vaciar la caché de hashes: {ex}")
+            self._mostrar_snackbar(f"Error al vaciar la caché: {ex}")
+        self.pagina.update()
+
+    def _obtener_duplicados_seleccionados(self) -> list[tuple[str, str]]:
+        """Devuelve los pares (ruta_original, ruta_duplicado) de las casillas marcadas."""
+        seleccionados = []
         for contenedor_item in self.lista_archivos_duplicados_ui.controls:
             if isinstance(contenedor_item, ft.Container) and contenedor_item.content:
                 for control_in_column in contenedor_item.content.controls:
@@ -794,8 +1490,12 @@ class AplicacionGestorArchivos:
                                 if checkbox.value:
                                     ruta_archivo = checkbox.label
                                     if ruta_archivo:
-                                        archivos_a_eliminar.append(ruta_archivo)
+                                        seleccionados.append((contenedor_item.data, ruta_archivo))
                                 break
+        return seleccionados
+
+    async def _al_hacer_click_eliminar_duplicados(self, e: ft.ControlEvent):
+        archivos_a_eliminar = [ruta_archivo for _, ruta_archivo in self._obtener_duplicados_seleccionados()]
         
         if not archivos_a_eliminar:
             self.texto_estado_duplicados.value = "No se seleccionaron archivos para eliminar."
@@ -823,34 +1523,98 @@ class AplicacionGestorArchivos:
             self.boton_escanear_duplicados.disabled = False
             self.pagina.update()
 
-    def _anadir_entrada_duplicado_ui(self, rutas_archivos: list[str]):
+    async def _al_hacer_click_enlazar_duplicados(self, e: ft.ControlEvent):
+        pares_duplicados = self._obtener_duplicados_seleccionados()
+        if not pares_duplicados:
+            self.texto_estado_duplicados.value = "No se seleccionaron archivos para reemplazar."
+            self._mostrar_snackbar("Seleccione archivos para reemplazar por enlaces.")
+            return
+
+        self.boton_eliminar_duplicados.disabled = True
+        self.boton_enlazar_duplicados.disabled = True
+        self.boton_escanear_duplicados.disabled = True
+        self.texto_estado_duplicados.value = f"Reemplazando {len(pares_duplicados)} archivos por enlaces..."
+        self.pagina.update()
+
+        try:
+            contador_reemplazados = await asyncio.to_thread(reemplazar_por_enlaces, pares_duplicados)
+            self.texto_estado_duplicados.value = f"Se reemplazaron {contador_reemplazados} archivos por enlaces."
+            self._mostrar_snackbar(f"Se reemplazaron {contador_reemplazados} archivos por enlaces.")
+
+            await self._al_hacer_click_escanear_duplicados(None)
+
+        except Exception as ex:
+            logger.error(f"Error al reemplazar duplicados por enlaces: {ex}")
+            self.texto_estado_duplicados.value = f"Error al reemplazar por enlaces: {ex}"
+            self._mostrar_snackbar(f"Error al reemplazar por enlaces: {ex}")
+        finally:
+            self.boton_escanear_duplicados.disabled = False
+            self.pagina.update()
+
+    def _limpiar_resultados_duplicados_ui(self):
+        self.mapa_archivos_duplicados = {}
+        self._grupos_duplicados_sin_mostrar = []
+        self._limite_grupos_duplicados_visibles = GRUPOS_POR_PAGINA_DUPLICADOS
+        self.lista_archivos_duplicados_ui.controls.clear()
+        self.boton_mostrar_mas_duplicados.visible = False
+
+    def _encolar_grupo_duplicado_ui(self, rutas_archivos: list[str], similitudes: list[float] = None, es_carpeta: bool = False):
+        """Pinta el grupo si cabe en la página actual; si no, lo guarda para "Mostrar más grupos"."""
+        if len(self.lista_archivos_duplicados_ui.controls) < self._limite_grupos_duplicados_visibles:
+            self._anadir_entrada_duplicado_ui(rutas_archivos, similitudes, es_carpeta)
+        else:
+            self._grupos_duplicados_sin_mostrar.append((rutas_archivos, similitudes, es_carpeta))
+            self.boton_mostrar_mas_duplicados.visible = True
+            self.boton_mostrar_mas_duplicados.text = f"Mostrar más grupos ({len(self._grupos_duplicados_sin_mostrar)} ocultos)"
+
+    def _al_hacer_click_mostrar_mas_duplicados(self, e: ft.ControlEvent):
+        self._limite_grupos_duplicados_visibles += GRUPOS_POR_PAGINA_DUPLICADOS
+        siguientes = self._grupos_duplicados_sin_mostrar[:GRUPOS_POR_PAGINA_DUPLICADOS]
+        self._grupos_duplicados_sin_mostrar = self._grupos_duplicados_sin_mostrar[GRUPOS_POR_PAGINA_DUPLICADOS:]
+        for rutas_archivos, similitudes, es_carpeta in siguientes:
+            self._anadir_entrada_duplicado_ui(rutas_archivos, similitudes, es_carpeta)
+        self.boton_mostrar_mas_duplicados.visible = bool(self._grupos_duplicados_sin_mostrar)
+        self.boton_mostrar_mas_duplicados.text = f"Mostrar más grupos ({len(self._grupos_duplicados_sin_mostrar)} ocultos)"
+        self.pagina.update()
+
+    def _anadir_entrada_duplicado_ui(self, rutas_archivos: list[str], similitudes: list[float] = None, es_carpeta: bool = False):
         original_archivo = rutas_archivos[0]
         candidatos_duplicados = rutas_archivos[1:]
+        # En las imágenes similares no se marcan por defecto: no son copias exactas
+        marcar_por_defecto = similitudes is None
 
         controles_grupo = [
-            ft.Text(f"Original: {os.path.basename(original_archivo)}", weight=ft.FontWeight.BOLD),
+            ft.Text(
+                f"Carpeta original: {os.path.basename(original_archivo)}" if es_carpeta else f"Original: {os.path.basename(original_archivo)}",
+                weight=ft.FontWeight.BOLD
+            ),
             ft.Text(f"Ruta: {original_archivo}", size=10, color=ft.Colors.WHITE70),
             ft.Divider()
         ]
 
-        for ruta_dup in candidatos_duplicados:
+        for i, ruta_dup in enumerate(candidatos_duplicados, 1):
+            detalle = f"({os.path.basename(ruta_dup)})"
+            if similitudes is not None:
+                detalle = f"({os.path.basename(ruta_dup)} - {similitudes[i]:.1f}% similar)"
+            # Los miembros de un .zip no se pueden borrar ni enlazar por separado
+            es_miembro_zip = dividir_ruta_zip(ruta_dup) is not None
             controles_grupo.append(
                 ft.Row([
-                    ft.Checkbox(label=ruta_dup, value=True, expand=True),
-                    ft.Text(f"({os.path.basename(ruta_dup)})", size=10, color=ft.Colors.WHITE54)
+                    ft.Checkbox(label=ruta_dup, value=marcar_por_defecto and not es_miembro_zip, disabled=es_miembro_zip, expand=True),
+                    ft.Text(detalle, size=10, color=ft.Colors.WHITE54)
                 ])
             )
         
         self.lista_archivos_duplicados_ui.controls.append(
             ft.Container(
                 content=ft.Column(controles_grupo, spacing=5),
+                data=original_archivo,
                 padding=10,
                 margin=ft.margin.symmetric(vertical=5),
                 border=ft.border.all(1, ft.Colors.BLUE_GREY_800),
                 border_radius=5
             )
         )
-        self.pagina.update()
 
     # --- Métodos para Redimensionar Imágenes ---
     async def _al_hacer_click_redimensionar(self, e: ft.ControlEvent):
@@ -883,7 +1647,8 @@ class AplicacionGestorArchivos:
                 directorio_salida, 
                 ancho_objetivo, 
                 alto_objetivo, 
-                porcentaje_objetivo
+                porcentaje_objetivo,
+                self.catalogo_archivos
             )
             
             self.texto_estado_redimensionar.value = f"Redimensionado completado. Se procesaron {contador_redimensionados} imágenes."
@@ -921,7 +1686,7 @@ class AplicacionGestorArchivos:
         self.lista_previsualizacion_renombrar_ui.controls.clear()
         
         previsualizaciones, rutas_originales = await asyncio.to_thread(
-            previsualizar_renombrado_archivos, directorio_origen, prefijo, sufijo, inicio_numerico
+            previsualizar_renombrado_archivos, directorio_origen, prefijo, sufijo, inicio_numerico, self.catalogo_archivos
         )
 
         self.archivos_seleccionados_para_renombrar = rutas_originales # Guardar las rutas originales
@@ -962,6 +1727,8 @@ class AplicacionGestorArchivos:
         self.texto_estado_renombrar.value = "Renombrando archivos..."
         self.pagina.update()
 
+        # En una carpeta fragmentada, cada nuevo nombre va al fragmento que le corresponde
+        ubicador = UbicadorFragmentos()
         archivos_a_renombrar_list = []
         for i, ruta_original in enumerate(self.archivos_seleccionados_para_renombrar):
             nombre_original = os.path.basename(ruta_original)
@@ -972,10 +1739,10 @@ class AplicacionGestorArchivos:
             nuevo_nombre_base = "_".join(partes_nuevo_nombre_base)
             nuevo_nombre_completo = f"{nuevo_nombre_base}{ext}"
             
-            archivos_a_renombrar_list.append((ruta_original, os.path.join(directorio_origen, nuevo_nombre_completo)))
+            archivos_a_renombrar_list.append((ruta_original, ubicador.ubicar(os.path.join(directorio_origen, nuevo_nombre_completo))))
 
         try:
-            contador_renombrados = await asyncio.to_thread(realizar_renombrado_masivo, archivos_a_renombrar_list)
+            contador_renombrados = await asyncio.to_thread(realizar_renombrado_masivo, archivos_a_renombrar_list, self.catalogo_archivos)
             
             self.texto_estado_renombrar.value = f"Renombrado completado. Se renombraron {contador_renombrados} archivos."
             self._mostrar_snackbar(f"Se renombraron {contador_renombrados} archivos.")
@@ -1073,7 +1840,8 @@ class AplicacionGestorArchivos:
                 convertir_imagenes_formato,
                 input_dir,
                 output_dir,
-                target_format
+                target_format,
+                self.catalogo_archivos
             )
 
             self.texto_estado_convertir.value = f"Conversión completada. Se procesaron {converted_count} imágenes."
@@ -1138,7 +1906,8 @@ class AplicacionGestorArchivos:
                 output_dir,
                 formato_audio,
                 calidad_audio,
-                self._actualizar_progreso_audio
+                self._actualizar_progreso_audio,
+                self.catalogo_archivos
             )
 
             # Actualizar estado final
@@ -1158,13 +1927,23 @@ class AplicacionGestorArchivos:
 
     # --- Métodos de Actualización de UI y Utilidades ---
     def _actualizar_progreso_organizacion(self, actual, total):
-        """Actualiza la barra de progreso de organización de archivos."""
-        self.barra_progreso_general.value = actual / total
-        self.pagina.update()
+        """Actualiza la barra de progreso de organización de archivos (solo cuando avanza al menos un 1 %)."""
+        valor = actual / total
+        if actual == total or valor - (self.barra_progreso_general.value or 0) >= 0.01:
+            self.barra_progreso_general.value = valor
+            self.pagina.update()
 
     def _actualizar_progreso_escaneo_duplicados(self, actual, total):
-        """Actualiza la barra de progreso de escaneo de duplicados."""
-        self.barra_progreso_duplicados.value = actual / total
+        """Actualiza la barra de progreso de escaneo de duplicados (solo cuando avanza al menos un 1 %)."""
+        valor = actual / total
+        if actual == total or valor - (self.barra_progreso_duplicados.value or 0) >= 0.01:
+            self.barra_progreso_duplicados.value = valor
+            self.pagina.update()
+
+    def _actualizar_etapa_escaneo_duplicados(self, nombre_etapa):
+        """Muestra la etapa actual del escaneo de duplicados y reinicia la barra de progreso."""
+        self.texto_estado_duplicados.value = f"Escaneando duplicados: {nombre_etapa}..."
+        self.barra_progreso_duplicados.value = 0
         self.pagina.update()
 
     def _actualizar_progreso_audio(self, actual, total):
@@ -0,0 +1,175 @@
+import os
+import uuid
+import errno
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Hilos para copias entre dispositivos (limitadas por E/S, no por CPU)
+CONCURRENCIA_COPIAS = min(8, (os.cpu_count() or 1) + 4)
+
+# Bytes pedidos al núcleo en cada llamada a copy_file_range/sendfile
+_TAMANIO_TRAMO_COPIA = 64 * 1024 * 1024
+
+def _dispositivo(ruta: str) -> Optional[int]:
+    """st_dev de la ruta, o None si no se puede consultar."""
+    try:
+        return os.stat(ruta).st_dev
+    except OSError:
+        return None
+
+def _copiar_contenido(fd_origen: int, fd_destino: int, tamanio: int):
+    """
+    Copia `tamanio` bytes entre dos descriptores sin pasar por búferes de Python:
+    copy_file_range (el núcleo puede hacer copia en servidor o reflink), luego sendfile
+    y, si ninguno está disponible, copia por bloques.
+    """
+    copiados = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copiados < tamanio:
+                n = os.copy_file_range(fd_origen, fd_destino, min(_TAMANIO_TRAMO_COPIA, tamanio - copiados))
+                if n == 0:
+                    break
+                copiados += n
+            if copiados >= tamanio:
+                return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF):
+                raise
+    if hasattr(os, "sendfile"):
+        try:
+            while copiados < tamanio:
+                n = os.sendfile(fd_destino, fd_origen, copiados, min(_TAMANIO_TRAMO_COPIA, tamanio - copiados))
+                if n == 0:
+                    break
+                copiados += n
+            if copiados >= tamanio:
+                return
+        except OSError as e:
+            if e.errno not in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    os.lseek(fd_origen, copiados, os.SEEK_SET)
+    os.lseek(fd_destino, copiados, os.SEEK_SET)
+    while True:
+        bloque = os.read(fd_origen, 1024 * 1024)
+        if not bloque:
+            break
+        os.write(fd_destino, bloque)
+
+def _mover_entre_dispositivos(ruta_origen: str, ruta_destino: str):
+    """
+    Copia el archivo a un temporal junto al destino, sincroniza con fsync, lo coloca con os.replace
+    y después elimina el original. Si algo falla, el original queda intacto.
+    """
+    directorio_destino = os.path.dirname(ruta_destino)
+    ruta_temporal = os.path.join(directorio_destino, f".{os.path.basename(ruta_destino)}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(ruta_origen, 'rb') as origen, open(ruta_temporal, 'xb') as destino:
+            _copiar_contenido(origen.fileno(), destino.fileno(), os.fstat(origen.fileno()).st_size)
+            destino.flush()
+            os.fsync(destino.fileno())
+        shutil.copystat(ruta_origen, ruta_temporal)
+        os.replace(ruta_temporal, ruta_destino)
+    except BaseException:
+        try:
+            os.remove(ruta_temporal)
+        except OSError:
+            pass
+        raise
+    os.remove(ruta_origen)
+
+def mover_archivo(ruta_origen: str, ruta_destino: str) -> bool:
+    """
+    Mueve un archivo. Dentro del mismo dispositivo es un os.rename; entre dispositivos
+    se hace una copia sin búferes de Python seguida de fsync y borrado del original.
+
+    Args:
+        ruta_origen (str): La ruta del archivo a mover.
+        ruta_destino (str): La ruta completa de destino (incluido el nombre del archivo).
+    Returns:
+        bool: True si el archivo fue movido exitosamente, False en caso contrario.
+    """
+    nombre_archivo = os.path.basename(ruta_origen)
+    try:
+        try:
+            os.rename(ruta_origen, ruta_destino)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            _mover_entre_dispositivos(ruta_origen, ruta_destino)
+        return True
+    except FileNotFoundError:
+        if os.path.lexists(ruta_origen):
+            logger.warning(f"La carpeta de destino de {nombre_archivo} no existe: {os.path.dirname(ruta_destino)}")
+        else:
+            logger.warning(f"Archivo no encontrado, omitiendo: {nombre_archivo}")
+        return False
+    except OSError as e:
+        logger.error(f"Error al mover el archivo {nombre_archivo}: {e}")
+        return False
+    except Exception as e:
+        logger.error(f"Un error inesperado ocurrió al mover {nombre_archivo}: {e}")
+        return False
+
+def mover_archivos(movimientos: list[tuple[str, str]], en_progreso=None,
+                   max_concurrencia: int = CONCURRENCIA_COPIAS, al_mover=None) -> list[bool]:
+    """
+    Mueve un lote de archivos. Los movimientos dentro del mismo dispositivo se resuelven primero
+    con os.rename (solo metadatos); los que cruzan dispositivos se reparten en un grupo de hilos.
+
+    Args:
+        movimientos (list[tuple[str, str]]): Pares (ruta_origen, ruta_destino).
+        en_progreso (callable, optional): Callback llamado con (progreso_actual, total) tras cada archivo.
+        max_concurrencia (int): Número máximo de copias entre dispositivos simultáneas.
+        al_mover (callable, optional): Callback llamado con (indice, movido) al terminar cada movimiento,
+                                       posiblemente desde otro hilo.
+    Returns:
+        list[bool]: El resultado de cada movimiento, en el mismo orden que `movimientos`.
+    """
+    total = len(movimientos)
+    resultados = [False] * total
+    completados = 0
+    cerrojo = threading.Lock()
+
+    def notificar(indice):
+        nonlocal completados
+        if al_mover:
+            al_mover(indice, resultados[indice])
+        with cerrojo:
+            completados += 1
+            actual = completados
+        if en_progreso:
+            en_progreso(actual, total)
+
+    # El dispositivo de cada directorio destino se consulta una sola vez
+    dispositivos = {}
+    def dispositivo_de(directorio):
+        if directorio not in dispositivos:
+            dispositivos[directorio] = _dispositivo(directorio)
+        return dispositivos[directorio]
+
+    entre_dispositivos = []
+    for indice, (ruta_origen, ruta_destino) in enumerate(movimientos):
+        dispositivo_origen = dispositivo_de(os.path.dirname(ruta_origen) or '.')
+        dispositivo_destino = dispositivo_de(os.path.dirname(ruta_destino) or '.')
+        if dispositivo_origen is not None and dispositivo_origen != dispositivo_destino:
+            entre_dispositivos.append(indice)
+            continue
+        resultados[indice] = mover_archivo(ruta_origen, ruta_destino)
+        notificar(indice)
+
+    if entre_dispositivos:
+        logger.info(f"Copiando {len(entre_dispositivos)} archivos entre dispositivos con {max_concurrencia} hilos")
+
+        def mover_indice(indice):
+            resultados[indice] = mover_archivo(*movimientos[indice])
+            notificar(indice)
+
+        with ThreadPoolExecutor(max_workers=max_concurrencia) as ejecutor:
+            list(ejecutor.map(mover_indice, entre_dispositivos))
+    return resultados
@@ -1,17 +1,31 @@
 import os
-import shutil
+import re
+import json
+import time
+import html
+import math
+import hashlib
+import fnmatch
 import logging
 from datetime import datetime
-import matplotlib.pyplot as plt
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import Optional, Union
 import io
 import base64
+from collections import OrderedDict
 
 from config import DEFAULT_FOLDERS, LOG_FILE_PATH
+from motor_movimientos import mover_archivo, mover_archivos
+from diario_movimientos import DiarioMovimientos, ruta_diario, cargar_diario, obtener_ejecucion_pendiente
+from firmas_archivos import DetectorFirmas
+from fechas_archivos import LectorFechas, subcarpeta_fecha
+from fragmentador_carpetas import (UbicadorFragmentos, planificar_fragmentacion, guardar_indice, fragmento_de,
+                                   reconstruir_indice)
+from resumen_directorio import ResumenDirectorio, calcular_resumen_directorio
 
 logger = logging.getLogger(__name__)
 
-plt.switch_backend('Agg')
 
 def obtener_carpetas_configuradas(carpetas_personalizadas: list[tuple[str, list[str]]], entradas_carpetas_por_defecto: dict) -> dict[str, list[str]]:
     """
@@ -44,30 +58,274 @@ def obtener_carpetas_configuradas(carpetas_personalizadas: list[tuple[str, list[
     
     for nombre_defecto, extensiones_defecto in mapeo_por_defecto.items():
         if nombre_defecto in carpetas_finales:
-            carpetas_finales[nombre_defecto].extend([ext for ext in extensiones_defecto if ext not in carpetas_finales[nombre_defecto]])
+            # Se crea una lista nueva para no modificar la de la carpeta personalizada entre ejecuciones
+            existentes = set(carpetas_finales[nombre_defecto])
+            carpetas_finales[nombre_defecto] = carpetas_finales[nombre_defecto] + [ext for ext in extensiones_defecto if ext not in existentes]
         else:
             carpetas_finales[nombre_defecto] = extensiones_defecto
     
     carpetas_finales["Otros"] = []
     return carpetas_finales
 
-def crear_directorios_destino(directorio_base: str, carpetas: dict):
+# Tipos de regla adicionales a la extensión, evaluados en orden antes del índice de extensiones
+TIPOS_REGLA = ("glob", "regex", "tamanio_min", "tamanio_max", "antiguedad_min", "antiguedad_max")
+
+_UNIDADES_TAMANIO = {'b': 1, 'kb': 1024, 'mb': 1024 ** 2, 'gb': 1024 ** 3}
+_PATRON_TAMANIO = re.compile(r'^([<>])\s*(\d+(?:\.\d+)?)\s*(b|kb|mb|gb)$', re.IGNORECASE)
+_PATRON_ANTIGUEDAD = re.compile(r'^([<>])\s*(\d+(?:\.\d+)?)\s*d$', re.IGNORECASE)
+
+def interpretar_criterios(texto: str) -> tuple[list[str], list[tuple[str, str]]]:
     """
-    Crea directorios de destino si no existen.
+    Separa el texto de una carpeta personalizada (elementos separados por comas) en extensiones y reglas.
+
+    Además de extensiones ("mp3"), se admiten:
+    - Patrones glob sobre el nombre: "*.tar.gz", "IMG_*".
+    - Expresiones regulares con el prefijo "re:": "re:^factura_\\d+".
+    - Tamaño: ">100MB", "<10KB" (unidades B, KB, MB, GB).
+    - Antigüedad por fecha de modificación: ">30d", "<7d".
+
     Args:
-        directorio_base (str): El directorio raíz donde se crearán las carpetas.
-        carpetas (dict): Un diccionario de nombres de carpetas y sus extensiones.
+        texto (str): El texto introducido por el usuario.
+    Returns:
+        tuple: (extensiones, reglas) donde reglas es una lista de (tipo, valor) con tipo en TIPOS_REGLA.
+    Raises:
+        ValueError: Si una expresión regular no es válida.
+    """
+    extensiones, reglas = [], []
+    for elemento in (parte.strip() for parte in texto.split(',')):
+        if not elemento:
+            continue
+        if elemento.lower().startswith('re:'):
+            patron = elemento[3:]
+            try:
+                re.compile(patron)
+            except re.error as e:
+                raise ValueError(f"Expresión regular no válida '{patron}': {e}") from e
+            reglas.append(("regex", patron))
+        elif coincidencia := _PATRON_TAMANIO.match(elemento):
+            bytes_limite = int(float(coincidencia.group(2)) * _UNIDADES_TAMANIO[coincidencia.group(3).lower()])
+            reglas.append(("tamanio_min" if coincidencia.group(1) == '>' else "tamanio_max", bytes_limite))
+        elif coincidencia := _PATRON_ANTIGUEDAD.match(elemento):
+            dias = float(coincidencia.group(2))
+            reglas.append(("antiguedad_min" if coincidencia.group(1) == '>' else "antiguedad_max", dias))
+        elif any(caracter in elemento for caracter in '*?['):
+            reglas.append(("glob", elemento))
+        else:
+            extensiones.append(elemento.lower().lstrip('.'))
+    return extensiones, reglas
+
+def _compilar_regla(tipo: str, valor):
+    """Convierte una regla (tipo, valor) en una función (nombre_archivo, estado, ahora) -> bool."""
+    if tipo == "glob":
+        patron = re.compile(fnmatch.translate(valor), re.IGNORECASE)
+        return lambda nombre, estado, ahora: patron.match(nombre) is not None
+    if tipo == "regex":
+        patron = re.compile(valor)
+        return lambda nombre, estado, ahora: patron.search(nombre) is not None
+    if tipo == "tamanio_min":
+        return lambda nombre, estado, ahora: estado.st_size > valor
+    if tipo == "tamanio_max":
+        return lambda nombre, estado, ahora: estado.st_size < valor
+    if tipo == "antiguedad_min":
+        segundos = valor * 86400
+        return lambda nombre, estado, ahora: ahora - estado.st_mtime > segundos
+    if tipo == "antiguedad_max":
+        segundos = valor * 86400
+        return lambda nombre, estado, ahora: ahora - estado.st_mtime < segundos
+    raise ValueError(f"Tipo de regla no soportado: {tipo}")
+
+class ReglasOrganizacion:
+    """
+    Configuración de carpetas compilada una sola vez por ejecución.
+
+    Contiene un índice inmutable extensión -> carpeta (consulta O(1) por archivo) y una tupla
+    ordenada de reglas compiladas (glob, regex, tamaño, antigüedad) que se evalúan antes que la extensión.
+    Con un `detector` de firmas, los archivos sin extensión conocida se clasifican por su contenido,
+    y con un lector de `fechas` cada categoría se divide en subcarpetas AAAA/MM.
+    """
+    __slots__ = ("carpetas", "indice_extensiones", "reglas", "firma", "detector", "fechas", "_necesita_estado")
+
+    def __init__(self, carpetas: tuple[str, ...], indice_extensiones: dict[str, str], reglas: tuple, firma: str = None,
+                 detector: Optional[DetectorFirmas] = None, fechas: Optional[LectorFechas] = None):
+        self.carpetas = carpetas
+        self.indice_extensiones = MappingProxyType(indice_extensiones)
+        self.reglas = reglas
+        # Identifica la configuración para la organización incremental; None si el resultado depende de la fecha
+        self.firma = firma
+        self.detector = detector
+        self.fechas = fechas
+        self._necesita_estado = any(necesita_estado for _, _, necesita_estado in reglas)
+
+    def _extension_conocida(self, nombre_archivo: str) -> bool:
+        return '.' in nombre_archivo and nombre_archivo.rsplit('.', 1)[-1].lower() in self.indice_extensiones
+
+    @property
+    def necesita_precarga(self) -> bool:
+        return self.detector is not None or self.fechas is not None
+
+    def _preparar(self, ruta_archivo: str, con_estado: bool):
+        """Consulta (una sola vez) el estado del archivo y llena las cachés del detector y de fechas."""
+        estado = None
+        if con_estado:
+            try:
+                estado = os.stat(ruta_archivo)
+            except OSError as e:
+                logger.warning(f"No se pudo leer la información de {ruta_archivo}: {e}")
+                return None
+        if self.detector is not None and not self._extension_conocida(os.path.basename(ruta_archivo)):
+            self.detector.detectar(ruta_archivo, estado)
+        if self.fechas is not None:
+            self.fechas.obtener(ruta_archivo, estado)
+        return estado
+
+    def precargar(self, rutas_archivos: list[str], con_estado: bool = False) -> list:
+        """
+        Lee de una vez, en paralelo, las cabeceras de los archivos del lote que no tienen extensión conocida
+        y sus fechas, para que carpeta_destino los resuelva desde las cachés.
+
+        Args:
+            rutas_archivos (list[str]): Las rutas del lote.
+            con_estado (bool): Si es True se hace un os.stat de cada archivo y se devuelve.
+        Returns:
+            list[os.stat_result | None]: El estado de cada archivo (None si no se pidió o no se pudo leer).
+        """
+        con_estado = con_estado or self.fechas is not None or self._necesita_estado
+        if not rutas_archivos or not (con_estado or self.detector is not None):
+            return [None] * len(rutas_archivos)
+        with ThreadPoolExecutor() as ejecutor:
+            return list(ejecutor.map(lambda ruta: self._preparar(ruta, con_estado), rutas_archivos))
+
+    def clasificar(self, nombre_archivo: str, ruta_archivo: str = None, estado: os.stat_result = None) -> str:
+        """
+        Devuelve la carpeta de destino de un archivo.
+
+        Args:
+            nombre_archivo (str): El nombre del archivo.
+            ruta_archivo (str, optional): Su ruta completa; solo se usa si hay reglas de tamaño o antigüedad
+                                          y no se proporciona `estado`.
+            estado (os.stat_result, optional): Resultado de os.stat ya conocido, para no repetir la llamada.
+        Returns:
+            str: El nombre de la carpeta de destino ("Otros" si ninguna coincide).
+        """
+        if self.reglas:
+            if estado is None and self._necesita_estado and ruta_archivo:
+                try:
+                    estado = os.stat(ruta_archivo)
+                except OSError as e:
+                    logger.warning(f"No se pudo leer la información de {ruta_archivo}: {e}")
+            ahora = time.time()
+            for carpeta, comprobar, necesita_estado in self.reglas:
+                if necesita_estado and estado is None:
+                    continue
+                if comprobar(nombre_archivo, estado, ahora):
+                    return carpeta
+        extension_archivo = nombre_archivo.rsplit('.', 1)[-1].lower() if '.' in nombre_archivo else ''
+        carpeta = self.indice_extensiones.get(extension_archivo)
+        if carpeta is None and self.detector is not None and ruta_archivo:
+            extension_contenido = self.detector.detectar(ruta_archivo, estado)
+            if extension_contenido:
+                carpeta = self.indice_extensiones.get(extension_contenido)
+        return carpeta or "Otros"
+
+    def carpeta_destino(self, nombre_archivo: str, ruta_archivo: str = None, estado: os.stat_result = None) -> str:
+        """
+        Devuelve la ruta relativa de destino de un archivo: su categoría (ver clasificar) y,
+        si hay lector de fechas, la subcarpeta AAAA/MM.
+        """
+        carpeta = self.clasificar(nombre_archivo, ruta_archivo, estado)
+        if self.fechas is not None and ruta_archivo:
+            fecha = self.fechas.obtener(ruta_archivo, estado)
+            if fecha:
+                return os.path.join(carpeta, subcarpeta_fecha(*fecha))
+        return carpeta
+
+def compilar_reglas(carpetas: dict[str, list[str]], reglas: list[tuple[str, str, object]] = (),
+                    detector: Optional[DetectorFirmas] = None, fechas: Optional[LectorFechas] = None) -> ReglasOrganizacion:
     """
-    for carpeta in carpetas.keys():
-        ruta_carpeta = os.path.join(directorio_base, carpeta)
+    Compila el mapeo de carpetas y las reglas adicionales en un ReglasOrganizacion.
+    Si una extensión aparece en varias carpetas, gana la primera (las personalizadas van antes).
+
+    Args:
+        carpetas (dict): El diccionario que mapea nombres de carpetas a extensiones (ver obtener_carpetas_configuradas).
+        reglas (list[tuple[str, str, object]]): Reglas (carpeta, tipo, valor) en orden de prioridad.
+        detector (DetectorFirmas, optional): Si se indica, los archivos sin extensión conocida se clasifican
+                                             por sus primeros bytes (desactivado por defecto).
+        fechas (LectorFechas, optional): Si se indica, los archivos se colocan en Categoría/AAAA/MM según
+                                         su fecha EXIF o de modificación (desactivado por defecto).
+    Returns:
+        ReglasOrganizacion: La configuración compilada.
+    Raises:
+        ValueError: Si alguna regla no es válida.
+    """
+    indice_extensiones = {}
+    for carpeta, extensiones in carpetas.items():
+        for extension in extensiones:
+            indice_extensiones.setdefault(extension.lower().lstrip('.'), carpeta)
+    nombres_carpetas = list(carpetas)
+    reglas_compiladas = []
+    for carpeta, tipo, valor in reglas:
+        reglas_compiladas.append((carpeta, _compilar_regla(tipo, valor), tipo not in ("glob", "regex")))
+        if carpeta not in nombres_carpetas:
+            nombres_carpetas.append(carpeta)
+    firma = None
+    if not any(tipo.startswith("antiguedad") for _, tipo, _ in reglas):
+        firma = hashlib.sha1(json.dumps(
+            [nombres_carpetas, sorted(indice_extensiones.items()), [list(regla) for regla in reglas],
+             detector is not None, fechas is not None],
+            ensure_ascii=False
+        ).encode('utf-8')).hexdigest()
+    return ReglasOrganizacion(tuple(nombres_carpetas), indice_extensiones, tuple(reglas_compiladas), firma, detector, fechas)
+
+# Directorios de destino que ya se sabe que existen. Se conserva entre ejecuciones de la misma sesión
+# para no repetir makedirs; si alguno desaparece, los movimientos que fallan por ello lo vuelven a crear
+# y se reintentan (ver _recrear_directorios_perdidos).
+_directorios_existentes: set[str] = set()
+
+def crear_directorios_necesarios(directorios) -> int:
+    """
+    Crea, una sola vez cada uno, los directorios indicados que no consten ya como existentes.
+    Solo se registran en el log los que se crean realmente.
+
+    Args:
+        directorios (iterable[str]): Las rutas de los directorios (puede haber repetidos).
+    Returns:
+        int: Número de directorios creados.
+    Raises:
+        OSError: Si alguno no se puede crear.
+    """
+    creados = 0
+    for directorio in {os.path.abspath(directorio) for directorio in directorios} - _directorios_existentes:
         try:
-            os.makedirs(ruta_carpeta, exist_ok=True)
-            logger.info(f"Directorio creado: {ruta_carpeta}")
+            os.makedirs(directorio)
+            creados += 1
+            logger.info(f"Directorio creado: {directorio}")
+        except FileExistsError:
+            if not os.path.isdir(directorio):
+                logger.error(f"Error al crear el directorio {directorio}: ya existe un archivo con ese nombre")
+                raise
         except OSError as e:
-            logger.error(f"Error al crear el directorio {ruta_carpeta}: {e}")
+            logger.error(f"Error al crear el directorio {directorio}: {e}")
             raise
+        _directorios_existentes.add(directorio)
+    return creados
+
+def olvidar_directorios_existentes(directorios=None):
+    """Descarta de la caché de la sesión los directorios indicados (o todos)."""
+    if directorios is None:
+        _directorios_existentes.clear()
+    else:
+        _directorios_existentes.difference_update(os.path.abspath(directorio) for directorio in directorios)
+
+def crear_directorios_destino(directorio_base: str, carpetas: dict):
+    """
+    Crea directorios de destino si no existen.
+    Args:
+        directorio_base (str): El directorio raíz donde se crearán las carpetas.
+        carpetas (dict | tuple): Los nombres de las carpetas (un diccionario de nombres y extensiones o una tupla de nombres).
+    """
+    crear_directorios_necesarios(os.path.join(directorio_base, carpeta) for carpeta in carpetas)
 
-def mover_archivo_unico(ruta_archivo: str, directorio_base_destino: str, carpetas: dict):
+def mover_archivo_unico(ruta_archivo: str, directorio_base_destino: str, reglas: ReglasOrganizacion):
     """
     Mueve un solo archivo a su carpeta de categoría designada.
     Si ninguna categoría coincide, mueve el archivo a la carpeta "Otros".
@@ -75,120 +333,736 @@ def mover_archivo_unico(ruta_archivo: str, directorio_base_destino: str, carpeta
     Args:
         ruta_archivo (str): La ruta completa del archivo a mover.
         directorio_base_destino (str): El directorio base donde se encuentran las carpetas de destino.
-        carpetas (dict): El diccionario que mapea nombres de carpetas a extensiones.
+        reglas (ReglasOrganizacion): La configuración compilada con compilar_reglas. También se acepta
+                                     el diccionario de carpetas, que se compila en cada llamada.
     Returns:
         bool: True si el archivo fue movido exitosamente, False en caso contrario.
     """
+    if isinstance(reglas, dict):
+        reglas = compilar_reglas(reglas)
     nombre_archivo = os.path.basename(ruta_archivo)
-    extension_archivo = nombre_archivo.split('.')[-1].lower() if '.' in nombre_archivo else ''
-    nombre_carpeta_destino = "Otros"
+    nombre_carpeta_destino = reglas.carpeta_destino(nombre_archivo, ruta_archivo)
 
-    for carpeta, exts in carpetas.items():
-        if extension_archivo in exts:
-            nombre_carpeta_destino = carpeta
-            break
+    ruta_destino = UbicadorFragmentos().ubicar(os.path.join(directorio_base_destino, nombre_carpeta_destino, nombre_archivo))
+    crear_directorios_necesarios([os.path.dirname(ruta_destino)])
 
-    ruta_destino = os.path.join(directorio_base_destino, nombre_carpeta_destino, nombre_archivo)
-    
-    try:
-        shutil.move(ruta_archivo, ruta_destino)
+    movido = mover_archivo(ruta_archivo, ruta_destino)
+    if not movido and _recrear_directorios_perdidos([(ruta_archivo, ruta_destino)], [movido]):
+        movido = mover_archivo(ruta_archivo, ruta_destino)
+    if movido:
         logger.info(f"Movido '{nombre_archivo}' a '{nombre_carpeta_destino}'")
         return True
-    except shutil.Error as e:
-        logger.error(f"Error al mover el archivo {nombre_archivo}: {e}")
-        return False
-    except FileNotFoundError:
-        logger.warning(f"Archivo no encontrado, omitiendo: {nombre_archivo}")
-        return False
-    except Exception as e:
-        logger.error(f"Un error inesperado ocurrió al mover {nombre_archivo}: {e}")
-        return False
+    return False
+
+# Número de movimientos que se planifican (y se registran en el diario) antes de empezar a ejecutarlos
+TAMANIO_LOTE_MOVIMIENTOS = 500
+
+def _compilar_patrones(patrones) -> Optional[re.Pattern]:
+    """Une una lista de patrones glob en una sola expresión regular (sin distinguir mayúsculas)."""
+    patrones = [patron.strip() for patron in (patrones or ()) if patron.strip()]
+    if not patrones:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(patron)})" for patron in patrones), re.IGNORECASE)
+
+def recorrer_archivos(dir_origen: str, profundidad_maxima: Optional[int] = 0, incluir=None, excluir=None,
+                      carpetas_omitidas=()):
+    """
+    Generador que recorre un directorio con os.scandir y produce los archivos a medida que los encuentra.
+    El tipo de cada entrada sale de la caché de DirEntry, sin una llamada a stat por archivo.
+
+    Args:
+        dir_origen (str): El directorio a recorrer.
+        profundidad_maxima (int | None): 0 para solo el primer nivel, None para no limitar la profundidad.
+        incluir (list[str], optional): Patrones glob; si se indican, solo se producen los archivos que coinciden
+                                       con alguno (por nombre o por ruta relativa).
+        excluir (list[str], optional): Patrones glob de archivos y carpetas a omitir (por nombre o ruta relativa).
+        carpetas_omitidas (iterable[str]): Nombres de carpetas del primer nivel que no se recorren
+                                           (las carpetas de categoría creadas por el organizador).
+    Yields:
+        tuple[str, str]: (ruta_archivo, ruta_relativa).
+    """
+    patron_incluir = _compilar_patrones(incluir)
+    patron_excluir = _compilar_patrones(excluir)
+    carpetas_omitidas = set(carpetas_omitidas)
+
+    def coincide(patron, nombre, relativa):
+        return patron.match(nombre) is not None or patron.match(relativa) is not None
+
+    pendientes = [(dir_origen, "", 0)]
+    while pendientes:
+        directorio, prefijo, profundidad = pendientes.pop()
+        try:
+            # Se lee el directorio completo antes de mover nada de él, para no alterar la iteración de scandir
+            with os.scandir(directorio) as iterador:
+                entradas = list(iterador)
+        except OSError as e:
+            logger.warning(f"No se pudo leer el directorio {directorio}: {e}")
+            continue
+        subdirectorios = []
+        for entrada in entradas:
+            relativa = prefijo + entrada.name
+            try:
+                if entrada.is_dir(follow_symlinks=False):
+                    if profundidad == 0 and entrada.name in carpetas_omitidas:
+                        continue
+                    if profundidad_maxima is not None and profundidad >= profundidad_maxima:
+                        continue
+                    if patron_excluir and coincide(patron_excluir, entrada.name, relativa):
+                        continue
+                    subdirectorios.append((entrada.path, relativa + os.sep, profundidad + 1))
+                elif entrada.is_file():
+                    if patron_excluir and coincide(patron_excluir, entrada.name, relativa):
+                        continue
+                    if patron_incluir and not coincide(patron_incluir, entrada.name, relativa):
+                        continue
+                    yield entrada.path, relativa
+            except OSError as e:
+                logger.warning(f"No se pudo consultar {entrada.path}: {e}")
+        pendientes.extend(reversed(subdirectorios))
+
+def _crear_filtro_rutas(profundidad_maxima: Optional[int] = 0, incluir=None, excluir=None, carpetas_omitidas=()):
+    """
+    Devuelve una función que, dada una ruta relativa de archivo, indica si recorrer_archivos la produciría
+    con los mismos filtros. Se usa para aplicar esos filtros a una lista de rutas ya conocida.
+    """
+    patron_incluir = _compilar_patrones(incluir)
+    patron_excluir = _compilar_patrones(excluir)
+    carpetas_omitidas = set(carpetas_omitidas)
+
+    def coincide(patron, nombre, relativa):
+        return patron.match(nombre) is not None or patron.match(relativa) is not None
+
+    def acepta(relativa: str) -> bool:
+        partes = relativa.split(os.sep)
+        if profundidad_maxima is not None and len(partes) - 1 > profundidad_maxima:
+            return False
+        if len(partes) > 1 and partes[0] in carpetas_omitidas:
+            return False
+        if patron_excluir:
+            for i, nombre in enumerate(partes):
+                if coincide(patron_excluir, nombre, os.sep.join(partes[:i + 1])):
+                    return False
+        return not patron_incluir or coincide(patron_incluir, partes[-1], relativa)
+
+    return acepta
+
+def _ruta_destino_libre(ruta_destino: str, reservadas: set[str], ubicar=None) -> str:
+    """
+    Devuelve `ruta_destino` o, si ya existe o la ha reservado otro movimiento de la misma ejecución,
+    una variante "nombre (n).ext" libre. La ruta devuelta se añade a `reservadas`.
+    Con `ubicar`, cada nombre candidato se traduce a su ruta real (carpetas fragmentadas).
+    """
+    base, extension = os.path.splitext(ruta_destino)
+    candidata = ubicar(ruta_destino) if ubicar else ruta_destino
+    n = 1
+    while candidata in reservadas or os.path.lexists(candidata):
+        candidata = f"{base} ({n}){extension}"
+        if ubicar:
+            candidata = ubicar(candidata)
+        n += 1
+    reservadas.add(candidata)
+    return candidata
+
+def _precargar_por_lotes(archivos, reglas: ReglasOrganizacion, con_estado: bool = False):
+    """
+    Convierte los (ruta, relativa) de `archivos` en (ruta, relativa, estado), leyendo antes en paralelo
+    los estados, cabeceras y fechas de cada lote (ver ReglasOrganizacion.precargar).
+    """
+    lote = []
+    for archivo in archivos:
+        lote.append(archivo)
+        if len(lote) >= TAMANIO_LOTE_MOVIMIENTOS:
+            yield from ((ruta, relativa, estado) for (ruta, relativa), estado
+                        in zip(lote, reglas.precargar([ruta for ruta, _ in lote], con_estado)))
+            lote = []
+    yield from ((ruta, relativa, estado) for (ruta, relativa), estado
+                in zip(lote, reglas.precargar([ruta for ruta, _ in lote], con_estado)))
+
+def iterar_plan_organizacion(dir_origen: str, reglas: ReglasOrganizacion, profundidad_maxima: Optional[int] = 0,
+                             incluir=None, excluir=None, rutas_candidatas=None, estados_vistos: Optional[dict] = None):
+    """
+    Generador de los movimientos de una organización, calculados a medida que avanza el recorrido.
+    Ver recorrer_archivos para el significado de los filtros.
+
+    Args:
+        rutas_candidatas (iterable[str], optional): Rutas relativas a considerar en lugar de recorrer el
+                                                    directorio (organización incremental); se les aplican los mismos filtros.
+        estados_vistos (dict, optional): Si se indica, se llena con (st_dev, inodo) -> (tamaño, mtime_ns) de cada archivo
+                                         planificado, para que el resumen posterior no vuelva a consultarlos.
+    Yields:
+        tuple[str, str]: (ruta_origen, ruta_destino).
+    """
+    if rutas_candidatas is None:
+        archivos = recorrer_archivos(dir_origen, profundidad_maxima, incluir, excluir, reglas.carpetas)
+    else:
+        acepta = _crear_filtro_rutas(profundidad_maxima, incluir, excluir, reglas.carpetas)
+        archivos = ((os.path.join(dir_origen, relativa), relativa) for relativa in rutas_candidatas if acepta(relativa))
+    reservadas = set()
+    ubicador = UbicadorFragmentos()
+    if reglas.necesita_precarga or estados_vistos is not None:
+        archivos = _precargar_por_lotes(archivos, reglas, estados_vistos is not None)
+    else:
+        archivos = ((ruta, relativa, None) for ruta, relativa in archivos)
+    for ruta_archivo, _, estado in archivos:
+        nombre_archivo = os.path.basename(ruta_archivo)
+        if estado is not None and estados_vistos is not None:
+            estados_vistos[(estado.st_dev, estado.st_ino)] = (estado.st_size, estado.st_mtime_ns)
+        nombre_carpeta_destino = reglas.carpeta_destino(nombre_archivo, ruta_archivo, estado)
+        ruta_destino = os.path.join(dir_origen, nombre_carpeta_destino, nombre_archivo)
+        yield ruta_archivo, _ruta_destino_libre(ruta_destino, reservadas, ubicador.ubicar)
+
+def planificar_organizacion(dir_origen: str, reglas: ReglasOrganizacion, profundidad_maxima: Optional[int] = 0,
+                            incluir=None, excluir=None) -> list[tuple[str, str]]:
+    """
+    Calcula los movimientos de una organización sin tocar ningún archivo.
+
+    Args:
+        dir_origen (str): El directorio a organizar.
+        reglas (ReglasOrganizacion): La configuración compilada con compilar_reglas.
+        profundidad_maxima, incluir, excluir: Ver recorrer_archivos.
+    Returns:
+        list[tuple[str, str]]: Pares (ruta_origen, ruta_destino).
+    """
+    return list(iterar_plan_organizacion(dir_origen, reglas, profundidad_maxima, incluir, excluir))
+
+def _separar_movimientos_pendientes(pendiente: dict) -> tuple[list[int], list[int]]:
+    """
+    Índices del plan de una ejecución interrumpida que faltan por mover, y los que se movieron
+    antes de la interrupción sin llegar a registrarse en el diario.
+    """
+    indices, recuperados = [], []
+    for i, (ruta_origen, ruta_destino) in enumerate(pendiente["movimientos"]):
+        if i in pendiente["hechos"]:
+            continue
+        if not os.path.lexists(ruta_origen) and os.path.lexists(ruta_destino):
+            recuperados.append(i)
+        else:
+            indices.append(i)
+    return indices, recuperados
+
+def _recrear_directorios_perdidos(movimientos: list[tuple[str, str]], resultados: list[bool]) -> list[int]:
+    """
+    Un directorio de destino borrado durante la sesión sigue en la caché de existentes y los movimientos
+    hacia él fallan. Recrea los directorios de los movimientos fallidos cuyo origen sigue ahí y cuyo destino
+    ya no existe.
+
+    Returns:
+        list[int]: Posiciones de `movimientos` que conviene reintentar.
+    """
+    sin_directorio = [posicion for posicion, movido in enumerate(resultados)
+                      if not movido and os.path.lexists(movimientos[posicion][0])
+                      and not os.path.isdir(os.path.dirname(movimientos[posicion][1]))]
+    if sin_directorio:
+        directorios = {os.path.dirname(movimientos[posicion][1]) for posicion in sin_directorio}
+        olvidar_directorios_existentes(directorios)
+        crear_directorios_necesarios(directorios)
+    return sin_directorio
+
+def _ejecutar_movimientos_con_diario(diario: DiarioMovimientos, movimientos: list[tuple[str, str]], indices: list[int],
+                                     tipo_registro: str, en_progreso=None, fallidos: list = None) -> int:
+    """
+    Mueve los elementos `indices` de `movimientos` registrando en el diario cada uno que se completa.
+    Si se pasa `fallidos`, se le añaden los índices que no se pudieron mover.
+    """
+    resultados = mover_archivos(
+        [movimientos[i] for i in indices],
+        en_progreso,
+        al_mover=lambda posicion, movido: movido and diario.registrar(tipo_registro, indices[posicion])
+    )
+    sin_directorio = _recrear_directorios_perdidos([movimientos[i] for i in indices], resultados)
+    if sin_directorio:
+        reintentos = [indices[posicion] for posicion in sin_directorio]
+        resultados_reintento = mover_archivos(
+            [movimientos[i] for i in reintentos],
+            al_mover=lambda posicion, movido: movido and diario.registrar(tipo_registro, reintentos[posicion])
+        )
+        for posicion, movido in zip(sin_directorio, resultados_reintento):
+            resultados[posicion] = movido
+    for i, movido in zip(indices, resultados):
+        if not movido and fallidos is not None:
+            fallidos.append(i)
+        if movido:
+            ruta_origen, ruta_destino = movimientos[i]
+            logger.info(f"Movido '{os.path.basename(ruta_origen)}' a '{os.path.basename(os.path.dirname(ruta_destino))}'")
+    return sum(resultados)
+
+def _fragmentar_carpetas_desbordadas(diario: DiarioMovimientos, movimientos: list[tuple[str, str]],
+                                     carpetas: set[str], max_entradas: int, fallidos: list = None) -> int:
+    """
+    Reparte en fragmentos (ver fragmentador_carpetas) las `carpetas` que superan `max_entradas` archivos.
+    Los movimientos se añaden a `movimientos` y al diario, de modo que deshacer también los revierte.
+    El índice de cada carpeta se escribe antes de mover, para que los archivos sigan localizables
+    si la ejecución se interrumpe. Si se pasa `fallidos`, se le añaden los índices que no se pudieron mover.
+
+    Returns:
+        int: Número de archivos recolocados.
+    """
+    recolocados = 0
+    for carpeta in sorted(carpetas):
+        caracteres, plan = planificar_fragmentacion(carpeta, max_entradas)
+        if not plan:
+            continue
+        logger.info(f"Fragmentando {carpeta}: {len(plan)} archivos en subcarpetas de {caracteres} caracteres")
+        guardar_indice(carpeta, caracteres, max_entradas)
+        ubicar = lambda ruta, c=caracteres: os.path.join(os.path.dirname(ruta), fragmento_de(os.path.basename(ruta), c),
+                                                          os.path.basename(ruta))
+        reservadas = set()
+        plan = [(ruta_origen, _ruta_destino_libre(os.path.join(carpeta, os.path.basename(ruta_destino)), reservadas, ubicar))
+                for ruta_origen, ruta_destino in plan]
+        crear_directorios_necesarios(os.path.dirname(ruta_destino) for _, ruta_destino in plan)
+        inicio = len(movimientos)
+        movimientos.extend(plan)
+        diario.planificar(plan)
+        recolocados += _ejecutar_movimientos_con_diario(diario, movimientos, list(range(inicio, len(movimientos))), "hecho",
+                                                      fallidos=fallidos)
+        # Los fragmentos anteriores que han quedado vacíos (refragmentación) se eliminan
+        for carpeta_anterior in {os.path.dirname(ruta_origen) for ruta_origen, _ in plan} - {carpeta}:
+            try:
+                os.rmdir(carpeta_anterior)
+                olvidar_directorios_existentes([carpeta_anterior])
+            except OSError:
+                pass
+    return recolocados
+
+def organizar_lote_archivos(dir_origen: str, rutas_archivos: list[str], reglas: ReglasOrganizacion) -> list[tuple[str, str]]:
+    """
+    Clasifica y mueve un lote concreto de archivos de `dir_origen` sin recorrer el directorio
+    (lo usa el modo vigilancia). Estos movimientos no se registran en el diario.
 
-def organizar_archivos_en_directorio(dir_origen: str, carpetas: dict, en_progreso=None):
+    Args:
+        dir_origen (str): El directorio organizado (donde están las carpetas de categoría).
+        rutas_archivos (list[str]): Las rutas de los archivos a organizar.
+        reglas (ReglasOrganizacion): La configuración compilada con compilar_reglas.
+    Returns:
+        list[tuple[str, str]]: Los movimientos (ruta_origen, ruta_destino) que se completaron.
+    """
+    reservadas = set()
+    ubicador = UbicadorFragmentos()
+    movimientos = []
+    for ruta_archivo, estado in zip(rutas_archivos, reglas.precargar(rutas_archivos)):
+        nombre_archivo = os.path.basename(ruta_archivo)
+        nombre_carpeta_destino = reglas.carpeta_destino(nombre_archivo, ruta_archivo, estado)
+        movimientos.append((ruta_archivo, _ruta_destino_libre(os.path.join(dir_origen, nombre_carpeta_destino, nombre_archivo), reservadas, ubicador.ubicar)))
+    crear_directorios_necesarios(os.path.dirname(ruta_destino) for _, ruta_destino in movimientos)
+    resultados = mover_archivos(movimientos)
+    reintentos = _recrear_directorios_perdidos(movimientos, resultados)
+    for posicion, movido in zip(reintentos, mover_archivos([movimientos[posicion] for posicion in reintentos])):
+        resultados[posicion] = movido
+    movidos = [movimiento for movimiento, movido in zip(movimientos, resultados) if movido]
+    for ruta_origen, ruta_destino in movidos:
+        logger.info(f"Movido '{os.path.basename(ruta_origen)}' a '{os.path.basename(os.path.dirname(ruta_destino))}'")
+    return movidos
+
+def organizar_archivos_en_directorio(dir_origen: str, carpetas: Union[dict, ReglasOrganizacion], en_progreso=None,
+                                     profundidad_maxima: Optional[int] = 0, incluir=None, excluir=None,
+                                     instantaneas=None, max_entradas_carpeta: Optional[int] = None,
+                                     estados_vistos: Optional[dict] = None, catalogo=None):
     """
     Orquesta el proceso de organización de archivos para un directorio dado.
     
     Args:
         dir_origen (str): El directorio a organizar.
-        carpetas (dict): El diccionario que mapea nombres de carpetas a extensiones.
+        carpetas (dict | ReglasOrganizacion): El diccionario que mapea nombres de carpetas a extensiones,
+                                              o la configuración ya compilada con compilar_reglas.
         en_progreso (callable, optional): Una función de callback para actualizar el progreso.
-                                         Se llamará con (progreso_actual, total).
+                                         Se llamará con (progreso_actual, total). Mientras dura el recorrido,
+                                         `total` es el número de archivos encontrados hasta el momento.
+        profundidad_maxima (int | None): 0 organiza solo el primer nivel; con un número mayor o None también
+                                         se recogen los archivos de las subcarpetas (las de categoría se omiten).
+        incluir (list[str], optional): Patrones glob de los archivos a organizar.
+        excluir (list[str], optional): Patrones glob de archivos y carpetas a omitir.
+        instantaneas (InstantaneasDirectorio, optional): Si se indica, la organización es incremental: solo se
+                                                         consideran los archivos nuevos o modificados desde la
+                                                         ejecución anterior con la misma configuración.
+        max_entradas_carpeta (int, optional): Si se indica, las carpetas de destino que superen este número de
+                                              archivos se reparten en subcarpetas por prefijo de hash
+                                              (ver fragmentador_carpetas).
+        estados_vistos (dict, optional): Si se indica, se llena con (st_dev, inodo) -> (tamaño, mtime_ns) de los archivos
+                                         planificados, para pasarlo a resumir_archivos_directorio.
+        catalogo (CatalogoArchivos, optional): Si se indica, los archivos movidos se trasladan en el catálogo
+                                               (conservando su hash y sus dimensiones).
     Retorna:
         int: Número de archivos organizados.
+
+    El recorrido es un generador sobre os.scandir: los archivos se mueven por lotes mientras el recorrido
+    continúa, sin esperar a conocer la lista completa. Si el destino ya existe se añade " (n)" al nombre.
+    Solo se crean las carpetas de destino que necesita cada lote (ver crear_directorios_necesarios).
+
+    Los movimientos dentro del mismo dispositivo se hacen con os.rename y los que cruzan
+    dispositivos (carpetas destino montadas en otro sistema de archivos) en paralelo (ver motor_movimientos).
+
+    Cada ejecución escribe un diario (ver diario_movimientos). Si la ejecución anterior sobre el mismo
+    directorio quedó interrumpida, se reanuda a partir de su plan (sin volver a escanear ni a clasificar)
+    y las reglas recibidas se ignoran.
     """
-    try:
-        crear_directorios_destino(dir_origen, carpetas)
-    except Exception as e:
-        logger.error(f"Falló la creación de directorios de destino: {e}")
-        raise
-
-    archivos_a_procesar = [f for f in os.listdir(dir_origen) if os.path.isfile(os.path.join(dir_origen, f))]
-    total_archivos = len(archivos_a_procesar)
-    logger.info(f"Iniciando organización de {total_archivos} archivos en {dir_origen}")
-    
+    reglas = compilar_reglas(carpetas) if isinstance(carpetas, dict) else carpetas
+    ruta = ruta_diario(dir_origen)
+    pendiente = obtener_ejecucion_pendiente(dir_origen)
+    if pendiente:
+        movimientos = pendiente["movimientos"]
+        indices, recuperados = _separar_movimientos_pendientes(pendiente)
+        logger.info(f"Reanudando la organización interrumpida de {dir_origen}: "
+                    f"{len(pendiente['hechos']) + len(recuperados)} movimientos hechos, {len(indices)} pendientes")
+        with DiarioMovimientos(ruta) as diario:
+            for i in recuperados:
+                diario.registrar("hecho", i)
+            try:
+                crear_directorios_necesarios(os.path.dirname(movimientos[i][1]) for i in indices)
+            except Exception as e:
+                logger.error(f"Falló la creación de directorios de destino: {e}")
+                raise
+            fallidos = []
+            contador_organizados = _ejecutar_movimientos_con_diario(diario, movimientos, indices, "hecho", en_progreso, fallidos)
+            diario.finalizar()
+        if instantaneas is not None:
+            # La ejecución interrumpida no llegó a quitar sus orígenes de la instantánea
+            instantaneas.olvidar(dir_origen, "organizar", [os.path.relpath(ruta_origen, dir_origen) for ruta_origen, _ in movimientos])
+        if catalogo is not None:
+            catalogo.registrar_movimientos([movimientos[i] for i in sorted(set(indices) - set(fallidos))])
+        logger.info("Organización de archivos completada.")
+        return contador_organizados
+
+    rutas_candidatas = None
+    if instantaneas is not None:
+        diferencia = instantaneas.actualizar(dir_origen, "organizar", profundidad_maxima, reglas.carpetas)
+        firma = None
+        if reglas.firma:
+            firma = hashlib.sha1(json.dumps([reglas.firma, profundidad_maxima, incluir or [], excluir or []]).encode('utf-8')).hexdigest()
+        if firma and not diferencia.es_primera and instantaneas.obtener_firma(dir_origen, "organizar") == firma:
+            rutas_candidatas = sorted([*diferencia.nuevos, *diferencia.modificados])
+            logger.info(f"Organización incremental: {len(rutas_candidatas)} archivos nuevos o modificados")
+        instantaneas.guardar_firma(dir_origen, "organizar", firma)
+
+    logger.info(f"Iniciando organización de archivos en {dir_origen}")
+
+    # Un diario nuevo sustituye al de la ejecución anterior (solo se puede deshacer la última)
+    if os.path.exists(ruta):
+        os.remove(ruta)
+    movimientos = []
+    fallidos = []
+    fallidos_fragmentacion = []
     contador_organizados = 0
-    for i, nombre_archivo in enumerate(archivos_a_procesar):
-        ruta_archivo = os.path.join(dir_origen, nombre_archivo)
-        if mover_archivo_unico(ruta_archivo, dir_origen, carpetas):
-            contador_organizados += 1
-        if en_progreso:
-            en_progreso((i + 1), total_archivos)
+    with DiarioMovimientos(ruta) as diario:
+        diario.iniciar(dir_origen)
+        lote = []
+        plan = iterar_plan_organizacion(dir_origen, reglas, profundidad_maxima, incluir, excluir, rutas_candidatas,
+                                        estados_vistos)
+        while True:
+            movimiento = next(plan, None)
+            if movimiento is not None:
+                lote.append(movimiento)
+            if lote and (movimiento is None or len(lote) >= TAMANIO_LOTE_MOVIMIENTOS):
+                # Solo se crean las carpetas que necesita el lote ya clasificado, una vez cada una
+                crear_directorios_necesarios(os.path.dirname(ruta_destino) for _, ruta_destino in lote)
+                inicio_lote = len(movimientos)
+                movimientos.extend(lote)
+                diario.planificar(lote)
+                contador_organizados += _ejecutar_movimientos_con_diario(
+                    diario, movimientos, list(range(inicio_lote, len(movimientos))), "hecho",
+                    (lambda actual, _, base=inicio_lote: en_progreso(base + actual, len(movimientos))) if en_progreso else None,
+                    fallidos
+                )
+                lote = []
+            if movimiento is None:
+                break
+        total_planificados = len(movimientos)
+        if max_entradas_carpeta:
+            ubicador = UbicadorFragmentos()
+            movidos = set(range(len(movimientos))) - set(fallidos)
+            carpetas_tocadas = {ubicador.carpeta_logica(os.path.dirname(movimientos[i][1])) for i in movidos}
+            _fragmentar_carpetas_desbordadas(diario, movimientos, carpetas_tocadas, max_entradas_carpeta, fallidos_fragmentacion)
+        diario.finalizar()
+
+    if instantaneas is not None and total_planificados:
+        # La instantánea se tomó antes de mover: se quitan todos los orígenes planificados. Así se vuelven a
+        # intentar los que no se pudieron mover, y un archivo devuelto a su sitio (mv conserva tamaño y mtime)
+        # cuenta como nuevo en lugar de como sin cambios
+        instantaneas.olvidar(dir_origen, "organizar",
+                             [os.path.relpath(ruta_origen, dir_origen) for ruta_origen, _ in movimientos[:total_planificados]])
+    if catalogo is not None:
+        # En orden: un archivo refragmentado aparece primero en su lote y después en la fragmentación
+        no_movidos = set(fallidos) | set(fallidos_fragmentacion)
+        catalogo.registrar_movimientos([movimiento for i, movimiento in enumerate(movimientos) if i not in no_movidos])
             
-    logger.info("Organización de archivos completada.")
+    logger.info(f"Organización de archivos completada ({contador_organizados} de {total_planificados} archivos).")
     return contador_organizados
 
-def resumir_archivos_directorio(dir_origen: str) -> dict[str, float]:
+def deshacer_ultima_organizacion(dir_origen: str, en_progreso=None, instantaneas=None, catalogo=None) -> int:
+    """
+    Deshace la última organización del directorio recorriendo su diario en orden inverso
+    y devolviendo cada archivo movido a su ruta original. También sirve para ejecuciones interrumpidas.
+    Los archivos cuyo origen ya está ocupado por otro archivo se dejan donde están.
+
+    Args:
+        dir_origen (str): El directorio organizado.
+        en_progreso (callable, optional): Callback llamado con (progreso_actual, total).
+        instantaneas (InstantaneasDirectorio, optional): Si se indica, se descarta la configuración de la
+                                                         organización incremental para que la próxima ejecución
+                                                         vuelva a considerar los archivos devueltos.
+        catalogo (CatalogoArchivos, optional): Si se indica, los archivos devueltos se trasladan en el catálogo.
+    Returns:
+        int: Número de archivos devueltos a su ubicación original.
+    """
+    ruta = ruta_diario(dir_origen)
+    estado = cargar_diario(ruta)
+    if not estado or estado["revertido"]:
+        logger.info(f"No hay ninguna organización que deshacer en {dir_origen}")
+        return 0
+    movimientos = estado["movimientos"]
+    inversos = [(destino, origen) for origen, destino in movimientos]
+    indices = []
+    for i in sorted(estado["hechos"] - estado["revertidos"], reverse=True):
+        ruta_destino, ruta_origen = inversos[i]
+        if os.path.lexists(ruta_origen):
+            logger.warning(f"No se deshace '{ruta_destino}': ya existe un archivo en '{ruta_origen}'")
+            continue
+        indices.append(i)
+    logger.info(f"Deshaciendo {len(indices)} movimientos en {dir_origen}")
+    # Las carpetas de origen pueden no existir ya (p. ej. fragmentos vaciados al refragmentar)
+    carpetas_origen = {os.path.dirname(inversos[i][1]) for i in indices}
+    olvidar_directorios_existentes(carpetas_origen)
+    crear_directorios_necesarios(carpetas_origen)
+    fallidos = []
+    with DiarioMovimientos(ruta) as diario:
+        revertidos = _ejecutar_movimientos_con_diario(diario, inversos, indices, "revertido", en_progreso, fallidos)
+        diario.finalizar("revertido_fin")
+    if catalogo is not None:
+        no_revertidos = set(fallidos)
+        catalogo.registrar_movimientos([inversos[i] for i in indices if i not in no_revertidos])
+    ubicador = UbicadorFragmentos()
+    for carpeta in {ubicador.carpeta_logica(os.path.dirname(inversos[i][0])) for i in indices}:
+        reconstruir_indice(carpeta)
+    # reconstruir_indice puede haber borrado fragmentos vacíos
+    olvidar_directorios_existentes()
+    if instantaneas is not None:
+        instantaneas.guardar_firma(dir_origen, "organizar", None)
+    logger.info("Organización deshecha.")
+    return revertidos
+
+def previsualizar_organizacion(dir_origen: str, carpetas: Union[dict, ReglasOrganizacion], profundidad_maxima: Optional[int] = 0,
+                               incluir=None, excluir=None) -> tuple[list[tuple[str, str]], bool]:
+    """
+    Simulación (dry run): devuelve lo que haría organizar_archivos_en_directorio sin mover nada.
+    Si hay una ejecución interrumpida, la vista previa son sus movimientos pendientes según el diario.
+
+    Returns:
+        tuple: (movimientos, es_reanudacion).
+    """
+    pendiente = obtener_ejecucion_pendiente(dir_origen)
+    if pendiente:
+        indices, _ = _separar_movimientos_pendientes(pendiente)
+        return [pendiente["movimientos"][i] for i in indices], True
+    reglas = compilar_reglas(carpetas) if isinstance(carpetas, dict) else carpetas
+    return planificar_organizacion(dir_origen, reglas, profundidad_maxima, incluir, excluir), False
+
+def formatear_texto_previsualizacion(movimientos: list[tuple[str, str]], es_reanudacion: bool = False,
+                                     max_lineas: int = 200) -> str:
+    """
+    Formatea una vista previa de movimientos: recuento por carpeta y las primeras `max_lineas` operaciones.
+    """
+    if not movimientos:
+        return "No hay archivos que mover."
+    por_carpeta = {}
+    for _, ruta_destino in movimientos:
+        carpeta = os.path.basename(os.path.dirname(ruta_destino))
+        por_carpeta[carpeta] = por_carpeta.get(carpeta, 0) + 1
+    lineas = ["Reanudación de una organización interrumpida (vista previa):" if es_reanudacion else "Vista previa (no se ha movido nada):"]
+    lineas += [f"{carpeta}: {cantidad} archivos" for carpeta, cantidad in sorted(por_carpeta.items(), key=lambda x: -x[1])]
+    lineas.append("")
+    for origen, destino in movimientos[:max_lineas]:
+        carpeta_destino = os.path.dirname(destino)
+        lineas.append(f"{os.path.relpath(origen, os.path.dirname(carpeta_destino))} -> {os.path.basename(carpeta_destino)}/{os.path.basename(destino)}")
+    if len(movimientos) > max_lineas:
+        lineas.append(f"... y {len(movimientos) - max_lineas} más")
+    return "\n".join(lineas)
+
+def obtener_resumen_directorio(dir_origen: str, instantaneas=None, estados_conocidos: Optional[dict] = None,
+                               catalogo=None) -> ResumenDirectorio:
+    """
+    Calcula el resumen completo de un directorio: bytes y número de archivos por extensión y los archivos
+    más grandes (ver resumen_directorio). Hace una sola pasada con os.scandir repartida entre varios hilos.
+
+    Args:
+        dir_origen (str): El directorio a resumir.
+        instantaneas (InstantaneasDirectorio, optional): Si se indica, el resumen se actualiza con la diferencia
+                                                         respecto a la instantánea anterior en lugar de recalcularse.
+        estados_conocidos (dict, optional): (st_dev, inodo) -> (tamaño, mtime_ns) ya consultados, p. ej. los `estados_vistos`
+                                            de organizar_archivos_en_directorio; esos archivos no se vuelven a consultar.
+        catalogo (CatalogoArchivos, optional): Si se indica, el resumen se calcula sobre el catálogo compartido,
+                                               que solo vuelve a listar los directorios modificados. Tiene
+                                               preferencia sobre `instantaneas` e incluye los bytes por directorio.
+    Returns:
+        ResumenDirectorio: El resumen.
+    """
+    if catalogo is not None:
+        catalogo.actualizar(dir_origen, estados_conocidos=estados_conocidos)
+        return catalogo.resumir(dir_origen)
+    if instantaneas is not None:
+        instantaneas.actualizar(dir_origen, "resumen", estados_conocidos=estados_conocidos)
+        return instantaneas.obtener_detalle(dir_origen, "resumen")
+    return calcular_resumen_directorio(dir_origen, estados_conocidos)
+
+def resumir_archivos_directorio(dir_origen: str, instantaneas=None, estados_conocidos: Optional[dict] = None,
+                                catalogo=None) -> dict[str, float]:
     """
     Calcula el tamaño total de los archivos agrupados por sus extensiones dentro de un directorio.
     Args:
         dir_origen (str): El directorio a resumir.
+        instantaneas, estados_conocidos, catalogo: Ver obtener_resumen_directorio.
     Returns:
         dict: Un diccionario donde las claves son extensiones de archivo y los valores son sus tamaños totales en MB.
     """
-    tamanios_archivos = {}
-    for raiz, _, archivos in os.walk(dir_origen):
-        for archivo in archivos:
-            ruta_archivo = os.path.join(raiz, archivo)
-            if os.path.isfile(ruta_archivo):
-                try:
-                    ext = os.path.splitext(archivo)[1].lower()
-                    tamanio = os.path.getsize(ruta_archivo) / (1024 * 1024)
-                    tamanios_archivos[ext] = tamanios_archivos.get(ext, 0) + tamanio
-                except OSError as e:
-                    logger.warning(f"No se pudo obtener el tamaño para {ruta_archivo}: {e}")
-    return tamanios_archivos
+    return tamanios_en_mb(obtener_resumen_directorio(dir_origen, instantaneas, estados_conocidos, catalogo))
+
+def tamanios_en_mb(resumen: ResumenDirectorio) -> dict[str, float]:
+    """Tamaños por extensión del resumen, en MB (el formato que usan formatear_texto_resumen y el gráfico)."""
+    return {ext: tamanio / (1024 * 1024) for ext, tamanio in resumen.bytes_por_extension.items()}
 
-def formatear_texto_resumen(tamanios_archivos: dict[str, float]) -> str:
+def formatear_texto_resumen(tamanios_archivos: dict[str, float], resumen: Optional[ResumenDirectorio] = None) -> str:
     """
     Formatea el resumen del tamaño de los archivos en una cadena legible por humanos.
     Args:
         tamanios_archivos (dict): Diccionario de extensiones de archivo y sus tamaños.
+        resumen (ResumenDirectorio, optional): Si se indica, se añaden el número de archivos por extensión
+                                               y la lista de los archivos más grandes.
     Returns:
         str: Cadena de resumen formateada.
     """
     if not tamanios_archivos:
         return "No hay archivos para resumir o el directorio está vacío."
     archivos_ordenados = sorted(tamanios_archivos.items(), key=lambda x: x[1], reverse=True)
-    return "\n".join([f"{ext.upper()[1:]}: {tamanio:.1f} MB" for ext, tamanio in archivos_ordenados])
+    if resumen is None:
+        return "\n".join([f"{ext.upper()[1:]}: {tamanio:.1f} MB" for ext, tamanio in archivos_ordenados])
+    lineas = [f"{ext.upper()[1:] or '(sin extensión)'}: {tamanio:.1f} MB en {resumen.archivos_por_extension.get(ext, 0)} archivos"
+              for ext, tamanio in archivos_ordenados]
+    lineas.append(f"Total: {resumen.total_bytes / (1024 * 1024):.1f} MB en {resumen.total_archivos} archivos")
+    if resumen.mayores:
+        lineas.append("")
+        lineas.append("Archivos más grandes:")
+        lineas.extend(f"{tamanio / (1024 * 1024):.1f} MB  {ruta}" for tamanio, ruta in resumen.mayores)
+    return "\n".join(lineas)
+
+# Paleta fija de los gráficos de resumen (colores cualitativos)
+PALETA_GRAFICO = (
+    "#8dd3c7", "#ffffb3", "#bebada", "#fb8072", "#80b1d3", "#fdb462",
+    "#b3de69", "#fccde5", "#d9d9d9", "#bc80bd", "#ccebc5", "#ffed6f",
+)
+
+# Número máximo de sectores; el resto de extensiones se agrupa en "Otros"
+MAX_SECCIONES_GRAFICO = 10
+
+# Gráficos ya calculados, por hash del diccionario de tamaños (los más recientes)
+_MAX_GRAFICOS_EN_CACHE = 32
+_cache_graficos: "OrderedDict[tuple, object]" = OrderedDict()
+
+def _clave_tamanios(tamanios_archivos: dict[str, float]) -> str:
+    """Hash estable del diccionario de tamaños (redondeado a KB), para memorizar los gráficos."""
+    contenido = json.dumps(sorted((ext, round(tamanio, 3)) for ext, tamanio in tamanios_archivos.items()))
+    return hashlib.sha1(contenido.encode('utf-8')).hexdigest()
+
+def _memorizar_grafico(tipo: str, tamanios_archivos: dict[str, float], generar, *parametros):
+    clave = (tipo, _clave_tamanios(tamanios_archivos), *parametros)
+    if clave in _cache_graficos:
+        _cache_graficos.move_to_end(clave)
+        return _cache_graficos[clave]
+    resultado = generar()
+    _cache_graficos[clave] = resultado
+    if len(_cache_graficos) > _MAX_GRAFICOS_EN_CACHE:
+        _cache_graficos.popitem(last=False)
+    return resultado
 
-def generar_grafico_resumen(tamanios_archivos: dict[str, float]) -> str:
+def calcular_secciones_grafico(tamanios_archivos: dict[str, float]) -> tuple[tuple[str, float, float, str], ...]:
+    """
+    Calcula los sectores del gráfico circular de tamaños por tipo, listos para dibujarse con los
+    controles nativos de la interfaz o en SVG. El resultado se memoriza por el hash de `tamanios_archivos`.
+
+    Args:
+        tamanios_archivos (dict): Diccionario de extensiones de archivo y sus tamaños en MB.
+    Returns:
+        tuple: Sectores (etiqueta, tamaño en MB, porcentaje, color), de mayor a menor.
+    """
+    def generar():
+        total = sum(tamanios_archivos.values())
+        if total <= 0:
+            return ()
+        ordenados = sorted(tamanios_archivos.items(), key=lambda x: x[1], reverse=True)
+        if len(ordenados) > MAX_SECCIONES_GRAFICO:
+            resto = sum(tamanio for _, tamanio in ordenados[MAX_SECCIONES_GRAFICO - 1:])
+            ordenados = ordenados[:MAX_SECCIONES_GRAFICO - 1] + [(".otros", resto)]
+        return tuple(
+            (ext.upper()[1:] or "(sin extensión)", tamanio, tamanio * 100 / total, PALETA_GRAFICO[i % len(PALETA_GRAFICO)])
+            for i, (ext, tamanio) in enumerate(ordenados)
+        )
+    return _memorizar_grafico("secciones", tamanios_archivos, generar)
+
+def generar_svg_resumen(tamanios_archivos: dict[str, float], lado: int = 300) -> str:
+    """
+    Dibuja el gráfico circular de tamaños por tipo como un SVG pequeño (sin matplotlib). Memorizado por
+    el hash de `tamanios_archivos`.
+
+    Args:
+        tamanios_archivos (dict): Diccionario de extensiones de archivo y sus tamaños en MB.
+        lado (int): Ancho y alto del círculo en píxeles (la leyenda se añade a la derecha).
+    Returns:
+        str: El documento SVG, o una cadena vacía si no hay datos.
+    """
+    def generar():
+        secciones = calcular_secciones_grafico(tamanios_archivos)
+        if not secciones:
+            return ""
+        radio = lado / 2 - 4
+        centro = lado / 2
+        partes = []
+        angulo = -math.pi / 2
+        for etiqueta, _, porcentaje, color in secciones:
+            if porcentaje >= 99.999:
+                partes.append(f'<circle cx="{centro:.1f}" cy="{centro:.1f}" r="{radio:.1f}" fill="{color}"/>')
+                continue
+            fin = angulo + 2 * math.pi * porcentaje / 100
+            x1, y1 = centro + radio * math.cos(angulo), centro + radio * math.sin(angulo)
+            x2, y2 = centro + radio * math.cos(fin), centro + radio * math.sin(fin)
+            arco_grande = 1 if porcentaje > 50 else 0
+            partes.append(f'<path d="M{centro:.1f},{centro:.1f} L{x1:.2f},{y1:.2f} '
+                          f'A{radio:.1f},{radio:.1f} 0 {arco_grande} 1 {x2:.2f},{y2:.2f} Z" fill="{color}"/>')
+            angulo = fin
+        for i, (etiqueta, tamanio, porcentaje, color) in enumerate(secciones):
+            y = 16 + i * 20
+            partes.append(f'<rect x="{lado + 10}" y="{y - 10}" width="12" height="12" fill="{color}"/>')
+            partes.append(f'<text x="{lado + 28}" y="{y}" font-size="12" font-family="sans-serif">'
+                          f'{html.escape(etiqueta)} {porcentaje:.1f}% ({tamanio:.1f} MB)</text>')
+        ancho = lado + 190
+        return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{ancho}" height="{lado}" viewBox="0 0 {ancho} {lado}">'
+                + "".join(partes) + "</svg>")
+    return _memorizar_grafico("svg", tamanios_archivos, generar, lado)
+
+def generar_grafico_resumen(tamanios_archivos: dict[str, float], dpi: int = 100) -> str:
     """
     Genera un gráfico circular de los tamaños de archivo por tipo y lo devuelve como una cadena base64.
-    No se guarda ningún archivo de imagen en el disco.
+    No se guarda ningún archivo de imagen en el disco. Usa matplotlib, que solo se importa aquí:
+    la interfaz dibuja el gráfico con controles nativos (calcular_secciones_grafico) y esta función
+    queda para exportar una imagen en alta resolución.
     Args:
         tamanios_archivos (dict): Diccionario de extensiones de archivo y sus tamaños.
+        dpi (int): Resolución de la imagen.
     Returns:
         str: La cadena codificada en base64 de la imagen del gráfico (formato PNG), o una cadena vacía si no hay datos para graficar.
     """
     if not tamanios_archivos:
         logger.info("No hay tamaños de archivo para graficar. Devolviendo cadena base64 vacía.")
         return ""
+    return _memorizar_grafico("png", tamanios_archivos, lambda: _dibujar_grafico_matplotlib(tamanios_archivos, dpi), dpi)
+
+def _dibujar_grafico_matplotlib(tamanios_archivos: dict[str, float], dpi: int) -> str:
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import numpy as np
     
     extensiones = list(tamanios_archivos.keys())
     tamanios = list(tamanios_archivos.values())
 
     cmap_nombre = 'tab20c' if len(extensiones) > 20 else 'viridis' if len(extensiones) > 10 else 'Set3'
-    colores = plt.cm.get_cmap(cmap_nombre, len(extensiones))(np.arange(len(extensiones)))
+    colores = plt.get_cmap(cmap_nombre, len(extensiones))(np.arange(len(extensiones)))
     
     fig, ax = plt.subplots(facecolor='white')
     color_texto = 'black'
@@ -202,10 +1076,34 @@ def generar_grafico_resumen(tamanios_archivos: dict[str, float]) -> str:
     
     plt.tight_layout()
     buffer = io.BytesIO()
-    plt.savefig(buffer, format='png', transparent=True)
+    plt.savefig(buffer, format='png', transparent=True, dpi=dpi)
     buffer.seek(0)
     plt.close(fig)
     
     img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
     logger.info("Gráfico generado como cadena base64.")
-    return img_base64
\ No newline at end of file
+    return img_base64
+
+def exportar_grafico_resumen(tamanios_archivos: dict[str, float], ruta_salida: str, dpi: int = 300) -> bool:
+    """
+    Guarda el gráfico de resumen en un archivo: SVG si la ruta termina en .svg, o PNG en alta resolución
+    (con matplotlib) en otro caso.
+
+    Returns:
+        bool: True si se guardó el archivo.
+    """
+    if ruta_salida.lower().endswith('.svg'):
+        contenido = generar_svg_resumen(tamanios_archivos).encode('utf-8')
+    else:
+        contenido = base64.b64decode(generar_grafico_resumen(tamanios_archivos, dpi))
+    if not contenido:
+        logger.warning("No hay datos para exportar el gráfico de resumen.")
+        return False
+    try:
+        with open(ruta_salida, 'wb') as f:
+            f.write(contenido)
+    except OSError as e:
+        logger.error(f"No se pudo guardar el gráfico en {ruta_salida}: {e}")
+        return False
+    logger.info(f"Gráfico de resumen exportado a {ruta_salida}")
+    return True
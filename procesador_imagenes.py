@@ -2,9 +2,22 @@ from PIL import Image
 import os
 import logging
 
+from fragmentador_carpetas import carpetas_de_fragmentos, listar_archivos_carpeta
+
 logger = logging.getLogger(__name__)
 
-def redimensionar_imagenes(input_dir, output_dir, target_width=None, target_height=None, target_percentage=None):
+def _listar_nombres(input_dir, extensions, catalogo=None):
+    """
+    Archivos de `input_dir`, incluidos los de sus fragmentos si es una carpeta fragmentada, como rutas
+    relativas a ella: del catálogo compartido si se indica (solo los de `extensions`) o del disco.
+    """
+    if catalogo is None:
+        return listar_archivos_carpeta(input_dir)
+    raiz = os.path.abspath(input_dir)
+    return [os.path.relpath(entry.ruta, raiz) for carpeta in [input_dir, *carpetas_de_fragmentos(input_dir)]
+            for entry in catalogo.listar(carpeta, recursivo=False, extensiones=extensions)]
+
+def redimensionar_imagenes(input_dir, output_dir, target_width=None, target_height=None, target_percentage=None, catalogo=None):
     """
     Redimensiona todas las imágenes en `input_dir` y las guarda en `output_dir`.
     
@@ -14,6 +27,8 @@ def redimensionar_imagenes(input_dir, output_dir, target_width=None, target_heig
     - target_width (int): Ancho objetivo en píxeles.
     - target_height (int): Alto objetivo en píxeles.
     - target_percentage (float): Porcentaje de redimensionado (ej. 0.5 para 50%).
+    - catalogo (CatalogoArchivos): Opcional. Catálogo compartido del que se toman las imágenes y en el que
+      se anotan sus dimensiones y las imágenes generadas.
     
     Retorna:
     - int: El número de imágenes redimensionadas exitosamente.
@@ -22,14 +37,16 @@ def redimensionar_imagenes(input_dir, output_dir, target_width=None, target_heig
     resized_count = 0
     supported_exts = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff')
 
-    for filename in os.listdir(input_dir):
+    for filename in _listar_nombres(input_dir, supported_exts, catalogo):
         if filename.lower().endswith(supported_exts):
             input_path = os.path.join(input_dir, filename)
-            output_path = os.path.join(output_dir, filename)
+            output_path = os.path.join(output_dir, os.path.basename(filename))
 
             try:
                 with Image.open(input_path) as img:
                     new_width, new_height = img.width, img.height
+                    if catalogo is not None:
+                        catalogo.guardar_metadatos(input_path, dimensiones=img.size)
                     
                     if target_percentage:
                         new_width = int(img.width * target_percentage)
@@ -58,16 +75,20 @@ def redimensionar_imagenes(input_dir, output_dir, target_width=None, target_heig
                         resized_img = resized_img.convert("RGB") # JPEG does not support alpha channel
 
                     resized_img.save(output_path, format=save_format)
+                    if catalogo is not None:
+                        catalogo.registrar(output_path, (new_width, new_height))
                     logger.info(f"Redimensionado: {filename} -> {new_width}x{new_height}")
                     resized_count += 1
 
             except Exception as e:
                 logger.error(f"Error al procesar {filename} para redimensionar: {e}")
-                
+
+    if catalogo is not None:
+        catalogo.confirmar()
     return resized_count
 
 
-def convertir_imagenes_formato(input_dir, output_dir, target_format):
+def convertir_imagenes_formato(input_dir, output_dir, target_format, catalogo=None):
     """
     Convierte todas las imágenes soportadas en `input_dir` al `target_format`
     y las guarda en `output_dir`.
@@ -76,6 +97,8 @@ def convertir_imagenes_formato(input_dir, output_dir, target_format):
     - input_dir (str): Directorio de entrada con las imágenes.
     - output_dir (str): Directorio donde se guardarán las imágenes convertidas.
     - target_format (str): El formato de destino (ej. "png", "jpeg", "webp").
+    - catalogo (CatalogoArchivos): Opcional. Catálogo compartido del que se toman las imágenes y en el que
+      se anotan sus dimensiones y las imágenes generadas.
 
     Retorna:
     - int: El número de imágenes convertidas exitosamente.
@@ -84,12 +107,14 @@ def convertir_imagenes_formato(input_dir, output_dir, target_format):
     converted_count = 0
     supported_exts = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp') # Agrega aquí más si son necesarios
 
-    for filename in os.listdir(input_dir):
-        name, ext = os.path.splitext(filename)
+    for filename in _listar_nombres(input_dir, supported_exts, catalogo):
+        name, ext = os.path.splitext(os.path.basename(filename))
         if ext.lower() in supported_exts:
             filepath = os.path.join(input_dir, filename)
             try:
                 with Image.open(filepath) as img:
+                    if catalogo is not None:
+                        catalogo.guardar_metadatos(filepath, dimensiones=img.size)
                     save_format = target_format.upper()
                     out_name = f"{name}.{target_format.lower()}"
                     output_filepath = os.path.join(output_dir, out_name)
@@ -110,8 +135,12 @@ def convertir_imagenes_formato(input_dir, output_dir, target_format):
                             logger.warning(f"No se pudo verificar el modo RGBA original para {filename}: {e}")
 
                     img.save(output_filepath, format=save_format)
+                    if catalogo is not None:
+                        catalogo.registrar(output_filepath, img.size)
                     logger.info(f"Convertido {filename} a {target_format}")
                     converted_count += 1
             except Exception as ex:
                 logger.error(f"Error al convertir {filename}: {ex}")
+    if catalogo is not None:
+        catalogo.confirmar()
     return converted_count
\ No newline at end of file
@@ -1,9 +1,12 @@
 import os
 import logging
 
+from fragmentador_carpetas import carpetas_de_fragmentos, es_archivo_indice, listar_archivos_carpeta
+
 logger = logging.getLogger(__name__)
 
-def previsualizar_renombrado_archivos(directorio_origen: str, prefijo: str, sufijo: str, inicio_numerico: int):
+def previsualizar_renombrado_archivos(directorio_origen: str, prefijo: str, sufijo: str, inicio_numerico: int,
+                                      catalogo=None):
     """
     Genera una previsualización de cómo se renombrarían los archivos en un directorio.
 
@@ -12,6 +15,10 @@ def previsualizar_renombrado_archivos(directorio_origen: str, prefijo: str, sufi
         prefijo (str): El prefijo a añadir a los nombres de los archivos.
         sufijo (str): El sufijo a añadir a los nombres de los archivos.
         inicio_numerico (int): El número inicial para la secuencia numérica.
+        catalogo (CatalogoArchivos, optional): Si se indica, los archivos se toman del catálogo compartido.
+
+    Si la carpeta está fragmentada se incluyen los archivos de sus fragmentos; su nombre original
+    se muestra relativo a la carpeta ("fragmento/nombre").
 
     Returns:
         tuple[list[tuple[str, str]], list[str]]: Una tupla que contiene:
@@ -22,14 +29,21 @@ def previsualizar_renombrado_archivos(directorio_origen: str, prefijo: str, sufi
         logger.error(f"El directorio de origen no es válido: {directorio_origen}")
         return [], []
 
-    archivos_en_directorio = [f for f in os.listdir(directorio_origen) if os.path.isfile(os.path.join(directorio_origen, f))]
+    if catalogo is not None:
+        raiz = os.path.abspath(directorio_origen)
+        archivos_en_directorio = [os.path.relpath(entrada.ruta, raiz)
+                                  for carpeta in [directorio_origen, *carpetas_de_fragmentos(directorio_origen)]
+                                  for entrada in catalogo.listar(carpeta, recursivo=False)
+                                  if not es_archivo_indice(os.path.basename(entrada.ruta))]
+    else:
+        archivos_en_directorio = listar_archivos_carpeta(directorio_origen)
     archivos_en_directorio.sort() # Opcional: ordenar para una previsualización consistente
 
     previsualizaciones = []
     rutas_originales_completas = []
 
     for i, nombre_original in enumerate(archivos_en_directorio):
-        nombre_base, ext = os.path.splitext(nombre_original)
+        nombre_base, ext = os.path.splitext(os.path.basename(nombre_original))
         num_str = str(inicio_numerico + i)
         
         partes_nuevo_nombre_base = [parte for parte in [prefijo, nombre_base, num_str, sufijo] if parte]
@@ -43,24 +57,31 @@ def previsualizar_renombrado_archivos(directorio_origen: str, prefijo: str, sufi
     logger.info(f"Previsualización de renombrado generada para {len(archivos_en_directorio)} archivos en {directorio_origen}.")
     return previsualizaciones, rutas_originales_completas
 
-def realizar_renombrado_masivo(archivos_a_renombrar: list[tuple[str, str]]):
+def realizar_renombrado_masivo(archivos_a_renombrar: list[tuple[str, str]], catalogo=None):
     """
     Realiza el renombrado masivo de archivos basado en una lista de pares (ruta_original, nueva_ruta).
+    Si la carpeta de la nueva ruta no existe (un fragmento nuevo de una carpeta fragmentada), se crea.
 
     Args:
         archivos_a_renombrar (list[tuple[str, str]]): Lista de tuplas donde cada tupla
                                                        contiene (ruta_original_completa, nueva_ruta_completa).
+        catalogo (CatalogoArchivos, optional): Si se indica, los archivos renombrados se trasladan en el catálogo.
 
     Returns:
         int: El número de archivos renombrados exitosamente.
     """
     contador = 0
+    renombrados = []
     for original_path, new_path in archivos_a_renombrar:
         try:
             if original_path != new_path: # Evitar renombrar si el nombre es idéntico
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
                 os.rename(original_path, new_path)
                 logger.info(f"Renombrado '{os.path.basename(original_path)}' a '{os.path.basename(new_path)}'")
+                renombrados.append((original_path, new_path))
                 contador += 1
         except OSError as ex:
             logger.error(f"Error al renombrar {os.path.basename(original_path)} a {os.path.basename(new_path)}: {ex}")
+    if catalogo is not None and renombrados:
+        catalogo.registrar_movimientos(renombrados)
     return contador
\ No newline at end of file
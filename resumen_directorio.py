@@ -0,0 +1,235 @@
+import os
+import time
+import heapq
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Hilos para listar directorios en paralelo (limitado por E/S, no por CPU)
+HILOS_RESUMEN = min(16, (os.cpu_count() or 1) * 2)
+
+# Número de archivos más grandes que se conservan en el resumen
+MAX_ARCHIVOS_MAYORES = 10
+
+# Segundos mínimos entre resúmenes parciales al recorrer en modo continuo
+INTERVALO_RESUMEN_PARCIAL = 0.5
+
+# Máximo de rectángulos del mapa de uso de disco; el resto se agrupa en uno solo
+MAX_RECTANGULOS_TREEMAP = 40
+
+# En Windows DirEntry.stat() no hace llamadas al sistema pero DirEntry.inode() sí;
+# en POSIX es al revés, así que solo allí compensa buscar el inodo en los estados ya conocidos
+INODO_SIN_COSTE = os.name != 'nt'
+
+ResumenDirectorio = namedtuple(
+    "ResumenDirectorio",
+    ["bytes_por_extension", "archivos_por_extension", "mayores", "total_archivos", "total_bytes", "bytes_por_directorio"],
+    defaults=(None,)
+)
+ResumenDirectorio.__doc__ = """
+Resumen de un árbol de directorios.
+
+bytes_por_extension / archivos_por_extension: extensión (".pdf", "" si no tiene) -> bytes / número de archivos.
+mayores: lista de (bytes, ruta) de los archivos más grandes, de mayor a menor.
+bytes_por_directorio: directorio -> bytes de todo su subárbol (None si el resumen no lo incluye).
+"""
+
+def _resumir_directorio(ruta_directorio: str, estados_conocidos, max_mayores: int):
+    """Lista un único directorio. Devuelve (bytes, archivos, mayores, subdirectorios)."""
+    bytes_ext, archivos_ext, mayores, subdirectorios = {}, {}, [], []
+    try:
+        # Los inodos solo son únicos dentro de un dispositivo (puede haber puntos de montaje en el árbol)
+        dispositivo = os.stat(ruta_directorio).st_dev if estados_conocidos else None
+        with os.scandir(ruta_directorio) as entradas:
+            for entrada in entradas:
+                try:
+                    if entrada.is_dir(follow_symlinks=False):
+                        subdirectorios.append(entrada.path)
+                        continue
+                    if not entrada.is_file():
+                        continue
+                    conocido = estados_conocidos.get((dispositivo, entrada.inode())) if estados_conocidos else None
+                    tamanio = conocido[0] if conocido else entrada.stat().st_size
+                except OSError as e:
+                    logger.warning(f"No se pudo obtener el tamaño para {entrada.path}: {e}")
+                    continue
+                extension = os.path.splitext(entrada.name)[1].lower()
+                bytes_ext[extension] = bytes_ext.get(extension, 0) + tamanio
+                archivos_ext[extension] = archivos_ext.get(extension, 0) + 1
+                if len(mayores) < max_mayores:
+                    heapq.heappush(mayores, (tamanio, entrada.path))
+                elif mayores and tamanio > mayores[0][0]:
+                    heapq.heapreplace(mayores, (tamanio, entrada.path))
+    except OSError as e:
+        logger.warning(f"No se pudo leer el directorio {ruta_directorio}: {e}")
+    return bytes_ext, archivos_ext, mayores, subdirectorios
+
+def iterar_resumen_directorio(dir_origen: str, estados_conocidos: Optional[dict] = None,
+                              max_mayores: int = MAX_ARCHIVOS_MAYORES, max_hilos: int = HILOS_RESUMEN,
+                              intervalo: Optional[float] = INTERVALO_RESUMEN_PARCIAL):
+    """
+    Recorre un árbol con os.scandir en una sola pasada y va entregando resúmenes parciales.
+    Cada directorio es una tarea de un grupo de hilos, de modo que los subárboles grandes se reparten
+    entre todos los hilos. El tipo de cada entrada sale de la caché de DirEntry y solo se hace un
+    stat por archivo (ninguno si su tamaño ya se conoce).
+
+    Los archivos más grandes se guardan en un montículo de `max_mayores` elementos y el total de cada
+    directorio se suma a sus antecesores al terminar de listarlo: la memoria depende del número de
+    directorios, no del de archivos.
+
+    Args:
+        dir_origen (str): El directorio a resumir.
+        estados_conocidos (dict, optional): (st_dev, inodo) -> (tamaño, mtime_ns) de archivos cuyo tamaño ya se conoce
+                                            (p. ej. los que acaba de mover el organizador); no se vuelven a consultar.
+        max_mayores (int): Número de archivos más grandes a conservar.
+        max_hilos (int): Número máximo de directorios listados a la vez.
+        intervalo (float, optional): Segundos mínimos entre resúmenes parciales. None = solo el resumen final.
+    Yields:
+        ResumenDirectorio: Resúmenes (copias independientes) de lo recorrido hasta el momento; el último es el completo.
+    """
+    if not INODO_SIN_COSTE:
+        estados_conocidos = None
+    raiz = os.path.normpath(dir_origen)
+    bytes_ext, archivos_ext, mayores, bytes_dir = {}, {}, [], {}
+
+    def resumen_actual(copiar: bool) -> ResumenDirectorio:
+        return ResumenDirectorio(dict(bytes_ext) if copiar else bytes_ext, dict(archivos_ext) if copiar else archivos_ext,
+                                 sorted(mayores, reverse=True), sum(archivos_ext.values()), sum(bytes_ext.values()),
+                                 dict(bytes_dir) if copiar else bytes_dir)
+
+    ultimo_parcial = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_hilos) as ejecutor:
+        pendientes = {ejecutor.submit(_resumir_directorio, raiz, estados_conocidos, max_mayores): raiz}
+        try:
+            while pendientes:
+                terminados, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    directorio = pendientes.pop(futuro)
+                    bytes_parcial, archivos_parcial, mayores_parcial, subdirectorios = futuro.result()
+                    for extension, tamanio in bytes_parcial.items():
+                        bytes_ext[extension] = bytes_ext.get(extension, 0) + tamanio
+                        archivos_ext[extension] = archivos_ext.get(extension, 0) + archivos_parcial[extension]
+                    for elemento in mayores_parcial:
+                        if len(mayores) < max_mayores:
+                            heapq.heappush(mayores, elemento)
+                        elif elemento[0] > mayores[0][0]:
+                            heapq.heapreplace(mayores, elemento)
+                    # El total del directorio se acumula en él y en todos sus antecesores hasta la raíz
+                    bytes_directos = sum(bytes_parcial.values())
+                    bytes_dir.setdefault(directorio, 0)
+                    ruta = directorio
+                    while bytes_directos:
+                        bytes_dir[ruta] = bytes_dir.get(ruta, 0) + bytes_directos
+                        padre = os.path.dirname(ruta)
+                        if ruta == raiz or padre == ruta:
+                            break
+                        ruta = padre
+                    for subdirectorio in subdirectorios:
+                        pendientes[ejecutor.submit(_resumir_directorio, subdirectorio, estados_conocidos, max_mayores)] = subdirectorio
+                if intervalo is not None and pendientes and time.monotonic() - ultimo_parcial >= intervalo:
+                    yield resumen_actual(copiar=True)
+                    ultimo_parcial = time.monotonic()
+        finally:
+            # Si se deja de consumir el generador no se siguen listando directorios
+            for futuro in pendientes:
+                futuro.cancel()
+    yield resumen_actual(copiar=False)
+
+def calcular_resumen_directorio(dir_origen: str, estados_conocidos: Optional[dict] = None,
+                                max_mayores: int = MAX_ARCHIVOS_MAYORES,
+                                max_hilos: int = HILOS_RESUMEN) -> ResumenDirectorio:
+    """
+    Recorre un árbol en una sola pasada y resume tamaños por extensión y por directorio
+    (ver iterar_resumen_directorio).
+
+    Args:
+        dir_origen (str): El directorio a resumir.
+        estados_conocidos (dict, optional): (st_dev, inodo) -> (tamaño, mtime_ns) de archivos cuyo tamaño ya se conoce.
+        max_mayores (int): Número de archivos más grandes a conservar.
+        max_hilos (int): Número máximo de directorios listados a la vez.
+    Returns:
+        ResumenDirectorio: Bytes y archivos por extensión, archivos mayores, totales y bytes por directorio.
+    """
+    resumen = None
+    for resumen in iterar_resumen_directorio(dir_origen, estados_conocidos, max_mayores, max_hilos, intervalo=None):
+        pass
+    return resumen
+
+def hijos_directorio(bytes_por_directorio: dict[str, int], directorio: str) -> list[tuple[str, int]]:
+    """
+    Reparte el total de un directorio entre sus subdirectorios directos y sus propios archivos.
+
+    Args:
+        bytes_por_directorio (dict): El campo bytes_por_directorio de un ResumenDirectorio.
+        directorio (str): El directorio a desglosar.
+    Returns:
+        list[tuple[str, int]]: (ruta, bytes) de mayor a menor. Los archivos sueltos del propio directorio
+                               aparecen con la ruta del directorio.
+    """
+    directorio = os.path.normpath(directorio)
+    hijos = [(ruta, tamanio) for ruta, tamanio in bytes_por_directorio.items()
+             if tamanio > 0 and ruta != directorio and os.path.dirname(ruta) == directorio]
+    propios = bytes_por_directorio.get(directorio, 0) - sum(tamanio for _, tamanio in hijos)
+    if propios > 0:
+        hijos.append((directorio, propios))
+    hijos.sort(key=lambda hijo: hijo[1], reverse=True)
+    return hijos
+
+def _peor_proporcion(fila: list[float], lado: float) -> float:
+    suma = sum(fila)
+    return max(lado * lado * max(fila) / (suma * suma), suma * suma / (lado * lado * min(fila)))
+
+def calcular_treemap(elementos: list[tuple[str, int]], ancho: float, alto: float,
+                     max_rectangulos: int = MAX_RECTANGULOS_TREEMAP) -> list[tuple[Optional[str], int, float, float, float, float]]:
+    """
+    Distribuye los elementos en un rectángulo de ancho x alto con el algoritmo "squarified"
+    (Bruls, Huizing y van Wijk): el área de cada uno es proporcional a su tamaño y los rectángulos
+    quedan lo más cuadrados posible.
+
+    Args:
+        elementos (list): (clave, tamaño) de mayor a menor (p. ej. el resultado de hijos_directorio).
+        ancho, alto (float): Dimensiones del área de dibujo.
+        max_rectangulos (int): A partir de este número, los elementos restantes se agrupan con clave None.
+    Returns:
+        list: (clave, tamaño, x, y, ancho, alto) de cada rectángulo.
+    """
+    elementos = [(clave, tamanio) for clave, tamanio in elementos if tamanio > 0]
+    if len(elementos) > max_rectangulos:
+        resto = sum(tamanio for _, tamanio in elementos[max_rectangulos - 1:])
+        elementos = elementos[:max_rectangulos - 1] + [(None, resto)]
+    total = sum(tamanio for _, tamanio in elementos)
+    if not total or ancho <= 0 or alto <= 0:
+        return []
+    escala = ancho * alto / total
+    rectangulos = []
+    x, y, w, h = 0.0, 0.0, float(ancho), float(alto)
+    indice = 0
+    while indice < len(elementos):
+        lado = min(w, h)
+        fila = [elementos[indice]]
+        areas = [elementos[indice][1] * escala]
+        indice += 1
+        while indice < len(elementos):
+            area = elementos[indice][1] * escala
+            if _peor_proporcion(areas + [area], lado) > _peor_proporcion(areas, lado):
+                break
+            fila.append(elementos[indice])
+            areas.append(area)
+            indice += 1
+        grosor = sum(areas) / lado
+        posicion = 0.0
+        for (clave, tamanio), area in zip(fila, areas):
+            largo = area / grosor
+            if w >= h:
+                rectangulos.append((clave, tamanio, x, y + posicion, grosor, largo))
+            else:
+                rectangulos.append((clave, tamanio, x + posicion, y, largo, grosor))
+            posicion += largo
+        if w >= h:
+            x, w = x + grosor, w - grosor
+        else:
+            y, h = y + grosor, h - grosor
+    return rectangulos
@@ -0,0 +1,306 @@
+import os
+import sys
+import time
+import stat
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import argparse
+import threading
+
+from organizador_archivos import (
+    ReglasOrganizacion,
+    compilar_reglas,
+    obtener_carpetas_configuradas,
+    organizar_lote_archivos,
+)
+from firmas_archivos import DetectorFirmas
+from fechas_archivos import LectorFechas
+
+logger = logging.getLogger(__name__)
+
+# Segundos sin actividad para dar por terminado un archivo del que no se ha visto el cierre
+ESPERA_ESTABILIDAD = 2.0
+# Ventana para agrupar en un mismo lote los archivos que llegan casi a la vez
+VENTANA_LOTE = 0.05
+# Intervalo del sondeo cuando inotify no está disponible
+INTERVALO_SONDEO = 1.0
+
+# Descargas a medio escribir de navegadores y gestores de descargas
+EXTENSIONES_TEMPORALES = ('.part', '.partial', '.crdownload', '.download', '.opdownload', '.tmp', '.!qb', '.aria2')
+
+# Constantes de <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_CABECERA_EVENTO = struct.Struct('iIII')
+
+def es_archivo_temporal(nombre_archivo: str) -> bool:
+    """Archivos ocultos o descargas en curso, que no deben organizarse."""
+    return nombre_archivo.startswith('.') or nombre_archivo.lower().endswith(EXTENSIONES_TEMPORALES)
+
+class _Inotify:
+    """Envoltorio mínimo de inotify(7) mediante ctypes para vigilar un único directorio."""
+    def __init__(self, directorio: str, mascara: int):
+        ruta_libc = ctypes.util.find_library('c')
+        libc = ctypes.CDLL(ruta_libc, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            numero = ctypes.get_errno()
+            raise OSError(numero, os.strerror(numero))
+        if libc.inotify_add_watch(self._fd, os.fsencode(directorio), mascara) < 0:
+            numero = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(numero, os.strerror(numero), directorio)
+
+    def leer(self, tiempo_espera: float) -> list[tuple[int, str]]:
+        """Espera hasta `tiempo_espera` segundos y devuelve los eventos (máscara, nombre) disponibles."""
+        listos, _, _ = select.select([self._fd], [], [], max(0.0, tiempo_espera))
+        if not listos:
+            return []
+        try:
+            datos = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        eventos = []
+        desplazamiento = 0
+        while desplazamiento + _CABECERA_EVENTO.size <= len(datos):
+            _, mascara, _, longitud = _CABECERA_EVENTO.unpack_from(datos, desplazamiento)
+            inicio_nombre = desplazamiento + _CABECERA_EVENTO.size
+            nombre = datos[inicio_nombre:inicio_nombre + longitud].split(b'\0', 1)[0]
+            eventos.append((mascara, os.fsdecode(nombre)))
+            desplazamiento = inicio_nombre + longitud
+        return eventos
+
+    def cerrar(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+class VigilanteCarpeta:
+    """
+    Organiza de forma continua los archivos que llegan al primer nivel de un directorio.
+
+    Usa inotify (Linux) si está disponible y, si no, sondea el directorio cada `intervalo_sondeo` segundos.
+    Un archivo se organiza cuando termina de escribirse: al recibir IN_CLOSE_WRITE o IN_MOVED_TO
+    (tras una ventana corta para agrupar lotes) o, sin esos eventos, cuando su tamaño y fecha no
+    cambian durante `espera` segundos. No se vuelve a recorrer el directorio salvo al arrancar
+    o si la cola de eventos del núcleo se desborda.
+    """
+    def __init__(self, dir_origen: str, reglas: ReglasOrganizacion, al_organizar=None,
+                 espera: float = ESPERA_ESTABILIDAD, ventana_lote: float = VENTANA_LOTE,
+                 intervalo_sondeo: float = INTERVALO_SONDEO, usar_inotify: bool = True,
+                 organizar_existentes: bool = True):
+        """
+        Args:
+            dir_origen (str): El directorio a vigilar.
+            reglas (ReglasOrganizacion): La configuración compilada con compilar_reglas.
+            al_organizar (callable, optional): Callback llamado con la lista de movimientos
+                                               (ruta_origen, ruta_destino) de cada lote organizado.
+            espera (float): Segundos sin cambios para dar por terminado un archivo sin evento de cierre.
+            ventana_lote (float): Segundos que se esperan tras un cierre para agrupar los archivos en un lote.
+            intervalo_sondeo (float): Segundos entre sondeos si no hay inotify.
+            usar_inotify (bool): Si es False se usa siempre el sondeo.
+            organizar_existentes (bool): Si es True, al arrancar se organizan también los archivos que ya había.
+        """
+        self.dir_origen = os.path.abspath(dir_origen)
+        self.reglas = reglas
+        self.al_organizar = al_organizar
+        self.espera = espera
+        self.ventana_lote = ventana_lote
+        self.intervalo_sondeo = intervalo_sondeo
+        self.usar_inotify = usar_inotify
+        self.organizar_existentes = organizar_existentes
+        self.metodo = None
+        self.total_organizados = 0
+        self._detener = threading.Event()
+        self._hilo = None
+        # nombre -> (instante a partir del cual puede organizarse, firma (tamaño, mtime) o None)
+        self._pendientes: dict[str, tuple[float, tuple]] = {}
+
+    @property
+    def en_ejecucion(self) -> bool:
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def iniciar(self):
+        """Arranca la vigilancia en un hilo en segundo plano."""
+        if self.en_ejecucion:
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self.ejecutar, name="VigilanteCarpeta", daemon=True)
+        self._hilo.start()
+
+    def detener(self, tiempo_espera: float = None):
+        """Pide la parada y espera a que termine el lote en curso."""
+        self._detener.set()
+        if self._hilo is not None and self._hilo is not threading.current_thread():
+            self._hilo.join(tiempo_espera)
+
+    def _marcar(self, nombre_archivo: str, retraso: float, firma=None):
+        if not es_archivo_temporal(nombre_archivo):
+            self._pendientes[nombre_archivo] = (time.monotonic() + retraso, firma)
+
+    def _marcar_existentes(self):
+        """Añade a pendientes los archivos del primer nivel (al arrancar o tras un desbordamiento)."""
+        try:
+            with os.scandir(self.dir_origen) as entradas:
+                for entrada in entradas:
+                    if entrada.is_file(follow_symlinks=False):
+                        estado = entrada.stat(follow_symlinks=False)
+                        self._marcar(entrada.name, self.espera, (estado.st_size, estado.st_mtime_ns))
+        except OSError as e:
+            logger.warning(f"No se pudo leer el directorio vigilado {self.dir_origen}: {e}")
+
+    def _recoger_listos(self, ahora: float) -> list[str]:
+        """Devuelve las rutas pendientes cuyo plazo ha vencido y que ya no se están escribiendo."""
+        listos = []
+        for nombre_archivo, (instante, firma) in list(self._pendientes.items()):
+            if instante > ahora:
+                continue
+            ruta_archivo = os.path.join(self.dir_origen, nombre_archivo)
+            try:
+                estado = os.stat(ruta_archivo, follow_symlinks=False)
+            except FileNotFoundError:
+                del self._pendientes[nombre_archivo]
+                continue
+            except OSError as e:
+                logger.warning(f"No se pudo consultar {ruta_archivo}: {e}")
+                del self._pendientes[nombre_archivo]
+                continue
+            if not stat.S_ISREG(estado.st_mode):
+                del self._pendientes[nombre_archivo]
+                continue
+            firma_actual = (estado.st_size, estado.st_mtime_ns)
+            if firma is not None and firma != firma_actual:
+                # Sigue cambiando: se vuelve a comprobar tras otra espera
+                self._pendientes[nombre_archivo] = (ahora + self.espera, firma_actual)
+                continue
+            del self._pendientes[nombre_archivo]
+            listos.append(ruta_archivo)
+        return listos
+
+    def _organizar(self, rutas_archivos: list[str]):
+        try:
+            movidos = organizar_lote_archivos(self.dir_origen, rutas_archivos, self.reglas)
+        except Exception as e:
+            logger.error(f"Error al organizar un lote en {self.dir_origen}: {e}")
+            return
+        self.total_organizados += len(movidos)
+        if movidos and self.al_organizar:
+            self.al_organizar(movidos)
+
+    def _siguiente_plazo(self, ahora: float, maximo: float) -> float:
+        if not self._pendientes:
+            return maximo
+        return min(maximo, max(0.0, min(instante for instante, _ in self._pendientes.values()) - ahora))
+
+    def _bucle_inotify(self, notificador: _Inotify):
+        while not self._detener.is_set():
+            eventos = notificador.leer(self._siguiente_plazo(time.monotonic(), 0.5))
+            for mascara, nombre_archivo in eventos:
+                if mascara & _IN_Q_OVERFLOW:
+                    logger.warning("Cola de inotify desbordada; se revisa el directorio completo.")
+                    self._marcar_existentes()
+                elif mascara & (_IN_DELETE_SELF | _IN_MOVE_SELF | _IN_IGNORED):
+                    logger.warning(f"El directorio vigilado {self.dir_origen} ya no está disponible.")
+                    self._detener.set()
+                elif not nombre_archivo or mascara & _IN_ISDIR:
+                    continue
+                elif mascara & (_IN_CLOSE_WRITE | _IN_MOVED_TO):
+                    self._marcar(nombre_archivo, self.ventana_lote)
+                else:
+                    # Creado o modificado sin cerrar: se espera a que deje de cambiar
+                    self._marcar(nombre_archivo, self.espera, ())
+            listos = self._recoger_listos(time.monotonic())
+            if listos:
+                self._organizar(listos)
+
+    def _bucle_sondeo(self):
+        vistos = {}
+        while not self._detener.is_set():
+            ahora = time.monotonic()
+            actuales = {}
+            try:
+                with os.scandir(self.dir_origen) as entradas:
+                    for entrada in entradas:
+                        if es_archivo_temporal(entrada.name) or not entrada.is_file(follow_symlinks=False):
+                            continue
+                        estado = entrada.stat(follow_symlinks=False)
+                        actuales[entrada.name] = (estado.st_size, estado.st_mtime_ns)
+            except OSError as e:
+                logger.warning(f"No se pudo sondear {self.dir_origen}: {e}")
+            for nombre_archivo, firma in actuales.items():
+                if vistos.get(nombre_archivo) != firma and nombre_archivo not in self._pendientes:
+                    self._pendientes[nombre_archivo] = (ahora + self.espera, firma)
+            vistos = actuales
+            listos = self._recoger_listos(ahora)
+            if listos:
+                self._organizar(listos)
+            self._detener.wait(self.intervalo_sondeo)
+
+    def ejecutar(self):
+        """Bucle principal de la vigilancia (bloqueante hasta llamar a detener)."""
+        notificador = None
+        if self.usar_inotify and sys.platform.startswith('linux'):
+            try:
+                notificador = _Inotify(self.dir_origen, _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_MODIFY)
+            except (OSError, AttributeError) as e:
+                logger.warning(f"inotify no disponible ({e}); se usará sondeo.")
+        self.metodo = "inotify" if notificador else "sondeo"
+        logger.info(f"Vigilando {self.dir_origen} mediante {self.metodo}")
+        if self.organizar_existentes:
+            self._marcar_existentes()
+        try:
+            if notificador:
+                self._bucle_inotify(notificador)
+            else:
+                self._bucle_sondeo()
+        finally:
+            if notificador:
+                notificador.cerrar()
+            logger.info(f"Vigilancia de {self.dir_origen} detenida ({self.total_organizados} archivos organizados).")
+
+def main():
+    """Modo sin interfaz: python vigilante_carpetas.py <directorio>."""
+    analizador = argparse.ArgumentParser(description="Organiza de forma continua los archivos que llegan a una carpeta.")
+    analizador.add_argument("directorio", help="Carpeta a vigilar")
+    analizador.add_argument("--espera", type=float, default=ESPERA_ESTABILIDAD,
+                            help="Segundos sin cambios para considerar terminado un archivo")
+    analizador.add_argument("--sondeo", action="store_true", help="Usar sondeo en lugar de inotify")
+    analizador.add_argument("--solo-nuevos", action="store_true", help="No organizar los archivos que ya existen al arrancar")
+    analizador.add_argument("--detectar-contenido", action="store_true",
+                            help="Clasificar por sus primeros bytes los archivos sin extensión conocida")
+    analizador.add_argument("--por-fecha", action="store_true", help="Colocar los archivos en Categoría/AAAA/MM")
+    argumentos = analizador.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not os.path.isdir(argumentos.directorio):
+        logger.error(f"El directorio especificado no existe o no es válido: {argumentos.directorio}")
+        return 1
+    carpetas = obtener_carpetas_configuradas([], {'Music': 'Música', 'Photos': 'Fotos', 'Docs': 'Documentos', 'Videos': 'Videos'})
+    vigilante = VigilanteCarpeta(
+        argumentos.directorio,
+        compilar_reglas(carpetas, detector=DetectorFirmas() if argumentos.detectar_contenido else None,
+                        fechas=LectorFechas() if argumentos.por_fecha else None),
+        espera=argumentos.espera,
+        usar_inotify=not argumentos.sondeo,
+        organizar_existentes=not argumentos.solo_nuevos
+    )
+    try:
+        vigilante.ejecutar()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())